@@ -0,0 +1,242 @@
+from collections import deque
+from numpy import arange, argsort, asarray, bincount, concatenate, cumsum
+from numpy import flatnonzero, ndarray, repeat, unique, zeros
+from pandas import DataFrame, Index, concat
+
+from typing import Deque, List, NamedTuple, Tuple, Union
+
+
+class Adjacency(NamedTuple):
+    """
+    Integer-indexed view of the bait-prey table
+
+    Proteins are numbered by their position in `proteins`. Edge rows are
+    positions in the table the index was built from, grouped per protein in
+    CSR form: the rows of protein `i` are `rows[offsets[i]:offsets[i + 1]]`.
+    """
+    proteins: Index  # protein name --> protein id
+    bait_ids: ndarray  # row --> bait protein id
+    prey_ids: ndarray  # row --> prey protein id
+    bait_offsets: ndarray  # CSR offsets of rows where the protein is the bait
+    bait_rows: ndarray
+    incident_offsets: ndarray  # CSR offsets of rows touching the protein
+    incident_rows: ndarray
+
+
+def csr_from_ids(ids: ndarray,
+                 rows: ndarray,
+                 num_ids: int) -> Tuple[ndarray, ndarray]:
+    """
+    Groups `rows` by `ids`, returning CSR offsets and the grouped rows
+    """
+    order = argsort(ids, kind="stable")  # ndarray
+    counts = bincount(ids, minlength=num_ids)  # ndarray
+    offsets = concatenate([[0], cumsum(counts)])  # ndarray
+    return offsets, rows[order]
+
+
+def build_adjacency(df: DataFrame) -> Adjacency:
+    """
+    Numbers every bait and prey and indexes the rows each one appears in
+    """
+    baits = df["Bait"].astype(object)  # Series
+    preys = df["Prey"].astype(object)  # Series
+    proteins = Index(concat([baits, preys]).dropna().unique())  # Index
+    num_proteins = len(proteins)  # int
+
+    bait_ids = proteins.get_indexer(baits)  # ndarray
+    prey_ids = proteins.get_indexer(preys)  # ndarray
+    rows = arange(df.shape[0])  # ndarray
+
+    # Rows with a missing bait or prey can't be reached from either side
+    has_bait = bait_ids >= 0  # ndarray
+    has_prey = prey_ids >= 0  # ndarray
+
+    bait_offsets, bait_rows = csr_from_ids(bait_ids[has_bait],
+                                           rows[has_bait],
+                                           num_proteins)
+    incident_offsets, incident_rows = csr_from_ids(
+        concatenate([bait_ids[has_bait], prey_ids[has_prey]]),
+        concatenate([rows[has_bait], rows[has_prey]]),
+        num_proteins
+    )
+
+    return Adjacency(proteins=proteins,
+                     bait_ids=bait_ids,
+                     prey_ids=prey_ids,
+                     bait_offsets=bait_offsets,
+                     bait_rows=bait_rows,
+                     incident_offsets=incident_offsets,
+                     incident_rows=incident_rows)
+
+
+def gather_rows(offsets: ndarray, rows: ndarray, ids: ndarray) -> ndarray:
+    """
+    Concatenates the CSR row slices of every id in `ids` without a loop
+    """
+    starts = offsets[ids]  # ndarray
+    lengths = offsets[ids + 1] - starts  # ndarray
+    slice_starts = cumsum(lengths) - lengths  # ndarray
+    positions = arange(lengths.sum()) + repeat(starts - slice_starts, lengths)
+    return rows[positions]
+
+
+def protein_ids(adjacency: Adjacency, proteins: List[str]) -> ndarray:
+    """
+    Converts protein names to ids, dropping names that aren't in the table
+    """
+    ids = adjacency.proteins.get_indexer(proteins)  # ndarray
+    return unique(ids[ids >= 0])
+
+
+def expand_neighborhood(adjacency: Adjacency,
+                        proteins: List[str],
+                        num_neighbors: int) -> ndarray:
+    """
+    Returns sorted positions of rows within `num_neighbors` hops of `proteins`
+
+    Rows start as those with a bait in `proteins`. Each hop then adds every
+    row that touches a prey of the previous hop. Proteins that have already
+    been expanded are skipped, since their rows and preys are already
+    included.
+    """
+    num_rows = adjacency.bait_ids.shape[0]  # int
+    included = zeros(num_rows, dtype=bool)  # ndarray
+    expanded = zeros(len(adjacency.proteins), dtype=bool)  # ndarray
+
+    rows = gather_rows(adjacency.bait_offsets,
+                       adjacency.bait_rows,
+                       protein_ids(adjacency, proteins))  # ndarray
+    included[rows] = True
+    frontier = adjacency.prey_ids[rows]  # ndarray
+
+    for _ in range(num_neighbors):
+        frontier = unique(frontier[frontier >= 0])
+        frontier = frontier[~expanded[frontier]]
+        if frontier.shape[0] == 0:
+            break
+
+        expanded[frontier] = True
+        rows = gather_rows(adjacency.incident_offsets,
+                           adjacency.incident_rows,
+                           frontier)
+        included[rows] = True
+        frontier = adjacency.prey_ids[rows]
+
+    return flatnonzero(included)
+
+
+def estimate_neighborhood_rows(adjacency: Adjacency,
+                               proteins: List[str],
+                               num_neighbors: int) -> int:
+    """
+    Rough number of rows `expand_neighborhood` would return, without
+    expanding
+
+    Starts from the rows where `proteins` are the bait and multiplies by the
+    mean number of rows per protein for each hop, capped at the table size.
+    """
+    num_rows = adjacency.bait_ids.shape[0]  # int
+    ids = protein_ids(adjacency, proteins)  # ndarray
+    rows = float((adjacency.bait_offsets[ids + 1] - adjacency.bait_offsets[ids]).sum())
+    mean_rows = adjacency.incident_rows.shape[0] / max(len(adjacency.proteins), 1)
+
+    for _ in range(num_neighbors):
+        rows = min(rows * mean_rows, num_rows)
+
+    return int(min(rows, num_rows))
+
+
+def traverse(adjacency: Adjacency,
+             proteins: List[str],
+             max_depth: int,
+             order: str = "dfs",
+             max_nodes: Union[int, None] = None) -> ndarray:
+    """
+    Walks bait --> prey edges from `proteins` without recursion
+
+    Every protein reached at depth <= `max_depth` contributes the rows where
+    it is the bait, and the preys of those rows are visited at depth + 1.
+    Row positions are returned in the order they are first reached.
+
+    With order="dfs" the walk matches the original recursive search: a
+    protein is only expanded the first time it is reached, so the depth it
+    gets depends on the order of the rows. With order="bfs" every protein is
+    expanded at its shortest distance from `proteins`. `max_nodes` caps the
+    number of proteins whose rows are expanded.
+    """
+    if order not in ("bfs", "dfs"):
+        message = "Supported traversal orders: bfs, dfs"
+        raise Exception(message)
+
+    num_rows = adjacency.bait_ids.shape[0]  # int
+    offsets = adjacency.bait_offsets  # ndarray
+    bait_rows = adjacency.bait_rows  # ndarray
+    prey_ids = adjacency.prey_ids  # ndarray
+
+    visited = zeros(len(adjacency.proteins), dtype=bool)  # ndarray
+    recorded = zeros(num_rows, dtype=bool)  # ndarray
+    rows: List[int] = []
+    budget = max_nodes if max_nodes is not None else len(adjacency.proteins)
+
+    start_ids = adjacency.proteins.get_indexer(proteins)  # ndarray
+    start_ids = start_ids[start_ids >= 0]
+
+    if order == "bfs":
+        queue: Deque[Tuple[int, int]] = deque()
+        for protein_id in start_ids:
+            if not visited[protein_id]:
+                visited[protein_id] = True
+                queue.append((protein_id, 0))
+
+        while queue and budget > 0:
+            protein_id, depth = queue.popleft()
+            if depth > max_depth:
+                continue
+
+            budget -= 1
+            for row in bait_rows[offsets[protein_id]:offsets[protein_id + 1]]:
+                if not recorded[row]:
+                    recorded[row] = True
+                    rows.append(row)
+
+                neighbor = prey_ids[row]  # int
+                if neighbor >= 0 and not visited[neighbor]:
+                    visited[neighbor] = True
+                    queue.append((neighbor, depth + 1))
+    else:
+        # Each stack frame is [protein id, depth, next row, end row], the
+        # state of one call of the original recursive search
+        for protein_id in start_ids:
+            if budget <= 0 or max_depth < 0:
+                break
+
+            visited[protein_id] = True
+            stack: List[List[int]] = [[protein_id, 0,
+                                       offsets[protein_id],
+                                       offsets[protein_id + 1]]]
+            budget -= 1
+
+            while stack:
+                frame = stack[-1]  # List[int]
+                if frame[2] >= frame[3]:
+                    stack.pop()
+                    continue
+
+                row = bait_rows[frame[2]]  # int
+                frame[2] += 1
+                if not recorded[row]:
+                    recorded[row] = True
+                    rows.append(row)
+
+                neighbor = prey_ids[row]  # int
+                if neighbor >= 0 and not visited[neighbor]:
+                    visited[neighbor] = True
+                    depth = frame[1] + 1  # int
+                    if depth <= max_depth and budget > 0:
+                        budget -= 1
+                        stack.append([neighbor, depth,
+                                      offsets[neighbor],
+                                      offsets[neighbor + 1]])
+
+    return asarray(rows, dtype=int)
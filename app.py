@@ -1,41 +1,59 @@
+from concurrent.futures import Future
+from functools import partial
+from logging import getLogger
 from os.path import dirname, join
-from tqdm import tqdm
+from threading import Lock
+from time import perf_counter
 
-# TODO: Only import functions that are used from networkx
-import networkx as nx
-from pandas import DataFrame, read_csv
+from pandas import DataFrame, Index
 
-from clustering import create_cluster_graph
+from clustering import colored_subgraph, create_cluster_graph, format_sweep
+from clustering import submit_cluster_one, sweep_resolutions
+from compact import CompactGraph, compact_graph
+from edges import edge_coordinates, get_edges
+from layout import LAYOUT_ENGINES, cached_layout, global_layout, progressive_layout
+from layout import refine_executor, refine_layout, spring_layout
+from pipeline import Cancelled, Pipeline, Stage
+from payload import category_codes, layout_positions, lookup_transform, segment_data
+from scheduler import scheduler
 
 from bokeh.io import curdoc
 from bokeh.layouts import column, row
 from bokeh.models import Div, PreText, ColumnDataSource
-from bokeh.models import Legend, LegendItem, LabelSet
-from bokeh.models import CustomJS
+from bokeh.models import Legend, LegendItem
+from bokeh.models import CDSView, CustomJS, CustomJSFilter
 from bokeh.plotting import figure
+from bokeh.transform import transform
 
-from buttons import create_interactome_button, download_button
-from buttons import dataset_checkbox_button, interaction_support_checkbox_button
-import controls
-from colors import EdgeColors, GRAY, PPI_SUPPORT, LifecycleColorsDict
+from buttons import create_buttons
+from controls import all_controls, create_controls
+from colors import EDGE_DASH_PATTERNS, EDGE_PALETTE, EdgeColors, GRAY, PPI_SUPPORT, LifecycleColorsDict
 from data import subset_by_protein, subset_by_edge_type, subset_by_node_type
-from data import remap_df, determine_node_coloring, InteractionSupport
+from data import determine_node_coloring, coloring_dict, InteractionSupport, NodeColoring
+from data import add_edge_attributes, filter_cache, filter_state, FilterState
 
-from numpy import ndarray
+from statistics import GraphStatistics, compute_graph_statistics, format_graph_statistics
+from statistics import publish_statistics, statistics_json
+from store import get_adjacency, get_annotations, get_interactome
+from adjacency import estimate_neighborhood_rows
 
-from statistics import get_graph_statistics
+from numpy import asarray, empty, float32, full, int32, mean, ndarray, uint8, zeros
 
-from typing import List, Tuple, Dict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Tuple, Union
 
 from pdb import set_trace
 
-# Type aliases for readability
-Edges = Tuple[List[List[float]], List[List[float]]]
-EdgeStyles = List[List[int]]
-
 # TODO: Turn type comments into mypy type annotations
 
+# Failures on worker threads are logged with their traceback, besides being
+# shown in the session's status line
+log = getLogger(__name__)
+
 # GLOBAL
+# Widgets belong to this session's document, so every session makes its own
+buttons = create_buttons()  # Buttons
+controls = create_controls()  # Controls
+
 TOOLTIPS = [
     ("", "@node_category{safe}")
 ]
@@ -47,56 +65,82 @@ graph_viewer = figure(
     tooltips=TOOLTIPS
 )
 
-# Create Column Data Source that will be used by the plot
-empty_edges_dict: Dict[str, List[str]] = dict(xs=[], ys=[],
-                                              line_dash=[], line_color=[])
+# Create Column Data Source that will be used by the plot. Edge colors and
+# dash patterns, and node colors, are codes resolved in the browser.
+empty_edges_dict: Dict[str, List] = dict(x0=[], y0=[], x1=[], y1=[],
+                                         dash=[], color=[])
 source_edges = ColumnDataSource(empty_edges_dict)
-ppi_edges = ColumnDataSource(dict(xs=[], ys=[], line_dash=[]))
+ppi_edges = ColumnDataSource(dict(x0=[], y0=[], x1=[], y1=[]))
 empty_nodes_dict: Dict[str, List] = dict(xs=[], ys=[], color=[], name=[],
                                          node_size=[], label=[])
 source_nodes = ColumnDataSource(empty_nodes_dict)
+node_color_transform = lookup_transform([])  # Palette is sent with the nodes
+
+# Applies the source and type toggles in the browser when the edges carry
+# node indices, which they only do when filtering there (see filter.js)
+client_filter = CustomJSFilter(
+    args=dict(edges=source_edges,
+              nodes=source_nodes,
+              datasets=buttons.dataset_checkbox_button,
+              interaction_support=buttons.interaction_support_checkbox_button,
+              interaction_types=buttons.interaction_type_checkbox_button),
+    code=open(join(dirname(__file__), "filter.js")).read()
+)
 
-graph_viewer.multi_line(
-    'xs',
-    'ys',
-    line_color='line_color',
-    line_dash='line_dash',
+graph_viewer.segment(
+    'x0',
+    'y0',
+    'x1',
+    'y1',
+    line_color=transform('color', lookup_transform(EDGE_PALETTE)),
+    line_dash=transform('dash', lookup_transform(EDGE_DASH_PATTERNS)),
     source=source_edges,
+    view=CDSView(filter=client_filter),
     alpha=0.8,
-    width=1
+    line_width=1
 )
 
-graph_viewer.multi_line(
-    'xs',
-    'ys',
+graph_viewer.segment(
+    'x0',
+    'y0',
+    'x1',
+    'y1',
     line_color=PPI_SUPPORT,
-    line_dash='line_dash',
     source=ppi_edges,
+    view=CDSView(filter=client_filter),
     alpha=0.8,
-    width=1
+    line_width=1
 )
 
 scatter = graph_viewer.scatter(
     'xs',
     'ys',
-    fill_color='color',
+    fill_color=transform('color', node_color_transform),
     line_color='black',
     size='node_size',
-    source=source_nodes
+    source=source_nodes,
+    view=CDSView(filter=client_filter)
 )
 
-graph_viewer.add_layout(
-    LabelSet(
-        x='xs',
-        y='ys',
-        text='label',
-        source=source_nodes,
-        background_fill_color='white',
-        text_font_size='8px',
-        background_fill_alpha=.7
-    )
+# Labels are a glyph rather than a LabelSet so filtered out nodes lose theirs
+graph_viewer.text(
+    'xs',
+    'ys',
+    text='label',
+    source=source_nodes,
+    view=CDSView(filter=client_filter),
+    background_fill_color='white',
+    text_font_size='8px',
+    background_fill_alpha=.7
 )
 
+# Toggling refilters right away; new edges refilter the nodes they touch
+refilter = CustomJS(args=dict(filter=client_filter), code="filter.change.emit()")
+for toggle in (buttons.dataset_checkbox_button, buttons.interaction_support_checkbox_button,
+               buttons.interaction_type_checkbox_button):
+    toggle.js_on_change("active", refilter)
+source_edges.js_on_change("data", refilter)
+
 # Create legend for edges
 edge_legend_map = {
     "PPI Support": {"line_color": PPI_SUPPORT, "line_dash": "solid"},
@@ -166,229 +210,661 @@ graph_viewer.add_layout(node_legend, "below")
 
 # Other
 statistics_info = PreText(text="Graph Statistics:", width=300)
-global_df = read_csv("SupplementalTable_2.csv")
+status_info = PreText(text="", width=300)
+sweep_info = PreText(text="", width=300)
+global_df = get_interactome()  # Shared across sessions, loaded once
 
 
-def subset_dataframe() -> DataFrame:
+def subset_dataframe(state: FilterState) -> DataFrame:
     """
     Returns portion of Supplemental Table 2 based on controls tagged
     """
-    df = global_df.copy()
-    remapped_df = remap_df(df)
-    protein_filtered_df = subset_by_protein(remapped_df)
-    node_filtered_df = subset_by_node_type(protein_filtered_df)
-    edge_filtered_df = subset_by_edge_type(node_filtered_df)
+    rows = filter_cache.get(state)  # Union[ndarray, None]
+
+    if rows is not None:
+        return add_edge_attributes(global_df.iloc[rows])
+
+    protein_filtered_df = subset_by_protein(global_df, state, get_adjacency())
+    node_filtered_df = subset_by_node_type(protein_filtered_df, state)
+    edge_filtered_df = subset_by_edge_type(node_filtered_df, state)
+
+    # Remember the filtered rows as positions in the shared table
+    rows = global_df.index.get_indexer(edge_filtered_df.index)
+    rows.flags.writeable = False
+    filter_cache.put(state, rows)
 
     return edge_filtered_df
 
 
-def get_edges(df: DataFrame,
-              graph: nx.Graph,
-              layout: Dict[str, ndarray],
-              alpha: float) -> Tuple[Edges, Edges, List[str], EdgeStyles]:
-    edge_x = []  # List[List[float64]]
-    edge_y = []  # List[List[float64]]
-    ppi_x = []  # List[List[float64]]
-    ppi_y = []  # List[List[float64]]
-    edge_colors = []  # List[str]
-    edge_styles = []  # List[List[int]]
-
-    progress_bar = tqdm(list(graph.edges()), total=len(graph.edges()))
-
-    # If above statement didn't return anything, we render CORUM edges
-    for edge in progress_bar:
-        # Undirected edge is: (s_x, s_y) <--> (t_x, t_y)
-        # Directed edge is: (s_x, s_y) --> (t_x, t_y)
-        # s = source, t = target
-        source = edge[0]
-        target = edge[1]
-        source_coordinates = layout[source]
-        target_coordinates = layout[target]
-        s_x, s_y = source_coordinates
-        t_x, t_y = target_coordinates
-
-        # Subset to bait-prey pair in CORUM (in_CORUM_2022 is a boolean Series)
-        bait_mask = df["Bait"] == source
-        prey_mask = df["Prey"] == target
-        corum_mask = df["in_CORUM_2022"]
-        df_edge = df[bait_mask & prey_mask & corum_mask]
-
-        if df_edge.shape[0] == 1:
-            # Find x and y components of the slope
-            slope_x = t_x - s_x
-            slope_y = t_y - s_y
-
-            # Translate original edge coordinates to make room for PPI edge
-            new_s_x = s_x + (alpha * slope_y)
-            new_s_y = s_y - (alpha * slope_x)
-            new_t_x = t_x + (alpha * slope_y)
-            new_t_y = t_y - (alpha * slope_x)
-
-            # Add coordinates, colors, and styles to lists
-            edge_x.append([new_s_x, new_t_x])
-            edge_y.append([new_s_y, new_t_y])
-            edge_color = df_edge["edge_color"].values[0]
-            edge_style = df_edge["edge_style"].values[0]
-            edge_colors.append(edge_color)
-            edge_styles.append(edge_style)
-
-            # Create source (s) and target (t) coordinates for PPI edge
-            ppi_s_x = s_x - (alpha * slope_y)
-            ppi_s_y = s_y + (alpha * slope_x)
-            ppi_t_x = t_x - (alpha * slope_y)
-            ppi_t_y = t_y + (alpha * slope_x)
-
-            # Add coordinates to list of ppi edges
-            ppi_x.append([ppi_s_x, ppi_t_x])
-            ppi_y.append([ppi_s_y, ppi_t_y])
-        elif df_edge.shape[0] == 0:
-            # No PPI support --> don't translate coordinates
-            edge_x.append([s_x, t_x])
-            edge_y.append([s_y, t_y])
-            edge_color = df[bait_mask & prey_mask]["edge_color"].values[0]
-            edge_style = df[bait_mask & prey_mask]["edge_style"].values[0]
-            edge_colors.append(edge_color)
-            edge_styles.append(edge_style)
-        else:
-            message = "Each edge should correspond to at most 1 entry"
-            raise Exception(message)
-
-    return (edge_x, edge_y), (ppi_x, ppi_y), edge_colors, edge_styles
+def build_graph(df: DataFrame) -> CompactGraph:
+    # Proteins keep their ids in the shared table, so only the filtered rows
+    # are read and no names are hashed
+    rows = global_df.index.get_indexer(df.index)  # ndarray
+    return compact_graph(get_adjacency(), rows,
+                         {"edge_color": df["edge_color"].to_numpy(dtype=uint8),
+                          "edge_style": df["edge_style"].to_numpy(dtype=uint8)})
 
 
-def update() -> None:
-    df = subset_dataframe()  # DataFrame
-    graph = nx.from_pandas_edgelist(df,
-                                    source="Bait",
-                                    target="Prey",
-                                    edge_attr=["edge_color", "edge_style"],
-                                    create_using=nx.DiGraph)
-
-    clustering_method = str(controls.graph_clustering_selection.value)  # str
-
-    if clustering_method == "no clustering":
-        # TODO: Relocate this to initial ColumnDataSource declaration
-        node_sizes = [12 for _ in range(len(graph.nodes()))]  # List[int]
-
-        # Layout is a mapping of nodes --> coordinates
-        layout = nx.spring_layout(graph)  # Dict[str, ndarray]
-
-        # Show protein names only if the LABELS checkbox is active
-        if controls.apply_labels_checkbox.active:
-            new_node_names = list(layout.keys())  # List[str]
-        else:
-            new_node_names = ["" for _ in layout.keys()]
-
-        node_coordinates = zip(*layout.values())
-        node_x, node_y = node_coordinates
-
-        interaction_support_toggled = interaction_support_checkbox_button.active
-        if InteractionSupport.CORUM.value in interaction_support_toggled:
-            # TODO: Find way to dynamically set alpha based on node_size
-            alpha = 5e-5
-            new_edges_out = get_edges(df, graph, layout, alpha)
-            new_edges, new_ppi_edges, new_edge_colors, new_edge_styles = new_edges_out
-            edge_x, edge_y = new_edges
-            ppi_x, ppi_y = new_ppi_edges
-        else:
-            edge_x = [[layout[source][0], layout[target][0]]
-                      for source, target in graph.edges()]
-            edge_y = [[layout[source][1], layout[target][1]]
-                      for source, target in graph.edges()]
-
-            edge_data = list(graph.edges(data=True))
-            new_edge_colors = [attr["edge_color"] for _, _, attr in edge_data]
-            new_edge_styles = [attr["edge_style"] for _, _, attr in edge_data]
-
-            ppi_x, ppi_y = [], []
-
-        # Account for the "color by" selection menu
-        init_node_coloring = determine_node_coloring(df)
-
-        # Get new summary statistics based on new subsetting of the dataframe/graph
-        new_stats: str = get_graph_statistics(df, graph, num_proteins=5, num_complexes=5, clusters=None)
-        statistics_info.text = new_stats
-
-        new_node_colors = []  # List[str]
-        new_node_category: List[str] = []
-        for node in layout.keys():
-            if node in init_node_coloring:
-                color = init_node_coloring[node]["node_color"]
-                category = init_node_coloring[node]["legend_label"]
-                new_node_colors.append(color)
-                new_node_category.append(category)
-            else:
-                new_node_colors.append(GRAY)
-                new_node_colors.append("N/A")
-
-        source_nodes.data = dict(
-            xs=node_x,
-            ys=node_y,
-            names=new_node_names,
-            color=new_node_colors,
-            node_size=node_sizes,
-            node_category=new_node_category,
-            label=new_node_names,
-        )
-
-        source_edges.data = dict(
-            xs=edge_x,
-            ys=edge_y,
-            line_dash=new_edge_styles,
-            line_color=new_edge_colors,
-        )
-
-        ppi_edges.data = dict(xs=ppi_x, ys=ppi_y, line_dash=[[] for _ in ppi_x])
+def compute_layout(graph: CompactGraph, layout_mode: str) -> Dict[str, ndarray]:
+    # Layout is a mapping of nodes --> coordinates
+    if layout_mode == "global coordinates":
+        layout = global_layout(graph)  # Union[Dict[str, ndarray], None]
+        if layout is not None:
+            return layout
+
+        print("No global layout found, run `python layout.py` to create it")
+
+    # Progressive layouts are refined once they are on screen, see
+    # `start_refinement`
+    if layout_mode == "progressive":
+        return progressive_layout(graph, previous=pipeline.last_value("layout"))
+
+    # Spring layouts are warm-started from the nodes that were on screen
+    engine = layout_mode if layout_mode in LAYOUT_ENGINES else "spring"  # str
+    return spring_layout(graph, previous=pipeline.last_value("layout"), engine=engine)
+
+
+def compute_coloring(df: DataFrame, graph: CompactGraph, color_by: str) -> NodeColoring:
+    # Annotations are numbered like the adjacency index the graph was built from
+    return determine_node_coloring(df, graph.nodes, get_annotations(), color_by,
+                                   node_ids=graph.node_ids)
+
+
+def compute_edges(df: DataFrame,
+                  graph: CompactGraph,
+                  layout: Dict[str, ndarray],
+                  corum: bool,
+                  client_filtering: bool) -> Tuple[Dict[str, ndarray], Dict[str, ndarray]]:
+    if corum:
+        # TODO: Find way to dynamically set alpha based on node_size
+        alpha = 5e-5
+        edges, ppi, edge_colors, edge_styles, has_ppi = get_edges(df, graph, layout, alpha)
+    else:
+        edges = edge_coordinates(graph, layout)
+        ppi = (empty((0, 2)), empty((0, 2)))
+        has_ppi = zeros(len(graph.sources), dtype=bool)
+        edge_colors = graph.edge_data["edge_color"]  # ndarray
+        edge_styles = graph.edge_data["edge_style"]  # ndarray
+
+    edges_data = dict(segment_data(*edges), dash=edge_styles, color=edge_colors)
+    ppi_data = segment_data(*ppi)
+
+    # filter.js hides edges by their codes, PPI edges by their edge's codes
+    # and nodes by their edges, so it needs the node index of every edge end
+    if client_filtering:
+        node_index = Index(list(layout.keys())).get_indexer(graph.nodes)  # ndarray
+        edges_data["source"] = node_index[graph.sources].astype(int32)
+        edges_data["target"] = node_index[graph.targets].astype(int32)
+        ppi_data.update(dash=edge_styles[has_ppi], color=edge_colors[has_ppi])
+
+    return edges_data, ppi_data
+
+
+def compute_nodes(layout: Dict[str, ndarray],
+                  node_coloring: NodeColoring,
+                  labels: bool) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Node columns and the palette their color codes index
+    """
+    # TODO: Relocate this to initial ColumnDataSource declaration
+    node_sizes = full(len(layout), 12, dtype=int32)  # ndarray
+
+    # Show protein names only if the LABELS checkbox is active
+    if labels:
+        new_node_names = list(layout.keys())  # List[str]
     else:
-        # Account for the "color by" selection menu
-        init_node_coloring = determine_node_coloring(df)
-
-        clustering_resolution: float = float(controls.clustering_resolution.value)
-        cluster_graph, nodes_per_cluster = create_cluster_graph(graph=graph,
-                                                                method=clustering_method,
-                                                                res=clustering_resolution,
-                                                                node_coloring=init_node_coloring)
-
-        layout = nx.spring_layout(cluster_graph, weight=None)
-
-        node_coordinates = zip(*layout.values())
-        node_x, node_y = node_coordinates
-
-        edge_x = [[layout[source][0], layout[target][0]]
-                  for source, target in cluster_graph.edges()]
-        edge_y = [[layout[source][1], layout[target][1]]
-                  for source, target in cluster_graph.edges()]
-
-        new_node_colors = [color for node, color in nx.get_node_attributes(cluster_graph, "color").items()]
-        new_node_sizes = [size for node, size in nx.get_node_attributes(cluster_graph, "size").items()]
-        new_node_category = ["<br>".join(node_group) for node_group in nodes_per_cluster.values()]
-
-        source_nodes.data = dict(
-            xs=node_x,
-            ys=node_y,
-            names=[str(node) for node in cluster_graph.nodes()],
-            color=new_node_colors,
-            node_size=new_node_sizes,
-            node_category=new_node_category,
-            label=[str(node) for node in cluster_graph.nodes()],
-        )
-
-        source_edges.data = dict(
-            xs=edge_x,
-            ys=edge_y,
-            line_dash=[[] for _ in cluster_graph.edges()],
-            line_color=[GRAY for _ in cluster_graph.edges()],
-        )
-
-        ppi_edges.data = dict(xs=[], ys=[], line_dash=[])
-
-    # Set callback on each update to ensure only subset_df is downloaded
-    download_button.js_on_click(
-        CustomJS(
-            args=dict(source=subset_dataframe().to_csv(index=False)),
-            code=open(join(dirname(__file__), "download.js")).read()
-        )
+        new_node_names = ["" for _ in layout.keys()]
+
+    positions = layout_positions(layout)  # ndarray
+
+    # Cached layouts may list the nodes in a different order than the graph
+    order = node_coloring.nodes.get_indexer(list(layout.keys()))  # ndarray
+    color_codes, palette = category_codes(node_coloring.colors[order])
+
+    return dict(
+        xs=positions[:, 0],
+        ys=positions[:, 1],
+        names=new_node_names,
+        color=color_codes,
+        node_size=node_sizes,
+        node_category=node_coloring.labels[order].tolist(),
+        label=new_node_names,
+    ), palette
+
+
+def compute_statistics(df: DataFrame,
+                       graph: CompactGraph,
+                       normalized_betweenness: bool) -> GraphStatistics:
+    # Get new summary statistics based on new subsetting of the dataframe/graph
+    return compute_graph_statistics(df, graph, num_proteins=5, num_complexes=5, clusters=None,
+                                    normalized=normalized_betweenness)
+
+
+def compute_export(df: DataFrame) -> str:
+    # Downloads list edge styles as dash patterns and edge colors as hex
+    export_df = df.assign(
+        edge_style=[EDGE_DASH_PATTERNS[code] for code in df["edge_style"]],
+        edge_color=asarray(EDGE_PALETTE, dtype=object)[df["edge_color"].to_numpy()],
+    )  # DataFrame
+    return export_df.to_csv(index=False)
+
+
+def compute_clusters(graph: CompactGraph,
+                     node_coloring: Dict[str, Dict[str, str]],
+                     clustering_method: str,
+                     clustering_resolution: float) -> Tuple[CompactGraph, Dict[int, str]]:
+    cluster_graph, nodes_per_cluster = create_cluster_graph(graph=graph,
+                                                            method=clustering_method,
+                                                            res=clustering_resolution,
+                                                            node_coloring=node_coloring)
+    return cluster_graph, nodes_per_cluster
+
+
+def compute_cluster_statistics(df: DataFrame,
+                               graph: CompactGraph,
+                               normalized_betweenness: bool,
+                               clustered: Tuple[CompactGraph, Dict[int, str]]) -> GraphStatistics:
+    # Adds the top complexes of the clusters to the summary statistics
+    _, nodes_per_cluster = clustered
+    return compute_graph_statistics(df, graph, num_proteins=5, num_complexes=5,
+                                    clusters=list(nodes_per_cluster.values()),
+                                    normalized=normalized_betweenness)
+
+
+def compute_cluster_layout(clustered: Tuple[CompactGraph, Dict[int, str]],
+                           graph: CompactGraph,
+                           layout_mode: str) -> Dict[int, ndarray]:
+    cluster_graph, nodes_per_cluster = clustered
+
+    # In global coordinates each cluster sits at the centroid of its proteins
+    if layout_mode == "global coordinates":
+        protein_layout = global_layout(graph)  # Union[Dict[str, ndarray], None]
+        if protein_layout is not None:
+            return {idx: mean([protein_layout[node] for node in nodes_per_cluster[idx]], axis=0)
+                    for idx in cluster_graph.nodes}
+
+        print("No global layout found, run `python layout.py` to create it")
+
+    # Cluster graphs are small enough to lay out completely right away
+    if layout_mode == "progressive":
+        layout_mode = "multilevel"
+
+    engine = layout_mode if layout_mode in LAYOUT_ENGINES else "spring"  # str
+    return spring_layout(cluster_graph, weight=None, engine=engine)
+
+
+def compute_cluster_nodes(clustered: Tuple[CompactGraph, Dict[int, str]],
+                          layout: Dict[int, ndarray]) -> Tuple[Dict[str, Any], List[str]]:
+    cluster_graph, nodes_per_cluster = clustered
+
+    positions = layout_positions(layout)  # ndarray
+
+    new_node_colors = cluster_graph.node_data["color"]  # ndarray
+    new_node_sizes = cluster_graph.node_data["size"]  # ndarray
+    new_node_category = ["<br>".join(node_group) for node_group in nodes_per_cluster.values()]
+    color_codes, palette = category_codes(new_node_colors)
+
+    return dict(
+        xs=positions[:, 0],
+        ys=positions[:, 1],
+        names=[str(node) for node in cluster_graph.nodes],
+        color=color_codes,
+        node_size=asarray(new_node_sizes, dtype=int32),
+        node_category=new_node_category,
+        label=[str(node) for node in cluster_graph.nodes],
+    ), palette
+
+
+def compute_cluster_edges(clustered: Tuple[CompactGraph, Dict[int, str]],
+                          layout: Dict[int, ndarray]) -> Tuple[Dict[str, ndarray], Dict[str, ndarray]]:
+    cluster_graph, _ = clustered
+    num_edges = len(cluster_graph.sources)  # int
+
+    edges_data = dict(
+        segment_data(*edge_coordinates(cluster_graph, layout)),
+        dash=zeros(num_edges, dtype=uint8),  # Solid
+        color=full(num_edges, EDGE_PALETTE.index(GRAY), dtype=uint8),
     )
+    ppi_data = segment_data(empty((0, 2)), empty((0, 2)))
+    return edges_data, ppi_data
+
+
+# Each stage only reruns when one of its inputs (controls or stages) changed
+pipeline = Pipeline(
+    controls={
+        "filter_state": lambda: filter_state(controls, buttons),
+        "corum": lambda: InteractionSupport.CORUM.value in buttons.interaction_support_checkbox_button.active,
+        "color_by": lambda: str(controls.node_coloring_selection.value),
+        "labels": lambda: bool(controls.apply_labels_checkbox.active),
+        "layout_mode": lambda: str(controls.layout_selection.value),
+        "datasets": lambda: tuple(sorted(buttons.dataset_checkbox_button.active)),
+        "normalized_betweenness": lambda: bool(controls.use_normalized_betweenness.active),
+        "clustering_method": lambda: str(controls.graph_clustering_selection.value),
+        "clustering_resolution": lambda: float(controls.clustering_resolution.value),
+        "sweep_resolutions": lambda: bool(controls.sweep_resolutions_checkbox.active),
+        "client_filtering": lambda: bool(controls.client_filtering_checkbox.active),
+    },
+    stages=[
+        Stage("filter", subset_dataframe, ["filter_state"]),
+        Stage("graph", build_graph, ["filter"]),
+        Stage("layout", compute_layout, ["graph", "layout_mode"]),
+        Stage("coloring", compute_coloring, ["filter", "graph", "color_by"]),
+        Stage("edges", compute_edges, ["filter", "graph", "layout", "corum", "client_filtering"]),
+        Stage("nodes", compute_nodes, ["layout", "coloring", "labels"]),
+        Stage("statistics", compute_statistics,
+              ["filter", "graph", "normalized_betweenness"]),
+        Stage("statistics_text", format_graph_statistics, ["statistics", "datasets"]),
+        Stage("statistics_json", statistics_json, ["statistics"]),
+        Stage("export", compute_export, ["filter"]),
+        Stage("cluster_coloring", coloring_dict, ["coloring"]),
+        Stage("clusters", compute_clusters,
+              ["graph", "cluster_coloring", "clustering_method", "clustering_resolution"]),
+        Stage("cluster_statistics", compute_cluster_statistics,
+              ["filter", "graph", "normalized_betweenness", "clusters"]),
+        Stage("cluster_statistics_text", format_graph_statistics,
+              ["cluster_statistics", "datasets"]),
+        Stage("cluster_statistics_json", statistics_json, ["cluster_statistics"]),
+        Stage("cluster_layout", compute_cluster_layout,
+              ["clusters", "graph", "layout_mode"]),
+        Stage("cluster_nodes", compute_cluster_nodes, ["clusters", "cluster_layout"]),
+        Stage("cluster_edges", compute_cluster_edges, ["clusters", "cluster_layout"]),
+    ]
+)
+
+# Target --> (stage, version) last sent to the browser
+rendered_versions: Dict[str, Union[Tuple[str, int], None]] = {}
+
+# Single download callback per button whose payload is swapped on each update
+download_callback = CustomJS(
+    args=dict(source="", filename="SupplementalTable_2_subset.csv", mime_type="text/csv"),
+    code=open(join(dirname(__file__), "download.js")).read()
+)
+buttons.download_button.js_on_click(download_callback)
+
+download_statistics_callback = CustomJS(
+    args=dict(source="", filename="graph_statistics.json", mime_type="application/json"),
+    code=open(join(dirname(__file__), "download.js")).read()
+)
+buttons.download_statistics_button.js_on_click(download_statistics_callback)
+
+
+# Only the most recent click is rendered; older builds are cancelled if they
+# haven't started and stop at their next stage otherwise
+update_generation = 0  # int
+update_job: Union[Future, None] = None
+pipeline_lock = Lock()  # One build at a time computes this session's stages
+document = curdoc()  # Worker threads hand results back through the document
+
+# Target --> (stage, version) computed for it
+Changes = Dict[str, Tuple[Tuple[str, int], Any]]
+
+# Seconds between coordinate updates sent while refining a progressive layout
+REFINEMENT_FRAME_SECONDS: float = 0.25
+
+
+class Refinement(NamedTuple):
+    """
+    Progressive layout to refine once it is on screen
+    """
+    graph: CompactGraph
+    layout: Dict[str, ndarray]
+    version: int  # Version of the layout stage it refines
+    edges: Callable[[Dict[str, ndarray]], Tuple[Dict[str, ndarray], Dict[str, ndarray]]]
+
+
+class RefinementFrame(NamedTuple):
+    """
+    Coordinates of a refined layout, sent to the browser as patches
+    """
+    iteration: int
+    positions: ndarray  # (N, 2) float32, in the order of the nodes
+    edges_data: Dict[str, ndarray]
+    ppi_data: Dict[str, ndarray]
+    finished: bool
+
+
+class Build(NamedTuple):
+    """
+    Result of a build, shared by every session that asked for the same view
+    """
+    pipeline: Pipeline  # Pipeline of the session that computed it
+    changes: Changes
+    cluster_one_job: Union[Future, None]  # Set while clusterONE runs or failed
+    sweep: Union[Future, None]  # Resolution sweep summary, if one was asked for
+    refinement: Union[Refinement, None] = None  # Set for unrefined progressive layouts
+
+
+def render_targets(control_values: Dict[str, Hashable]) -> Dict[str, str]:
+    """
+    Maps each rendered target to the stage it shows for these controls
+    """
+    if control_values["clustering_method"] == "no clustering":
+        return {"statistics": "statistics_text", "statistics_json": "statistics_json",
+                "nodes": "nodes", "edges": "edges", "export": "export"}
+    return {"statistics": "cluster_statistics_text", "statistics_json": "cluster_statistics_json",
+            "nodes": "cluster_nodes", "edges": "cluster_edges", "export": "export"}
+
+
+def estimate_cost(control_values: Dict[str, Hashable]) -> int:
+    """
+    Estimated number of edges in the filtered table, used to schedule builds
+    """
+    state = control_values["filter_state"]  # FilterState
+    rows = filter_cache.get(state)  # Union[ndarray, None]
+    if rows is not None:
+        return len(rows)
+
+    _, _, _, proteins, num_neighbors = state
+    if proteins is None:
+        return global_df.shape[0]
+    return estimate_neighborhood_rows(get_adjacency(), list(proteins), num_neighbors)
+
+
+def compute_update(control_values: Dict[str, Hashable],
+                   cancelled: Callable[[], bool]) -> Build:
+    """
+    Computes, on a worker, every target for these controls
+
+    While clusterONE is still running or failed, its job is returned
+    instead.
+    """
+    with pipeline_lock:
+        pipeline.refresh(control_values, cancelled=cancelled)
+
+        # clusterONE runs in its own pool; come back once its clusters are cached
+        if control_values["clustering_method"] == "clusterONE":
+            job = submit_cluster_one(colored_subgraph(pipeline.get("graph"),
+                                                      pipeline.get("cluster_coloring")))  # Future
+            if not job.done() or job.exception() is not None:
+                return Build(pipeline, {}, job, None)
+
+        changes: Changes = {}
+        for target, stage in render_targets(control_values).items():
+            changes[target] = ((stage, pipeline.version(stage)), pipeline.get(stage))
+
+        # Cluster the other resolutions in the background so moving the
+        # slider afterwards is a cache lookup
+        sweep = None  # Union[Future, None]
+        if control_values["sweep_resolutions"] and \
+                control_values["clustering_method"] in ("louvain", "markov"):
+            sweep = sweep_resolutions(colored_subgraph(pipeline.get("graph"),
+                                                       pipeline.get("cluster_coloring")),
+                                      str(control_values["clustering_method"]))
+
+        # Progressive layouts are refined after they are shown, unless the
+        # graph's refined layout was cached
+        refinement = None  # Union[Refinement, None]
+        graph = pipeline.get("graph")  # CompactGraph
+        if control_values["layout_mode"] == "progressive" and \
+                control_values["clustering_method"] == "no clustering" and \
+                len(graph.nodes) > 0 and cached_layout(graph) is None:
+            edges = partial(compute_edges, pipeline.get("filter"), graph,
+                            corum=control_values["corum"],
+                            client_filtering=control_values["client_filtering"])
+            refinement = Refinement(graph, pipeline.get("layout"), pipeline.version("layout"), edges)
+
+        return Build(pipeline, changes, None, sweep, refinement)
+
+
+def apply_update(generation: int, build: Build) -> None:
+    """
+    Renders a finished build on the document's thread unless superseded
+    """
+    if generation != update_generation:
+        return
+
+    for target, (version, value) in build.changes.items():
+        # Only send the data sources whose stages produced new values
+        if build.pipeline is pipeline and rendered_versions.get(target) == version:
+            continue
+
+        # Another session's versions mean nothing here, so the next build of
+        # this session sends its own values again
+        if build.pipeline is not pipeline:
+            version = None
+
+        # Shallow copies, since a build can be shared by several documents
+        if target == "statistics":
+            statistics_info.text = value
+        elif target == "nodes":
+            nodes_data, palette = value
+            node_color_transform.args = dict(values=palette)
+            source_nodes.data = dict(nodes_data)
+        elif target == "edges":
+            edges_data, ppi_data = value
+            source_edges.data = dict(edges_data)
+            ppi_edges.data = dict(ppi_data)
+        elif target == "export":
+            # Set payload on each update to ensure only subset_df is downloaded
+            download_callback.args = dict(download_callback.args, source=value)
+        elif target == "statistics_json":
+            # The same JSON is downloaded and served by serve.py
+            download_statistics_callback.args = dict(download_statistics_callback.args,
+                                                     source=value)
+            if document.session_context is not None:
+                publish_statistics(document.session_context.id, value)
+        rendered_versions[target] = version
+
+    status_info.text = ""
+    if build.refinement is not None and build.pipeline is pipeline:
+        start_refinement(generation, build.refinement)
+
+    if build.sweep is None:
+        sweep_info.text = ""
+    elif not build.sweep.done():
+        sweep_info.text = "Clustering all resolutions..."
+
+
+# Bumped to stop the running refinement. Its worker leaves the latest frame
+# in `refinement_frame` and a periodic callback patches it into the sources.
+refinement_id = 0  # int
+refinement_frame: Union[RefinementFrame, None] = None
+refinement_callback: Any = None  # Periodic callback showing the frames
+shown_iteration = 0  # int
+
+
+def start_refinement(generation: int, refinement: Refinement) -> None:
+    global refinement_id, refinement_frame, refinement_callback, shown_iteration
+
+    stop_refinement()
+    refinement_frame = None
+    shown_iteration = 0
+
+    # Patches write into the columns, which are shared with the pipeline
+    # and with other sessions' builds, so the refined ones are copies
+    source_nodes.data = dict(source_nodes.data,
+                             **{name: asarray(source_nodes.data[name]).copy() for name in ("xs", "ys")})
+    for source in (source_edges, ppi_edges):
+        source.data = dict(source.data,
+                           **{name: asarray(source.data[name]).copy() for name in ("x0", "y0", "x1", "y1")})
+
+    refine_executor.submit(refine_in_background, refinement_id, generation, refinement)
+    refinement_callback = document.add_periodic_callback(show_refinement_frame,
+                                                         int(REFINEMENT_FRAME_SECONDS * 1000))
+    buttons.stop_refinement_button.visible = True
+    status_info.text = "Refining layout..."
+
+
+def stop_refinement() -> None:
+    """
+    Stops the running refinement; the layout keeps the refined coordinates
+    unless a newer update superseded it
+    """
+    global refinement_id, refinement_callback
+
+    refinement_id += 1
+    if refinement_callback is not None:
+        document.remove_periodic_callback(refinement_callback)
+        refinement_callback = None
+        status_info.text = ""
+    buttons.stop_refinement_button.visible = False
+
+
+def refine_in_background(own_id: int, generation: int, refinement: Refinement) -> None:
+    """
+    Refines a progressive layout on a worker, leaving a frame every
+    REFINEMENT_FRAME_SECONDS, and stores the result in the layout stage
+    """
+    global refinement_frame
+
+    nodes = list(refinement.layout.keys())  # List[str]
+    positions = layout_positions(refinement.layout)  # ndarray
+    iteration = 0  # int
+    last_frame = perf_counter()  # float
+
+    def frame(finished: bool) -> RefinementFrame:
+        edges_data, ppi_data = refinement.edges(dict(zip(nodes, positions)))
+        return RefinementFrame(iteration, positions.astype(float32), edges_data, ppi_data, finished)
+
+    try:
+        for iteration, positions in enumerate(refine_layout(refinement.graph, refinement.layout,
+                                                            lambda: own_id != refinement_id), start=1):
+            if perf_counter() - last_frame >= REFINEMENT_FRAME_SECONDS:
+                refinement_frame = frame(finished=False)
+                last_frame = perf_counter()
+
+        if generation != update_generation:
+            return
+
+        # Stopped refinements keep their coordinates too, so later builds
+        # that reuse the layout draw what is on screen
+        if own_id == refinement_id:
+            refinement_frame = frame(finished=True)
+        with pipeline_lock:
+            pipeline.replace("layout", refinement.version, dict(zip(nodes, positions)))
+    except Exception as error:
+        log.exception("Layout refinement failed")
+        document.add_next_tick_callback(partial(refinement_failed, own_id,
+                                                f"Layout refinement failed:\n{error}"))
+
+
+def refinement_failed(own_id: int, text: str) -> None:
+    if own_id == refinement_id:
+        stop_refinement()
+        status_info.text = text
+
+
+def show_refinement_frame() -> None:
+    """
+    Patches the latest refined coordinates into the data sources
+    """
+    global shown_iteration
+
+    frame = refinement_frame  # Union[RefinementFrame, None]
+    if frame is None or frame.iteration == shown_iteration:
+        return
+    shown_iteration = frame.iteration
+
+    source_nodes.patch({"xs": [(slice(None), frame.positions[:, 0])],
+                        "ys": [(slice(None), frame.positions[:, 1])]})
+    for source, data in ((source_edges, frame.edges_data), (ppi_edges, frame.ppi_data)):
+        source.patch({name: [(slice(None), data[name])] for name in ("x0", "y0", "x1", "y1")})
+
+    if frame.finished:
+        stop_refinement()
+        status_info.text = f"Layout refined in {frame.iteration} iterations"
+    else:
+        status_info.text = f"Refining layout... iteration {frame.iteration}"
+
+
+def show_sweep(generation: int, method: str, sweep: Future) -> None:
+    if generation != update_generation:
+        return
+
+    if sweep.exception() is None:
+        sweep_info.text = format_sweep(sweep.result(), method)
+    else:
+        log.error("Resolution sweep failed", exc_info=sweep.exception())
+        sweep_info.text = f"Resolution sweep failed:\n{sweep.exception()}"
+
+
+def show_status(generation: int, text: str) -> None:
+    if generation == update_generation:
+        status_info.text = text
+
+
+def build_finished(control_values: Dict[str, Hashable],
+                   generation: int,
+                   job: Future) -> None:
+    """
+    Hands a build's outcome back to the document; runs on the worker thread
+    """
+    if job.cancelled() or generation != update_generation:
+        return
+
+    error = job.exception()  # Union[BaseException, None]
+    if isinstance(error, Cancelled):
+        return
+    if error is not None:
+        log.error("Update failed", exc_info=error)
+        document.add_next_tick_callback(partial(show_status, generation, f"Update failed:\n{error}"))
+        return
+
+    build = job.result()  # Build
+    cluster_one_job = build.cluster_one_job  # Union[Future, None]
+    if cluster_one_job is None:
+        document.add_next_tick_callback(partial(apply_update, generation, build))
+        if build.sweep is not None:
+            method = str(control_values["clustering_method"])  # str
+            build.sweep.add_done_callback(
+                lambda sweep: document.add_next_tick_callback(partial(show_sweep, generation, method, sweep)))
+    elif not cluster_one_job.done():
+        document.add_next_tick_callback(partial(show_status, generation, "Running clusterONE..."))
+        cluster_one_job.add_done_callback(partial(cluster_one_finished, control_values, generation))
+    else:
+        cluster_one_finished(control_values, generation, cluster_one_job)
+
+
+def cluster_one_finished(control_values: Dict[str, Hashable],
+                         generation: int,
+                         job: Future) -> None:
+    """
+    Resumes the build once its clusters are cached, or shows clusterONE's
+    error; a failed job isn't resubmitted until the next click. Runs on a
+    worker thread, so the build is resubmitted from the document's thread.
+    """
+    if job.exception() is None:
+        document.add_next_tick_callback(partial(schedule_update, control_values, generation))
+    else:
+        log.error("clusterONE failed", exc_info=job.exception())
+        document.add_next_tick_callback(partial(show_status, generation,
+                                                f"clusterONE failed:\n{job.exception()}"))
+
+
+def schedule_update(control_values: Dict[str, Hashable], generation: int) -> None:
+    """
+    Submits a build of `control_values`; only runs on the document's thread,
+    which owns `update_job`
+    """
+    global update_job
+
+    if generation != update_generation:
+        return
+
+    # Sessions asking for the same view while it is queued or running share
+    # the build; the key is the normalized state of every control
+    key = tuple(sorted(control_values.items()))  # Tuple
+    job = scheduler.submit(key,
+                           estimate_cost(control_values),
+                           partial(compute_update, control_values))  # Future
+    job.add_done_callback(partial(build_finished, control_values, generation))
+    update_job = job
+
+
+def update() -> None:
+    """
+    Starts building the interactome on a worker, superseding earlier builds
+    """
+    global update_generation
+
+    update_generation += 1
+    stop_refinement()
+    if update_job is not None:
+        scheduler.withdraw(update_job)
+
+    queue_depth = int(scheduler.metrics()["queue_depth"])  # int
+    status_info.text = "Computing..." if queue_depth == 0 else f"Queued behind {queue_depth} builds..."
+    schedule_update(pipeline.snapshot(), update_generation)
 
 
 # Arranging final output
@@ -399,9 +875,23 @@ primary_div = Div(
 
 graph_viewer.hover.renderers = [scatter]
 
-create_interactome_button.on_click(update)
-control_inputs = column(*controls.all_controls, width=300)
-statistics_output = column(*[statistics_info], width=300)
+buttons.create_interactome_button.on_click(update)
+buttons.stop_refinement_button.on_click(stop_refinement)
+
+
+def resolution_changed(attr: str, old: float, new: float) -> None:
+    """
+    Redraws the clusters as soon as the slider is released, which is instant
+    once the resolution sweep has cached them
+    """
+    if controls.sweep_resolutions_checkbox.active and \
+            controls.graph_clustering_selection.value in ("louvain", "markov"):
+        update()
+
+
+controls.clustering_resolution.on_change("value_throttled", resolution_changed)
+control_inputs = column(*all_controls(controls, buttons), width=300)
+statistics_output = column(*[status_info, statistics_info, sweep_info], width=300)
 
 root_column = column(
     primary_div,
@@ -411,4 +901,15 @@ root_column = column(
 
 # curdoc == current document
 curdoc().add_root(root_column)
+
+
+def session_destroyed(session_context: Any) -> None:
+    global refinement_id
+
+    # The document's callbacks are already gone, only the worker is stopped
+    publish_statistics(session_context.id, None)
+    refinement_id += 1
+
+
+curdoc().on_session_destroyed(session_destroyed)
 curdoc().title = "Interactome"
@@ -0,0 +1,436 @@
+"""
+Timing comparisons between the original implementations and their
+replacements. Run with `python benchmarks.py [name ...]`.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+import networkx as nx
+from itertools import combinations, islice
+
+from numpy import arange, column_stack, hypot, mean, ndarray, uint8
+from numpy.random import default_rng
+from pandas import DataFrame
+
+from adjacency import build_adjacency, expand_neighborhood
+from clustering import build_cluster_graph
+from compact import CompactGraph, compact_graph, edge_list, table_graph, to_networkx
+from mcl import mcl_clusters, run_mcl
+from statistics import get_cluster_complexes
+from store import get_adjacency, get_betweenness, get_interactome
+from colors import EDGE_DASH_PATTERNS, EDGE_PALETTE
+from edges import get_edges
+from layout import multilevel_spring_layout
+from payload import payload_nbytes, segment_data
+
+from typing import Callable, Dict, List, Tuple
+
+
+def synthetic_edge_table(num_edges: int, seed: int = 0) -> DataFrame:
+    """
+    Random bait-prey table with one row per edge and ~10% CORUM support
+    """
+    rng = default_rng(seed)
+    num_proteins = max(num_edges // 4, 10)  # int
+    baits = rng.integers(0, num_proteins // 5 + 1, size=num_edges * 2)
+    preys = rng.integers(0, num_proteins, size=num_edges * 2)
+
+    df = DataFrame({"Bait": [f"B{i}" for i in baits],
+                    "Prey": [f"P{i}" for i in preys]})
+    df = df.drop_duplicates().head(num_edges).reset_index(drop=True)
+
+    num_rows = df.shape[0]  # int
+    df["in_CORUM_2022"] = rng.random(num_rows) < 0.1
+    # Codes into EDGE_PALETTE and EDGE_DASH_PATTERNS, as in add_edge_attributes
+    df["edge_color"] = rng.integers(0, len(EDGE_PALETTE), num_rows).astype(uint8)
+    df["edge_style"] = rng.integers(0, len(EDGE_DASH_PATTERNS), num_rows).astype(uint8)
+    return df
+
+
+def random_layout(graph: CompactGraph, seed: int = 0) -> Dict[str, ndarray]:
+    rng = default_rng(seed)
+    return {node: rng.random(2) for node in graph.nodes}
+
+
+def loop_get_edges(df: DataFrame,
+                   graph: CompactGraph,
+                   layout: Dict[str, ndarray],
+                   alpha: float,
+                   max_edges: int) -> int:
+    """
+    Original per-edge implementation of get_edges, limited to `max_edges`
+    """
+    edge_x, edge_y, ppi_x, ppi_y, colors, styles = [], [], [], [], [], []
+    edges = edge_list(graph)[:max_edges]  # List[Tuple[str, str]]
+
+    for source, target in edges:
+        s_x, s_y = layout[source]
+        t_x, t_y = layout[target]
+        bait_mask = df["Bait"] == source
+        prey_mask = df["Prey"] == target
+        corum_mask = df["in_CORUM_2022"]
+        df_edge = df[bait_mask & prey_mask & corum_mask]
+
+        if df_edge.shape[0] == 1:
+            slope_x = t_x - s_x
+            slope_y = t_y - s_y
+            edge_x.append([s_x + (alpha * slope_y), t_x + (alpha * slope_y)])
+            edge_y.append([s_y - (alpha * slope_x), t_y - (alpha * slope_x)])
+            colors.append(df_edge["edge_color"].values[0])
+            styles.append(df_edge["edge_style"].values[0])
+            ppi_x.append([s_x - (alpha * slope_y), t_x - (alpha * slope_y)])
+            ppi_y.append([s_y + (alpha * slope_x), t_y + (alpha * slope_x)])
+        else:
+            edge_x.append([s_x, t_x])
+            edge_y.append([s_y, t_y])
+            colors.append(df[bait_mask & prey_mask]["edge_color"].values[0])
+            styles.append(df[bait_mask & prey_mask]["edge_style"].values[0])
+
+    return len(edges)
+
+
+def time_call(function: Callable[[], object]) -> float:
+    start = perf_counter()  # float
+    function()
+    return perf_counter() - start
+
+
+def benchmark_edges(sizes: List[int], max_loop_edges: int = 500) -> None:
+    """
+    get_edges (vectorized) against the original loop at several edge counts
+
+    The original loop is linear in the number of edges for a fixed table, so
+    above `max_loop_edges` it is timed on a prefix and extrapolated.
+    """
+    print("edges\tloop (s)\tvectorized (s)\tspeedup")
+    for size in sizes:
+        df = synthetic_edge_table(size)
+        graph = table_graph(df, ["edge_color", "edge_style"])  # CompactGraph
+        layout = random_layout(graph)
+        num_edges = len(graph.sources)  # int
+
+        vectorized = time_call(lambda: get_edges(df, graph, layout, 5e-5))
+
+        timed: List[int] = []
+        loop = time_call(lambda: timed.append(
+            loop_get_edges(df, graph, layout, 5e-5, max_loop_edges)))
+        loop = loop * num_edges / timed[0]
+        estimate = "*" if timed[0] < num_edges else ""  # str
+
+        print(f"{num_edges}\t{loop:.2f}{estimate}\t{vectorized:.4f}\t"
+              f"{loop / vectorized:.0f}x")
+    print("* extrapolated from the first "
+          f"{max_loop_edges} edges")
+
+
+def synthetic_clusters(graph: CompactGraph,
+                       num_clusters: int,
+                       seed: int = 0) -> Tuple[List[Tuple[str]], Dict[str, Dict[str, str]]]:
+    """
+    Random partition of the nodes of `graph` and a random node coloring
+    """
+    rng = default_rng(seed)
+    nodes = graph.nodes.tolist()  # List[str]
+    # Every cluster gets at least one node as long as there are enough nodes
+    labels = rng.permutation(arange(len(nodes)) % num_clusters)  # ndarray
+    members: List[List[str]] = [[] for _ in range(num_clusters)]
+    for node, label in zip(nodes, labels):
+        members[label].append(node)
+
+    palette = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728"]  # List[str]
+    node_coloring = {node: {"node_color": palette[i]}
+                     for node, i in zip(nodes, rng.integers(0, 4, len(nodes)))}
+    return [tuple(cluster) for cluster in members if cluster], node_coloring
+
+
+def pairwise_cluster_graph(graph: nx.DiGraph,
+                           clusters: List[Tuple[str]],
+                           node_coloring: Dict[str, Dict[str, str]],
+                           max_pairs: int) -> int:
+    """
+    Original create_cluster_graph loop over cluster pairs, limited to
+    `max_pairs` pairs
+    """
+    cluster_graph = nx.DiGraph()
+    pairs = list(islice(combinations(range(len(clusters)), 2), max_pairs))
+
+    for group1_idx, group2_idx in pairs:
+        subgraph1 = graph.subgraph(clusters[group1_idx])
+        subgraph2 = graph.subgraph(clusters[group2_idx])
+        shared_edges = [(source, target) for source, target in graph.edges()
+                        if source in subgraph1 and target in subgraph1
+                        or source in subgraph2 and target in subgraph2]
+
+        if len(shared_edges) != 0:
+            cluster_graph.add_edge(group1_idx, group2_idx, weight=len(shared_edges))
+            group1_coloring = [node_coloring[node]["node_color"] for node in clusters[group1_idx]]
+            group2_coloring = [node_coloring[node]["node_color"] for node in clusters[group2_idx]]
+            nx.set_node_attributes(cluster_graph,
+                                   {group1_idx: max(set(group1_coloring), key=group1_coloring.count),
+                                    group2_idx: max(set(group2_coloring), key=group2_coloring.count)},
+                                   "color")
+        else:
+            cluster_graph.add_node(group1_idx)
+            cluster_graph.add_node(group2_idx)
+
+    return len(pairs)
+
+
+def benchmark_cluster_graph(cluster_counts: List[int],
+                            num_edges: int = 20_000,
+                            max_loop_pairs: int = 20) -> None:
+    """
+    build_cluster_graph against the original pairwise loop
+
+    The original loop scans every edge for each of the k(k - 1)/2 cluster
+    pairs, so it is timed on the first `max_loop_pairs` pairs and
+    extrapolated to all of them.
+    """
+    df = synthetic_edge_table(num_edges)
+    graph = table_graph(df)  # CompactGraph
+    nx_graph = to_networkx(graph)  # nx.DiGraph
+
+    print(f"{len(graph.nodes)} nodes, {len(graph.sources)} edges")
+    print("clusters\tpairwise (s)\tsingle pass (s)\tspeedup")
+    for num_clusters in cluster_counts:
+        clusters, node_coloring = synthetic_clusters(graph, num_clusters)
+        num_pairs = len(clusters) * (len(clusters) - 1) // 2  # int
+
+        single_pass = time_call(lambda: build_cluster_graph(graph, clusters, node_coloring))
+
+        timed: List[int] = []
+        pairwise = time_call(lambda: timed.append(
+            pairwise_cluster_graph(nx_graph, clusters, node_coloring, max_loop_pairs)))
+        pairwise = pairwise * num_pairs / timed[0]
+
+        print(f"{len(clusters)}\t{pairwise:.1f}*\t{single_pass:.4f}\t"
+              f"{pairwise / single_pass:.0f}x")
+    print(f"* extrapolated from the first {max_loop_pairs} cluster pairs")
+
+
+def peak_memory(function: Callable[[], object]) -> Tuple[float, int]:
+    """
+    Seconds taken by `function` and the peak memory it allocated in bytes
+    """
+    start()
+    seconds = time_call(function)  # float
+    _, peak = get_traced_memory()
+    stop()
+    return seconds, peak
+
+
+def benchmark_mcl(sizes: List[int], inflation: float = 5.0) -> None:
+    """
+    mcl.run_mcl against markov_clustering.run_mcl on random graphs
+
+    Also checks that both find the same clusters.
+    """
+    import markov_clustering as mc
+    from scipy.sparse import csr_matrix
+
+    print("edges\tnodes\tmarkov_clustering (s, MB)\tmcl (s, MB)\tsame clusters")
+    for size in sizes:
+        df = synthetic_edge_table(size)
+        graph = nx.from_pandas_edgelist(df, source="Bait", target="Prey",
+                                        create_using=nx.DiGraph)
+        matrix = nx.to_scipy_sparse_array(graph)  # csr_array
+
+        results: List[List[Tuple[int, ...]]] = []
+        old, old_peak = peak_memory(lambda: results.append(
+            mc.get_clusters(mc.run_mcl(csr_matrix(matrix), inflation=inflation))))
+        new, new_peak = peak_memory(lambda: results.append(
+            mcl_clusters(run_mcl(matrix, inflation=inflation))))
+
+        print(f"{graph.number_of_edges()}\t{graph.number_of_nodes()}\t"
+              f"{old:.2f}, {old_peak / 2**20:.0f}\t{new:.2f}, {new_peak / 2**20:.0f}\t"
+              f"{results[0] == results[1]}")
+
+
+def loop_cluster_complexes(df: DataFrame,
+                           clusters: List[Tuple[str]],
+                           max_clusters: int) -> int:
+    """
+    Original per-cluster loop of get_graph_statistics, limited to the first
+    `max_clusters` clusters
+    """
+    norm_bw_df = get_betweenness(normalized=True)  # DataFrame
+    complex_bw = {}  # Dict[str, float]
+    for cluster in clusters[:max_clusters]:
+        df_subset = df[df["Bait"].isin(cluster) | df["Prey"].isin(cluster)].copy()
+        complex_counts = df_subset["CORUM_complex_2022"].dropna().value_counts()
+        if complex_counts.shape[0] != 0:
+            proteins = df_subset[["Bait", "Prey"]].values.ravel()
+            protein_mask = norm_bw_df["protein"].isin(proteins)
+            complex_bw[complex_counts.idxmax()] = norm_bw_df[protein_mask]["bw_centrality"].median()
+    return min(len(clusters), max_clusters)
+
+
+def benchmark_cluster_complexes(resolutions: List[float], max_loop_clusters: int = 200) -> None:
+    """
+    get_cluster_complexes against the original per-cluster loop on the
+    interactome, with Louvain clusters at several resolutions
+
+    The loop is linear in the number of clusters, so it is timed on the
+    first `max_loop_clusters` clusters and extrapolated.
+    """
+    df = get_interactome()  # DataFrame
+    graph = nx.from_pandas_edgelist(df, source="Bait", target="Prey")  # nx.Graph
+
+    print("clusters\tloop (s)\tvectorized (s)\tspeedup")
+    for resolution in resolutions:
+        clusters = [tuple(cluster) for cluster in
+                    nx.community.louvain_communities(graph, resolution=resolution, seed=0)]
+
+        vectorized = time_call(lambda: get_cluster_complexes(df, clusters, 5))
+
+        timed: List[int] = []
+        loop = time_call(lambda: timed.append(
+            loop_cluster_complexes(df, clusters, max_loop_clusters)))
+        loop = loop * len(clusters) / timed[0]
+        estimate = "*" if timed[0] < len(clusters) else ""  # str
+
+        print(f"{len(clusters)}\t{loop:.2f}{estimate}\t{vectorized:.4f}\t"
+              f"{loop / vectorized:.0f}x")
+    print(f"* extrapolated from the first {max_loop_clusters} clusters")
+
+
+def list_payload(df: DataFrame, graph: CompactGraph, layout: Dict[str, ndarray]) -> Dict[str, List]:
+    """
+    Original list-of-lists multi_line columns of compute_edges, with colors
+    and dash patterns spelled out per edge
+    """
+    (edge_source, edge_target), _, colors, styles, _ = get_edges(df, graph, layout, 5e-5)
+    return dict(xs=column_stack([edge_source[:, 0], edge_target[:, 0]]).tolist(),
+                ys=column_stack([edge_source[:, 1], edge_target[:, 1]]).tolist(),
+                line_dash=[EDGE_DASH_PATTERNS[code] for code in styles],
+                line_color=[EDGE_PALETTE[code] for code in colors])
+
+
+def array_payload(df: DataFrame, graph: CompactGraph, layout: Dict[str, ndarray]) -> Dict[str, ndarray]:
+    """
+    Segment columns of compute_edges: float32 coordinates and uint8 codes
+    """
+    edges, _, colors, styles, _ = get_edges(df, graph, layout, 5e-5)
+    return dict(segment_data(*edges), dash=styles, color=colors)
+
+
+def benchmark_payload(sizes: List[int]) -> None:
+    """
+    Bytes Bokeh sends for the edge data source, and the time to build and
+    serialize it, for list columns against binary array columns
+
+    Only server-side work is timed; decoding and drawing in the browser
+    isn't measured.
+    """
+    print("edges	lists (JSON KB, s)	arrays (JSON KB + buffers KB, s)")
+    for size in sizes:
+        df = synthetic_edge_table(size)
+        graph = table_graph(df)  # CompactGraph
+        layout = random_layout(graph)
+
+        sizes_out: List[Tuple[int, int]] = []
+        old = time_call(lambda: sizes_out.append(
+            payload_nbytes(list_payload(df, graph, layout))))
+        new = time_call(lambda: sizes_out.append(
+            payload_nbytes(array_payload(df, graph, layout))))
+        (old_json, _), (new_json, new_buffers) = sizes_out
+
+        print(f"{len(graph.sources)}	{old_json / 1024:.0f}, {old:.3f}	"
+              f"{new_json / 1024:.0f} + {new_buffers / 1024:.0f}, {new:.3f}")
+
+
+def edge_length_ratio(layout: Dict[str, ndarray], graph: CompactGraph, seed: int = 0) -> float:
+    """
+    Mean edge length over mean distance between random pairs of nodes;
+    lower means neighbors are drawn closer together
+    """
+    rng = default_rng(seed)
+    positions = dict(layout)  # Dict[str, ndarray]
+    edge_lengths = [hypot(*(positions[source] - positions[target]))
+                    for source, target in edge_list(graph)]  # List[float]
+    nodes = list(positions.values())  # List[ndarray]
+    pairs = rng.integers(0, len(nodes), size=(10_000, 2))  # ndarray
+    pair_lengths = [hypot(*(nodes[i] - nodes[j])) for i, j in pairs]  # List[float]
+    return float(mean(edge_lengths) / mean(pair_lengths))
+
+
+def benchmark_layout(max_spring_nodes: int = 5_000) -> None:
+    """
+    multilevel_spring_layout against nx.spring_layout on the interactome and
+    the app's 1 to 3 hop neighborhoods of SNRNP200
+    """
+    adjacency = get_adjacency()  # Adjacency
+    graphs = [compact_graph(adjacency, expand_neighborhood(adjacency, ["SNRNP200"], hops), {})
+              for hops in (1, 2, 3)]  # List[CompactGraph]
+    graphs.append(compact_graph(adjacency, arange(len(adjacency.bait_ids)), {}))
+
+    print("nodes	edges	spring (s, edge ratio)	multilevel (s, edge ratio)")
+    for graph in graphs:
+        layouts: List[Dict[str, ndarray]] = []
+        new = time_call(lambda: layouts.append(multilevel_spring_layout(graph, seed=0)))
+        old_text = "-"  # str
+        if len(graph.nodes) <= max_spring_nodes:
+            old = time_call(lambda: layouts.append(nx.spring_layout(to_networkx(graph), seed=0)))
+            old_text = f"{old:.2f}, {edge_length_ratio(layouts[1], graph):.3f}"
+
+        print(f"{len(graph.nodes)}\t{len(graph.sources)}\t{old_text}\t"
+              f"{new:.2f}, {edge_length_ratio(layouts[0], graph):.3f}")
+
+
+def benchmark_graph(sizes: List[int]) -> None:
+    """
+    compact_graph against nx.from_pandas_edgelist, the graph each update
+    used to build, on random tables: seconds and peak memory to build the
+    graph of every row with its edge attributes
+
+    As in the app, the table's adjacency index is built once beforehand.
+    """
+    print("edges\tnetworkx (s, MB)\tcompact (s, MB)")
+    for size in sizes:
+        df = synthetic_edge_table(size)
+        adjacency = build_adjacency(df)  # Adjacency
+        rows = arange(df.shape[0])  # ndarray
+        edge_attr = ["edge_color", "edge_style"]  # List[str]
+
+        old, old_peak = peak_memory(lambda: nx.from_pandas_edgelist(
+            df, source="Bait", target="Prey", edge_attr=edge_attr, create_using=nx.DiGraph))
+        new, new_peak = peak_memory(lambda: compact_graph(
+            adjacency, rows, {name: df[name].to_numpy() for name in edge_attr}))
+
+        print(f"{size}\t{old:.3f}, {old_peak / 2**20:.1f}\t{new:.3f}, {new_peak / 2**20:.1f}")
+
+
+BENCHMARKS: Dict[str, Tuple[Callable[[], None], str]] = {
+    "edges": (lambda: benchmark_edges([1_000, 10_000, 100_000]),
+              "CORUM edge geometry (app.get_edges)"),
+    "cluster_graph": (lambda: benchmark_cluster_graph([50, 500, 5_000]),
+                      "cluster graph construction (clustering.build_cluster_graph)"),
+    "cluster_complexes": (lambda: benchmark_cluster_complexes([1.0, 10.0, 1000.0]),
+                          "top complexes of clusters (statistics.get_cluster_complexes)"),
+    "payload": (lambda: benchmark_payload([2_000, 20_000, 200_000]),
+                "edge data source sent to the browser (app.compute_edges)"),
+    "layout": (benchmark_layout,
+               "force-directed layout (layout.multilevel_spring_layout)"),
+    "graph": (lambda: benchmark_graph([10_000, 100_000, 500_000]),
+              "graph built for every update (app.build_graph)"),
+    "mcl": (lambda: benchmark_mcl([1_000, 10_000, 100_000]),
+            "Markov clustering (mcl.run_mcl)"),
+}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("names", nargs="*",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} "
+                             "(default: all)")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)  # Set[str]
+    if len(unknown) != 0:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    for name in args.names or list(BENCHMARKS):
+        function, description = BENCHMARKS[name]
+        print(f"== {name}: {description}")
+        function()
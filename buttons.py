@@ -1,32 +1,69 @@
 from bokeh.models import CheckboxButtonGroup, Button
 from enum import Enum
 
-# Generates the interactome based on the user's input
-create_interactome_button = Button(
-    label="Create Interactome",
-    button_type="success",
-    width_policy="max"
-)  # Button
-
-# Download button
-download_button = Button(
-    label="Download",
-    button_type="success",
-    width_policy="max"
-)  # Button
-
-# Checkbox buttons for selecting the dataset
-dataset_checkbox_button = CheckboxButtonGroup(labels=['IP', 'SEC'],
-                                              width_policy="max")
-interaction_support_checkbox_button = CheckboxButtonGroup(labels=['IP+SEC', 'CORUM'],
-                                                          width_policy="max")
-interaction_type_checkbox_button = CheckboxButtonGroup(labels=["Direct", "RNA mediated", "RNA shielded"],
-                                                       width_policy="max")
-
-all_buttons = [
-    create_interactome_button,
-    download_button,
-    dataset_checkbox_button,
-    interaction_support_checkbox_button,
-    interaction_type_checkbox_button
-]  # List[CheckboxButtonGroup]
+from typing import NamedTuple
+
+
+class Buttons(NamedTuple):
+    """
+    Buttons of one session's document
+    """
+    create_interactome_button: Button
+    download_button: Button
+    download_statistics_button: Button
+    stop_refinement_button: Button
+    dataset_checkbox_button: CheckboxButtonGroup
+    interaction_support_checkbox_button: CheckboxButtonGroup
+    interaction_type_checkbox_button: CheckboxButtonGroup
+
+
+def create_buttons() -> Buttons:
+    """
+    New buttons for a session; a Bokeh model can only belong to one document
+    """
+    # Generates the interactome based on the user's input
+    create_interactome_button = Button(
+        label="Create Interactome",
+        button_type="success",
+        width_policy="max"
+    )  # Button
+
+    # Download button
+    download_button = Button(
+        label="Download",
+        button_type="success",
+        width_policy="max"
+    )  # Button
+
+    # Downloads the graph statistics as JSON
+    download_statistics_button = Button(
+        label="Download Statistics",
+        button_type="success",
+        width_policy="max"
+    )  # Button
+
+    # Stops refining a progressive layout, only shown while one is refined
+    stop_refinement_button = Button(
+        label="Stop Refining Layout",
+        button_type="warning",
+        width_policy="max",
+        visible=False
+    )  # Button
+
+    # Checkbox buttons for selecting the dataset
+    dataset_checkbox_button = CheckboxButtonGroup(labels=['IP', 'SEC'],
+                                                  width_policy="max")
+    interaction_support_checkbox_button = CheckboxButtonGroup(labels=['IP+SEC', 'CORUM'],
+                                                              width_policy="max")
+    interaction_type_checkbox_button = CheckboxButtonGroup(labels=["Direct", "RNA mediated", "RNA shielded"],
+                                                           width_policy="max")
+
+    return Buttons(
+        create_interactome_button=create_interactome_button,
+        download_button=download_button,
+        download_statistics_button=download_statistics_button,
+        stop_refinement_button=stop_refinement_button,
+        dataset_checkbox_button=dataset_checkbox_button,
+        interaction_support_checkbox_button=interaction_support_checkbox_button,
+        interaction_type_checkbox_button=interaction_type_checkbox_button
+    )
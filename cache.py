@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from sys import getsizeof
+from threading import Lock
+
+from typing import Any, Callable, Dict, Hashable, Union
+
+
+def default_sizeof(value: Any) -> int:
+    """
+    Size of a cached value in bytes, using `nbytes` for NumPy arrays
+    """
+    return int(getattr(value, "nbytes", getsizeof(value)))
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by a memory budget
+
+    Entries are evicted oldest first once the summed size of the cached
+    values exceeds `max_bytes`. A single value larger than the budget is not
+    cached at all.
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 sizeof: Callable[[Any], int] = default_sizeof) -> None:
+        self.max_bytes = max_bytes  # int
+        self.sizeof = sizeof  # Callable[[Any], int]
+        self.hits = 0  # int
+        self.misses = 0  # int
+        self.evictions = 0  # int
+        self.nbytes = 0  # int
+        self._entries: OrderedDict = OrderedDict()  # key --> (value, size)
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Union[Any, None]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            value, _ = self._entries[key]
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)  # int
+
+        with self._lock:
+            if key in self._entries:
+                _, old_size = self._entries.pop(key)
+                self.nbytes -= old_size
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self.nbytes += size
+
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -1,60 +1,250 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_context
 from networkx.algorithms.community import louvain_communities
 import networkx as nx
-from scipy.sparse import csr_matrix
-import markov_clustering as mc
-from os import system
-from typing import List, Tuple, Dict, Union, Hashable, Any, Set
-from itertools import combinations
+from numpy import arange, asarray, empty, int32, int64, isnan, maximum, minimum, nan, repeat
+from pandas import DataFrame, Index, Series
+from json import dump, load
+from os import makedirs, replace
+from os.path import dirname, join
+from subprocess import TimeoutExpired, run
+from sys import getsizeof
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import List, Tuple, Dict, Union, Hashable
 from pdb import set_trace
 
+from cache import LRUCache
+from colors import GRAY
+from compact import CompactGraph, edge_list, graph_fingerprint, sparse_matrix, subgraph, to_networkx
+from mcl import mcl_clusters, run_mcl
+
 # Mypy type aliases for brevity
 NodeColoring = Dict[Hashable, Dict[str, str]]
 Clusters = List[Tuple[str]]
 ClusteredColoring = Tuple[Dict[Hashable, Dict[str, str]], Union[Clusters, None]]
 
+CLUSTER_ONE_JAR = join(dirname(__file__), "cluster_one-1.0.jar")
+
+# Seconds before a clusterONE run is killed
+CLUSTER_ONE_TIMEOUT: float = 300.0
+
+# Concurrent clusterONE JVMs across all sessions of the process
+CLUSTER_ONE_WORKERS: int = 2
+
+# Cluster assignments shared by every session, see `cluster_key`
+CLUSTER_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+# Cluster assignments are also written here so they survive restarts; set to
+# None to keep them in memory only
+CLUSTER_CACHE_DIRPATH: Union[str, None] = join(dirname(__file__), "cluster_cache")
+
+# Louvain is randomized; a fixed seed keeps cached clusters reproducible
+LOUVAIN_SEED: int = 0
+
+# Values of the clustering resolution slider, clustered ahead of time by
+# `sweep_resolutions`
+SWEEP_RESOLUTIONS: List[float] = [i / 10 for i in range(11)]
+
+# Processes clustering resolutions in parallel across all sessions
+SWEEP_WORKERS: int = 4
+
+
+def clusters_nbytes(clusters: Clusters) -> int:
+    """
+    Approximate memory held by a list of clusters of node names
+    """
+    return getsizeof(clusters) + sum(getsizeof(cluster) + sum(getsizeof(node) for node in cluster)
+                                     for cluster in clusters)
+
+
+cluster_cache = LRUCache(max_bytes=CLUSTER_CACHE_MAX_BYTES, sizeof=clusters_nbytes)
+cluster_one_executor = ThreadPoolExecutor(max_workers=CLUSTER_ONE_WORKERS,
+                                          thread_name_prefix="clusterONE")
+
+# Cluster key --> clusterONE job that hasn't finished yet
+_cluster_one_jobs: Dict[str, Future] = {}
+_cluster_one_lock = Lock()
+
+# Resolution sweeps shared by every session, keyed by (graph fingerprint,
+# method); the pool is only started by the first sweep
+sweep_cache = LRUCache(max_bytes=4 * 1024 * 1024)
+_sweep_pool: Union[ProcessPoolExecutor, None] = None
+_sweep_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sweep")
+_sweeps: Dict[Tuple[str, str], Future] = {}
+_sweep_lock = Lock()
+
+
+def cluster_key(graph: CompactGraph, method: str, res: float) -> str:
+    """
+    Content address of a clustering: graph fingerprint, method, resolution
+    """
+    # clusterONE has no resolution parameter
+    resolution = "" if method == "clusterONE" else f"{res:.3f}"  # str
+    return f"{graph_fingerprint(graph)}-{method}-{resolution}"
+
+
+def load_clusters(key: str) -> Union[Clusters, None]:
+    """
+    Looks up clusters in memory, then on disk, or returns None
+    """
+    clusters = cluster_cache.get(key)  # Union[Clusters, None]
+    if clusters is not None or CLUSTER_CACHE_DIRPATH is None:
+        return clusters
+
+    try:
+        with open(join(CLUSTER_CACHE_DIRPATH, f"{key}.json"), "r") as f:
+            clusters = [tuple(cluster) for cluster in load(f)]
+    except (OSError, ValueError):
+        return None
+
+    cluster_cache.put(key, clusters)
+    return clusters
+
+
+def save_clusters(key: str, clusters: Clusters) -> None:
+    cluster_cache.put(key, clusters)
+    if CLUSTER_CACHE_DIRPATH is None:
+        return
+
+    # Written under a temporary name so other processes never read half a file.
+    # A read-only checkout still works, it just keeps clusters in memory.
+    filepath = join(CLUSTER_CACHE_DIRPATH, f"{key}.json")  # str
+    try:
+        makedirs(CLUSTER_CACHE_DIRPATH, exist_ok=True)
+        with open(f"{filepath}.tmp", "w") as f:
+            dump([list(cluster) for cluster in clusters], f)
+        replace(f"{filepath}.tmp", filepath)
+    except OSError:
+        pass
+
+
+def run_cluster_one(edges: List[Tuple[str, str]],
+                    timeout: float = CLUSTER_ONE_TIMEOUT) -> Clusters:
+    """
+    Runs the clusterONE jar on an edge list in a private temporary directory
+
+    Clusters are parsed from the program's stdout, one tab-separated cluster
+    per line. Raises an Exception with clusterONE's stderr if it fails.
+    """
+    with TemporaryDirectory(prefix="clusterONE-") as job_dir:
+        input_file = join(job_dir, "edges.txt")  # str
+
+        # Need to write edgelist in bytes for clusterONE
+        with open(input_file, "wb") as f:
+            nx.write_edgelist(nx.DiGraph(edges), f, data=False)  # None
+
+        try:
+            process = run(["java", "-jar", CLUSTER_ONE_JAR, input_file],
+                          cwd=job_dir,
+                          capture_output=True,
+                          text=True,
+                          timeout=timeout)
+        except FileNotFoundError:
+            message = "clusterONE requires Java, see README.md"
+            raise Exception(message)
+        except TimeoutExpired:
+            message = f"clusterONE did not finish within {timeout:g}s"
+            raise Exception(message)
+
+    if process.returncode != 0:
+        message = f"clusterONE exited with status {process.returncode}: {process.stderr.strip()}"
+        raise Exception(message)
+
+    return [tuple(node for node in line.split("\t") if node != "")
+            for line in process.stdout.splitlines() if line.strip() != ""]
+
+
+def finish_cluster_one(key: str, job: Future) -> None:
+    """
+    Moves a finished job's clusters into the cache; failed jobs are dropped
+    so the next request retries them
+    """
+    with _cluster_one_lock:
+        if not job.cancelled() and job.exception() is None:
+            save_clusters(key, job.result())
+        _cluster_one_jobs.pop(key, None)
+
+
+def submit_cluster_one(graph: CompactGraph) -> Future:
+    """
+    Returns a future of the clusterONE clusters of `graph`
+
+    The future is already resolved when the clusters are cached. Otherwise
+    clusterONE runs in a worker thread, and concurrent requests for the same
+    graph share a single job.
+    """
+    key = cluster_key(graph, "clusterONE", 0.0)  # str
+
+    with _cluster_one_lock:
+        clusters = load_clusters(key)  # Union[Clusters, None]
+        if clusters is not None:
+            job = Future()  # Future
+            job.set_result(clusters)
+            return job
+
+        job = _cluster_one_jobs.get(key)
+        submitted = job is None  # bool
+        if submitted:
+            job = cluster_one_executor.submit(run_cluster_one, edge_list(graph))
+            _cluster_one_jobs[key] = job
+
+    # Outside the lock, since the callback runs here if the job already ended
+    if submitted:
+        job.add_done_callback(lambda job: finish_cluster_one(key, job))
+
+    return job
+
 
-def generate_clusters(graph: nx.Graph,
+def generate_clusters(graph: CompactGraph,
                       method: str,
                       res: float) -> Clusters:
     """
     Create node clusters based on a graph, clustering method, and resolution
+
+    Clusters are cached by `cluster_key`, so a graph that was clustered
+    before with the same method and resolution isn't clustered again.
+    """
+    if method == "clusterONE":
+        # Runs in the clusterONE worker pool; the app waits for it without
+        # blocking (see submit_cluster_one), so this is usually a cache hit
+        return submit_cluster_one(graph).result()
+
+    key = cluster_key(graph, method, res)  # str
+    clusters = load_clusters(key)  # Union[Clusters, None]
+    if clusters is None:
+        clusters = run_clustering(graph, method, res)
+        save_clusters(key, clusters)
+
+    return clusters
+
+
+def run_clustering(graph: CompactGraph,
+                   method: str,
+                   res: float) -> Clusters:
+    """
+    Clusters `graph` with louvain or markov, without caching
     """
     print(f"Performing {method} clustering")
 
     if method == "louvain":
         res = 1 + (5 * res)
-        raw_clusters = louvain_communities(graph,
-                                           resolution=res)  # List[Set[str]]
+        raw_clusters = louvain_communities(to_networkx(graph),
+                                           resolution=res,
+                                           seed=LOUVAIN_SEED)  # List[Set[str]]
         clusters = [tuple(cluster)
                     for cluster in raw_clusters]  # Clusters
     elif method == "markov":
-        array = nx.to_scipy_sparse_array(graph)  # csr_array
-        matrix = csr_matrix(array)  # csr_matrix
+        matrix = sparse_matrix(graph)  # csr_array
 
         # TODO: Figure out why these parameters were chosen
         inflation = 5.0 + (res * 1.5)
-        result = mc.run_mcl(matrix, inflation=inflation)  # csc_matrix
-        index_clusters = mc.get_clusters(result)  # List[Tuple[int]]
+        result = run_mcl(matrix, inflation=inflation)  # csc_matrix
+        index_clusters = mcl_clusters(result)  # List[Tuple[int, ...]]
 
-        # Output is by node index so we need to convert to node names
-        node_map = dict(enumerate(graph.nodes()))  # Dict[int, str]
-        clusters = [tuple(node_map[idx] for idx in c)
+        # Output is by node number so we need to convert to node names
+        clusters = [tuple(graph.nodes[list(c)])
                     for c in index_clusters]  # Clusters
-    elif method == "clusterONE":
-        # Need to write edgelist in bytes for clusterONE
-        input_file = "data.txt"  # str
-        output_file = "clusters.txt"  # str
-        with open(input_file, "wb") as f:
-            nx.write_edgelist(graph, f, data=False)  # None
-
-        base_command = "java -jar cluster_one-1.0.jar"  # str
-        full_command = f"{base_command} {input_file} > {output_file}"  # str
-        system(full_command)  # None
-
-        # Since clusterONE is a CLI program, we need to parse the output
-        with open("clusters.txt", "r") as f:
-            lines = f.readlines()  # List[str]
-            clusters = [tuple(line.split("\t")) for line in lines]  # Clusters
     else:
         message = "Supported clustering values: louvain, markov, clusterONE"
         raise Exception(message)
@@ -62,62 +252,191 @@ def generate_clusters(graph: nx.Graph,
     return clusters
 
 
-def get_edges_between_subgraphs(graph: nx.DiGraph,
-                                group1: Tuple[str],
-                                group2: Tuple[str]) -> List[Tuple[Any, Any]]:
-    subgraph1 = graph.subgraph(group1)
-    subgraph2 = graph.subgraph(group2)
+def sweep_worker(graph: CompactGraph,
+                 method: str,
+                 res: float,
+                 clusters: Union[Clusters, None]) -> Tuple[Clusters, float]:
+    """
+    Runs in a sweep process: clusters the graph unless `clusters` is given,
+    and scores the clusters by modularity
+    """
+    if clusters is None:
+        clusters = run_clustering(graph, method, res)
+
+    # Overlapping (markov) clusters aren't a partition, so have no modularity
+    try:
+        modularity = nx.community.modularity(to_networkx(graph), [set(c) for c in clusters])  # float
+    except nx.NetworkXError:
+        modularity = nan
+
+    return clusters, modularity
 
-    shared_edges = [(source, target) for source, target in graph.edges()
-                    if source in subgraph1 and target in subgraph1
-                    or source in subgraph2 and target in subgraph2]
 
-    return shared_edges
+def run_sweep(graph: CompactGraph, method: str) -> DataFrame:
+    """
+    Clusters `graph` at every slider resolution in the process pool
 
+    Clusters go into the cluster cache as each resolution finishes.
+    """
+    global _sweep_pool
 
-def create_cluster_graph(graph: nx.DiGraph,
-                         method: str,
-                         res: float,
-                         node_coloring: NodeColoring) -> Tuple[nx.DiGraph, Dict[int, str]]:
+    with _sweep_lock:
+        if _sweep_pool is None:
+            # Spawned, since forking a process that runs threads can deadlock
+            _sweep_pool = ProcessPoolExecutor(max_workers=SWEEP_WORKERS,
+                                              mp_context=get_context("spawn"))
 
-    # Only cluster nodes for which we have color information
-    colored_nodes: Set[str] = set(node_coloring.keys())
-    graph_nodes: Set[str] = set(graph.nodes())
-    nodes_to_cluster: Set[str] = colored_nodes.intersection(graph_nodes)
-    colored_subgraph: nx.DiGraph = graph.subgraph(nodes_to_cluster)
+    # The graph's arrays pickle far smaller than networkx dictionaries
+    jobs: Dict[Future, float] = {}
+    for res in SWEEP_RESOLUTIONS:
+        clusters = load_clusters(cluster_key(graph, method, res))  # Union[Clusters, None]
+        jobs[_sweep_pool.submit(sweep_worker, graph, method, res, clusters)] = res
 
-    # Generate list of node clusters based on the method
-    clusters: List[Tuple[str]] = generate_clusters(graph=colored_subgraph, res=res, method=method)
-    cluster_indices: List[int] = [i for i in range(len(clusters))]
-    cluster_pairs: List[Tuple[int, int]] = [combo for combo in combinations(cluster_indices, 2)]
-    cluster_graph: nx.DiGraph = nx.DiGraph()
+    rows = []  # List[Tuple[float, int, float]]
+    for job in as_completed(jobs):
+        res = jobs[job]  # float
+        clusters, modularity = job.result()
+        save_clusters(cluster_key(graph, method, res), clusters)
+        rows.append((res, len(clusters), modularity))
+
+    summary = DataFrame(rows, columns=["resolution", "clusters", "modularity"])
+    return summary.sort_values("resolution", ignore_index=True)
+
+
+def sweep_resolutions(graph: CompactGraph, method: str) -> Future:
+    """
+    Returns a future of the per-resolution summary of clustering `graph`
+
+    The summary is a (resolution, clusters, modularity) table. Sweeps run in
+    the background, and concurrent requests for the same graph and method
+    share one sweep.
+    """
+    if method not in ("louvain", "markov"):
+        message = "Resolution sweeps support: louvain, markov"
+        raise Exception(message)
 
-    # For every cluster pair in n Choose 2, determine the edge and its attributes
-    for group1_idx, group2_idx in cluster_pairs:
-        shared_edges = get_edges_between_subgraphs(graph,
-                                                   clusters[group1_idx],
-                                                   clusters[group2_idx])
+    key = (graph_fingerprint(graph), method)  # Tuple[str, str]
 
-        if len(shared_edges) != 0:
-            cluster_graph.add_edge(group1_idx, group2_idx, weight=len(shared_edges))
+    with _sweep_lock:
+        summary = sweep_cache.get(key)  # Union[DataFrame, None]
+        if summary is not None:
+            sweep = Future()  # Future
+            sweep.set_result(summary)
+            return sweep
 
-            group1_coloring = [node_coloring[node]["node_color"] for node in clusters[group1_idx]]
-            group2_coloring = [node_coloring[node]["node_color"] for node in clusters[group2_idx]]
+        sweep = _sweeps.get(key)
+        submitted = sweep is None  # bool
+        if submitted:
+            sweep = _sweep_executor.submit(run_sweep, graph, method)
+            _sweeps[key] = sweep
 
-            group1_majority_color = max(set(group1_coloring), key=group1_coloring.count)
-            group2_majority_color = max(set(group2_coloring), key=group2_coloring.count)
+    if submitted:
+        sweep.add_done_callback(lambda sweep: finish_sweep(key, sweep))
 
-            size_attr = {group1_idx: len(clusters[group1_idx]),
-                         group2_idx: len(clusters[group2_idx])}
+    return sweep
 
-            color_attr = {group1_idx: group1_majority_color,
-                          group2_idx: group2_majority_color}
 
-            nx.set_node_attributes(cluster_graph, size_attr, "size")
-            nx.set_node_attributes(cluster_graph, color_attr, "color")
-        else:
-            cluster_graph.add_node(group1_idx)
-            cluster_graph.add_node(group2_idx)
+def finish_sweep(key: Tuple[str, str], sweep: Future) -> None:
+    with _sweep_lock:
+        if not sweep.cancelled() and sweep.exception() is None:
+            sweep_cache.put(key, sweep.result())
+        _sweeps.pop(key, None)
 
-    nodes_per_cluster = {idx: clusters[idx] for idx in cluster_graph.nodes()}
+
+def format_sweep(summary: DataFrame, method: str) -> str:
+    """
+    Formats a resolution sweep summary to print next to the graph
+    """
+    lines = [f"Resolution Sweep ({method}):",
+             "Resolution  Clusters  Modularity"]  # List[str]
+    for res, num_clusters, modularity in summary.itertuples(index=False):
+        score = "n/a" if isnan(modularity) else f"{modularity:.3f}"  # str
+        lines.append(f"{res:<10.1f}  {num_clusters:<8d}  {score}")
+    return "\n".join(lines)
+
+
+def cluster_memberships(clusters: Clusters) -> DataFrame:
+    """
+    One (node, cluster) row per cluster member, clusters numbered by position
+    """
+    sizes = [len(cluster) for cluster in clusters]  # List[int]
+    nodes = [node for cluster in clusters for node in cluster]  # List[str]
+    return DataFrame({"node": Series(nodes, dtype=object),
+                      "cluster": repeat(arange(len(clusters)), sizes)})
+
+
+def build_cluster_graph(graph: CompactGraph,
+                        clusters: Clusters,
+                        node_coloring: NodeColoring) -> Tuple[CompactGraph, Dict[int, str]]:
+    """
+    Collapses every cluster of `graph` into a single node in one pass
+
+    Cluster i --> j (i < j) is weighted by the number of edges of `graph`
+    with one end in each cluster. Every cluster node gets its size and the
+    majority color of its members, as the "size" and "color" node data.
+    """
+    memberships = cluster_memberships(clusters)  # DataFrame
+    numbers = DataFrame({"number": graph.nodes.get_indexer(memberships["node"]),
+                         "cluster": memberships["cluster"]})  # DataFrame
+
+    # Map every edge to (source cluster, target cluster) pairs. A node in
+    # several clusters (clusterONE allows overlaps) joins each of them.
+    edges = DataFrame({"source": graph.sources.astype(int64),
+                       "target": graph.targets.astype(int64)})  # DataFrame
+    edges = edges.merge(numbers.rename(columns={"number": "source",
+                                                "cluster": "source_cluster"}),
+                        on="source")
+    edges = edges.merge(numbers.rename(columns={"number": "target",
+                                                "cluster": "target_cluster"}),
+                        on="target")
+    source_clusters = edges["source_cluster"].to_numpy()  # ndarray
+    target_clusters = edges["target_cluster"].to_numpy()  # ndarray
+    between = source_clusters != target_clusters  # ndarray
+
+    weights = DataFrame({"low": minimum(source_clusters, target_clusters)[between],
+                         "high": maximum(source_clusters, target_clusters)[between]})
+    weights = weights.groupby(["low", "high"]).size()  # Series
+
+    # Most common member color per cluster, ties going to the color seen first
+    memberships["color"] = [node_coloring[node]["node_color"]
+                            for node in memberships["node"]]
+    color_counts = memberships.groupby(["cluster", "color"], sort=False).size()
+    color_counts = color_counts.sort_values(ascending=False, kind="stable")
+    majority = color_counts.reset_index().drop_duplicates("cluster")  # DataFrame
+    majority_colors = dict(zip(majority["cluster"], majority["color"]))  # Dict[int, str]
+
+    # Cluster graphs are numbered by cluster and weighted by shared edges
+    num_clusters = len(clusters)  # int
+    cluster_graph = CompactGraph(
+        nodes=Index(range(num_clusters)),
+        node_ids=arange(num_clusters),
+        sources=weights.index.get_level_values("low").to_numpy().astype(int32),
+        targets=weights.index.get_level_values("high").to_numpy().astype(int32),
+        node_data={"size": asarray([len(cluster) for cluster in clusters], dtype=int64),
+                   "color": asarray([majority_colors.get(idx, GRAY) for idx in range(num_clusters)],
+                                    dtype=object)},
+        edge_data={"weight": weights.to_numpy()},
+        row_edges=empty(0, dtype=int64),
+    )  # CompactGraph
+
+    nodes_per_cluster = {idx: clusters[idx] for idx in range(num_clusters)}
     return cluster_graph, nodes_per_cluster
+
+
+def colored_subgraph(graph: CompactGraph, node_coloring: NodeColoring) -> CompactGraph:
+    """
+    Only cluster nodes for which we have color information
+    """
+    return subgraph(graph, graph.nodes.isin(list(node_coloring.keys())))
+
+
+def create_cluster_graph(graph: CompactGraph,
+                         method: str,
+                         res: float,
+                         node_coloring: NodeColoring) -> Tuple[CompactGraph, Dict[int, str]]:
+
+    # Generate list of node clusters based on the method
+    clusters: List[Tuple[str]] = generate_clusters(graph=colored_subgraph(graph, node_coloring),
+                                                   res=res,
+                                                   method=method)
+    return build_cluster_graph(graph, clusters, node_coloring)
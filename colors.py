@@ -1,5 +1,7 @@
 from enum import Enum
 
+from typing import List
+
 GRAY = "#808080"
 PPI_SUPPORT = "#39B54A"
 
@@ -17,6 +19,15 @@ class EdgeColors(Enum):
 #     undetermined: DashPattern = DashPattern([1, 1])
 
 
+# Edges are sent to the browser with indices into these lists, resolved by a
+# client-side transform (see payload.py)
+EDGE_PALETTE: List[str] = [EdgeColors.IP.value, EdgeColors.SEC.value,
+                           EdgeColors.Both.value, GRAY]
+# Dash patterns are [dash, gap], [] is solid. The last one is for edges
+# without an interaction type, which are drawn solid like direct ones.
+EDGE_DASH_PATTERNS: List[List[int]] = [[], [8, 4], [5, 20], [1, 1], []]
+
+
 class LifecycleColors(Enum):
     decay: str = "#BE1E2D"
     export: str = "#2CB56B"
@@ -0,0 +1,160 @@
+from hashlib import blake2b
+
+import networkx as nx
+from numpy import arange, argsort, column_stack, cumsum, full, int32, int64, lexsort
+from numpy import maximum, ndarray, ones, searchsorted, unique, where
+from pandas import DataFrame, Index
+from scipy.sparse import csr_array
+
+from adjacency import Adjacency, build_adjacency
+
+from typing import Dict, Hashable, List, NamedTuple, Sequence, Tuple, Union
+
+
+class CompactGraph(NamedTuple):
+    """
+    Directed graph held in NumPy arrays instead of networkx dictionaries
+
+    Nodes are numbered 0..N-1 in order of first appearance, as
+    nx.from_pandas_edgelist would add them. Edges are (source, target) pairs
+    of node numbers in COO form, listed in the order networkx would list
+    them, with one array per edge attribute in `edge_data` and per node
+    attribute in `node_data`. Use `to_networkx` or `sparse_matrix` for
+    third-party algorithms.
+    """
+    nodes: Index  # node number --> label
+    node_ids: ndarray  # node number --> protein id of Adjacency, or cluster number
+    sources: ndarray  # edge --> source node number
+    targets: ndarray  # edge --> target node number
+    node_data: Dict[str, ndarray]
+    edge_data: Dict[str, ndarray]
+    row_edges: ndarray  # row of the table the graph was built from --> edge, or -1
+
+
+def compact_graph(adjacency: Adjacency,
+                  rows: ndarray,
+                  edge_data: Dict[str, ndarray]) -> CompactGraph:
+    """
+    Graph of the bait --> prey edges of `rows`, positions in the table
+    `adjacency` indexes
+
+    Proteins keep their ids in `adjacency`, so no protein names are hashed.
+    `edge_data` columns are aligned with `rows`; a pair on several rows keeps
+    the values of its last row, as with nx.from_pandas_edgelist. Rows with a
+    missing bait or prey have no edge.
+    """
+    bait_ids = adjacency.bait_ids[rows]  # ndarray
+    prey_ids = adjacency.prey_ids[rows]  # ndarray
+    has_edge = (bait_ids >= 0) & (prey_ids >= 0)  # ndarray
+    positions = has_edge.nonzero()[0]  # ndarray
+
+    # Number the proteins by first appearance, bait before prey on each row
+    ends = column_stack([bait_ids[positions], prey_ids[positions]]).ravel()  # ndarray
+    ids, first = unique(ends, return_index=True)
+    order = argsort(first, kind="stable")  # ndarray
+    numbers = full(len(ids), 0, dtype=int64)  # ndarray
+    numbers[order] = arange(len(ids))
+    sources = numbers[searchsorted(ids, bait_ids[positions])]  # ndarray
+    targets = numbers[searchsorted(ids, prey_ids[positions])]  # ndarray
+
+    # networkx lists the edges by source node, then in order of appearance
+    pairs, first_rows, inverse = unique(sources * len(ids) + targets,
+                                        return_index=True, return_inverse=True)
+    edge_order = lexsort((first_rows, pairs // max(len(ids), 1)))  # ndarray
+    edge_numbers = full(len(pairs), 0, dtype=int64)  # ndarray
+    edge_numbers[edge_order] = arange(len(pairs))
+
+    row_edges = full(len(bait_ids), -1, dtype=int64)  # ndarray
+    row_edges[positions] = edge_numbers[inverse.ravel()]
+    last_rows = full(len(pairs), -1, dtype=int64)  # ndarray
+    maximum.at(last_rows, row_edges[positions], positions)
+
+    pairs = pairs[edge_order]
+    return CompactGraph(nodes=adjacency.proteins[ids[order]],
+                        node_ids=ids[order],
+                        sources=(pairs // max(len(ids), 1)).astype(int32),
+                        targets=(pairs % max(len(ids), 1)).astype(int32),
+                        node_data={},
+                        edge_data={name: values[last_rows] for name, values in edge_data.items()},
+                        row_edges=row_edges)
+
+
+def table_graph(df: DataFrame, edge_attr: Sequence[str] = ()) -> CompactGraph:
+    """
+    Graph of every bait --> prey row of a table, with the columns in
+    `edge_attr` as edge attributes
+    """
+    return compact_graph(build_adjacency(df),
+                         arange(df.shape[0]),
+                         {name: df[name].to_numpy() for name in edge_attr})
+
+
+def subgraph(graph: CompactGraph, mask: ndarray) -> CompactGraph:
+    """
+    Subgraph induced by the nodes in boolean `mask`, in the same order
+    """
+    numbers = cumsum(mask) - 1  # ndarray
+    kept = mask[graph.sources] & mask[graph.targets]  # ndarray
+    edge_numbers = where(kept, cumsum(kept) - 1, -1)  # ndarray
+    row_edges = graph.row_edges  # ndarray
+    return CompactGraph(nodes=graph.nodes[mask],
+                        node_ids=graph.node_ids[mask],
+                        sources=numbers[graph.sources[kept]].astype(int32),
+                        targets=numbers[graph.targets[kept]].astype(int32),
+                        node_data={name: values[mask] for name, values in graph.node_data.items()},
+                        edge_data={name: values[kept] for name, values in graph.edge_data.items()},
+                        row_edges=where(row_edges >= 0, edge_numbers[row_edges], -1))
+
+
+def edge_list(graph: CompactGraph) -> List[Tuple[Hashable, Hashable]]:
+    return list(zip(graph.nodes[graph.sources], graph.nodes[graph.targets]))
+
+
+def sparse_matrix(graph: CompactGraph, weight: Union[str, None] = None) -> csr_array:
+    """
+    N x N adjacency matrix in node order, like nx.to_scipy_sparse_array:
+    edges without a `weight` attribute weigh 1
+    """
+    num_nodes = len(graph.nodes)  # int
+    values = graph.edge_data.get(weight) if weight is not None else None  # Union[ndarray, None]
+    if values is None:
+        values = ones(len(graph.sources))
+    return csr_array((values, (graph.sources, graph.targets)), shape=(num_nodes, num_nodes))
+
+
+def to_networkx(graph: CompactGraph) -> nx.DiGraph:
+    """
+    The same graph as an nx.DiGraph, for algorithms that need one
+    """
+    node_attributes = [dict(zip(graph.node_data.keys(), values))
+                       for values in zip(*[values.tolist() for values in graph.node_data.values()])]
+    edge_attributes = [dict(zip(graph.edge_data.keys(), values))
+                       for values in zip(*[values.tolist() for values in graph.edge_data.values()])]
+
+    nx_graph = nx.DiGraph()
+    nx_graph.add_nodes_from(zip(graph.nodes, node_attributes) if graph.node_data else graph.nodes)
+    if graph.edge_data:
+        nx_graph.add_edges_from((source, target, attributes) for (source, target), attributes
+                                in zip(edge_list(graph), edge_attributes))
+    else:
+        nx_graph.add_edges_from(edge_list(graph))
+    return nx_graph
+
+
+def graph_fingerprint(graph: CompactGraph) -> str:
+    """
+    Hash of the node set and edge set of a graph, independent of their order
+
+    Equal to the fingerprint of the same nx.DiGraph in earlier versions, so
+    clusters saved on disk stay valid.
+    """
+    nodes = sorted(str(node) for node in graph.nodes)  # List[str]
+    edges = sorted(f"{source}\t{target}"
+                   for source, target in edge_list(graph))  # List[str]
+
+    digest = blake2b(digest_size=16)
+    digest.update(b"True")  # Directed, as the nx.DiGraph was
+    digest.update("\n".join(nodes).encode())
+    digest.update(b"\n\n")
+    digest.update("\n".join(edges).encode())
+    return digest.hexdigest()
@@ -1,77 +1,145 @@
 from bokeh.models.widgets.inputs import Checkbox, TextInput
 from bokeh.models.widgets import Slider, Select
-from bokeh.models import PreText
-import buttons
-
-# Toggle for whether to display the labels on nodes
-apply_labels_checkbox = Checkbox(active=False, label='LABELS')  # Checkbox
-
-# Toggle for whether to use normalized or unnormalized betweenness centrality values
-use_normalized_betweenness = Checkbox(active=False, label='Use Normalized Betweenness')
-
-# Field for entering a specific protein name by user
-protein_text_input = TextInput(title="Protein", width_policy="max")  # TextInput
-
-# Clustering options
-graph_clustering_selection = Select(
-    title="Clustering method",
-    options=[
-        'no clustering',
-        'louvain',
-        'markov',
-        'clusterONE'
-    ],
-    value="no clustering",
-    width_policy="max"
-)
-
-# Clustering resolution
-clustering_resolution = Slider(
-    title="Clustering resolution",
-    value=0.0,
-    start=0.0,
-    end=1.0,
-    step=0.1,
-    width_policy="max"
-)
-
-# Overlay options
-node_coloring_selection = Select(
-    title="Color node by",
-    options=[
-        'none',
-        'lifecycle stage',
-        'location',
-        'disease'
-    ],
-    value="none",
-    width_policy="max"
-)
-
-num_neighbors_selection = Select(
-    title="Number of Neighbors",
-    options=[
-        "1",
-        "2",
-        "3"
-    ],
-    value="1",
-    width_policy="max"
-)
-
-all_controls = [
-    PreText(text="Source", width_policy="max"),
-    buttons.dataset_checkbox_button,
-    PreText(text="Interaction Support", width_policy="max"),
-    buttons.interaction_support_checkbox_button,
-    buttons.interaction_type_checkbox_button,
-    protein_text_input,
-    num_neighbors_selection,
-    graph_clustering_selection,
-    clustering_resolution,
-    node_coloring_selection,
-    apply_labels_checkbox,
-    use_normalized_betweenness,
-    buttons.create_interactome_button,
-    buttons.download_button,
-]
+from bokeh.models import Model, PreText
+from buttons import Buttons
+
+from typing import List, NamedTuple
+
+
+class Controls(NamedTuple):
+    """
+    Input widgets of one session's document
+    """
+    apply_labels_checkbox: Checkbox
+    use_normalized_betweenness: Checkbox
+    client_filtering_checkbox: Checkbox
+    protein_text_input: TextInput
+    layout_selection: Select
+    graph_clustering_selection: Select
+    clustering_resolution: Slider
+    sweep_resolutions_checkbox: Checkbox
+    node_coloring_selection: Select
+    num_neighbors_selection: Select
+
+
+def create_controls() -> Controls:
+    """
+    New input widgets for a session; a Bokeh model can only belong to one
+    document
+    """
+    # Toggle for whether to display the labels on nodes
+    apply_labels_checkbox = Checkbox(active=False, label='LABELS')  # Checkbox
+
+    # Toggle for whether to use normalized or unnormalized betweenness centrality values
+    use_normalized_betweenness = Checkbox(active=False, label='Use Normalized Betweenness')
+
+    # Toggle for applying the source and interaction type toggles in the browser
+    # to a network holding every source and type, instead of on the server
+    client_filtering_checkbox = Checkbox(active=False, label='Filter sources and types in browser')
+
+    # Field for entering a specific protein name by user
+    protein_text_input = TextInput(title="Protein", width_policy="max")  # TextInput
+
+    # Layout options ("global coordinates" needs `python layout.py` to be run first)
+    layout_selection = Select(
+        title="Layout",
+        options=[
+            'spring',
+            'multilevel',
+            'progressive',
+            'global coordinates'
+        ],
+        value="spring",
+        width_policy="max"
+    )
+
+    # Clustering options
+    graph_clustering_selection = Select(
+        title="Clustering method",
+        options=[
+            'no clustering',
+            'louvain',
+            'markov',
+            'clusterONE'
+        ],
+        value="no clustering",
+        width_policy="max"
+    )
+
+    # Clustering resolution
+    clustering_resolution = Slider(
+        title="Clustering resolution",
+        value=0.0,
+        start=0.0,
+        end=1.0,
+        step=0.1,
+        width_policy="max"
+    )
+
+    # Toggle for clustering every resolution in the background, so moving the
+    # resolution slider only looks up clusters
+    sweep_resolutions_checkbox = Checkbox(active=False, label='Precompute all resolutions')
+
+    # Overlay options
+    node_coloring_selection = Select(
+        title="Color node by",
+        options=[
+            'none',
+            'lifecycle stage',
+            'location',
+            'disease'
+        ],
+        value="none",
+        width_policy="max"
+    )
+
+    num_neighbors_selection = Select(
+        title="Number of Neighbors",
+        options=[
+            "1",
+            "2",
+            "3"
+        ],
+        value="1",
+        width_policy="max"
+    )
+
+    return Controls(
+        apply_labels_checkbox=apply_labels_checkbox,
+        use_normalized_betweenness=use_normalized_betweenness,
+        client_filtering_checkbox=client_filtering_checkbox,
+        protein_text_input=protein_text_input,
+        layout_selection=layout_selection,
+        graph_clustering_selection=graph_clustering_selection,
+        clustering_resolution=clustering_resolution,
+        sweep_resolutions_checkbox=sweep_resolutions_checkbox,
+        node_coloring_selection=node_coloring_selection,
+        num_neighbors_selection=num_neighbors_selection
+    )
+
+
+def all_controls(controls: Controls, buttons: Buttons) -> List[Model]:
+    """
+    Widgets of the control column, top to bottom
+    """
+    return [
+        PreText(text="Source", width_policy="max"),
+        buttons.dataset_checkbox_button,
+        PreText(text="Interaction Support", width_policy="max"),
+        buttons.interaction_support_checkbox_button,
+        buttons.interaction_type_checkbox_button,
+        controls.client_filtering_checkbox,
+        controls.protein_text_input,
+        controls.num_neighbors_selection,
+        controls.layout_selection,
+        controls.graph_clustering_selection,
+        controls.clustering_resolution,
+        controls.sweep_resolutions_checkbox,
+        controls.node_coloring_selection,
+        controls.apply_labels_checkbox,
+        controls.use_normalized_betweenness,
+        buttons.create_interactome_button,
+        buttons.stop_refinement_button,
+        buttons.download_button,
+        buttons.download_statistics_button,
+    ]
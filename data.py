@@ -1,16 +1,27 @@
 # from bokeh.core.properties import DashPattern
 from enum import Enum
-from pandas import DataFrame, concat, Series
-from matplotlib.pyplot import cm
-from numpy import nan
+from pandas import CategoricalDtype, DataFrame, Index, concat, Series
+from matplotlib import colormaps
+from matplotlib.colors import Colormap
+from numpy import asarray, full, nan, ndarray, ones, uint8, where, zeros
+
+from adjacency import Adjacency, build_adjacency, expand_neighborhood, traverse
+from buttons import Buttons
+from colors import EDGE_PALETTE, EdgeColors, GRAY, LifecycleColorsDict, LifecycleColors
+from cache import LRUCache
+from controls import Controls
+
+from typing import Dict, Hashable, List, NamedTuple, Set, Tuple, Union
+from pdb import set_trace
 
-from buttons import interaction_support_checkbox_button, dataset_checkbox_button
-from buttons import interaction_type_checkbox_button
-from colors import EdgeColors, LifecycleColorsDict, LifecycleColors
-import controls
 
-from typing import Dict, Hashable, List, Set, Union
-from pdb import set_trace
+# (datasets, IP+SEC toggle, interaction types, proteins, number of neighbors)
+FilterState = Tuple[Tuple[int, ...], bool, Tuple[int, ...],
+                    Union[Tuple[str, ...], None], int]
+
+# Filtered row positions are cached per filter state for all sessions
+FILTER_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+filter_cache = LRUCache(max_bytes=FILTER_CACHE_MAX_BYTES)
 
 
 class Dataset(Enum):
@@ -82,20 +93,13 @@ def rgba_to_hex(r, g, b, a) -> str:
     return hex_color
 
 
-def subset_by_node_type(df: DataFrame) -> DataFrame:
+def subset_by_node_type(df: DataFrame, state: FilterState) -> DataFrame:
     """
     Return the baits corresponding to the dataset the user selected via
-    `dataset_checkbox_button` and `interaction_support_checkbox_button`
+    `dataset_checkbox_button` and `interaction_support_checkbox_button`,
+    as recorded in `state`
     """
-
-    # Each type of interaction has a color
-    df["edge_color"] = df["IP_interaction_type"].map({
-        "IP": EdgeColors.IP.value,
-        "SEC": EdgeColors.SEC.value,
-        "both": EdgeColors.Both.value
-    })
-    datasets: List[int] = dataset_checkbox_button.active
-    ip_and_sec_toggle: List[int] = interaction_support_checkbox_button.active
+    datasets, ip_and_sec, _, _, _ = state
 
     # Group combinations of toggles
     ip_bool: bool = Dataset.IP.value in datasets
@@ -104,7 +108,6 @@ def subset_by_node_type(df: DataFrame) -> DataFrame:
     ip_only: bool = (ip_bool) and (not sec_bool)
     sec_only: bool = (sec_bool) and (not ip_bool)
     ip_or_sec: bool = (ip_bool) and (sec_bool)
-    ip_and_sec: bool = InteractionSupport.IP_and_SEC.value in ip_and_sec_toggle
 
     # A mask tells us which rows of the dataframe (df) to return
     ip_mask: Series = df["Interaction_support"] == "IP"
@@ -124,28 +127,12 @@ def subset_by_node_type(df: DataFrame) -> DataFrame:
         return df
 
 
-def subset_by_edge_type(df: DataFrame) -> DataFrame:
+def subset_by_edge_type(df: DataFrame, state: FilterState) -> DataFrame:
     """
-    Subset df to bait-prey pairs based on protein interaction type
+    Subset df to bait-prey pairs based on protein interaction type, as
+    toggled in `interaction_type_checkbox_button` and recorded in `state`
     """
-    df_copy: DataFrame = df.copy()
-
-    # Note: DashPatterns take iterable as [dash, gap] ([] is a solid line)
-    df_copy["edge_style"] = df_copy["IP_interaction_type"].map({
-        InteractionTypeValue.direct.value: [],
-        InteractionTypeValue.mediated.value: [8, 4],
-        InteractionTypeValue.shielded.value: [5, 20],
-        InteractionTypeValue.undetermined.value: [1, 1],
-        nan: []
-    })
-
-    df_copy["edge_color"] = df_copy["Interaction_support"].map({
-        "IP": EdgeColors.IP.value,
-        "SEC": EdgeColors.SEC.value,
-        "both": EdgeColors.Both.value
-    })
-
-    interaction_type: List[int] = interaction_type_checkbox_button.active
+    _, _, interaction_type, _, _ = state
     types_to_include: List[Union[str, float]] = []
 
     # If nothing is toggled, include all types of edges/interactions
@@ -171,241 +158,310 @@ def subset_by_edge_type(df: DataFrame) -> DataFrame:
         types_to_include.append(nan)
 
     # Only consider edges with IP or IP & SEC for IP interaction type filtering
-    ip_mask: Series = df_copy["Interaction_support"].isin(["IP", "both"])
-    ip_type_mask: Series = df_copy[ip_mask]["IP_interaction_type"].isin(types_to_include)
-    ip_rows: DataFrame = df_copy[ip_mask][ip_type_mask].copy()
+    ip_mask: Series = df["Interaction_support"].isin(["IP", "both"])
+    ip_type_mask: Series = df["IP_interaction_type"].isin(types_to_include)
 
     # Get SEC rows separately
-    sec_mask: Series = df_copy["Interaction_support"] == "SEC"
-    sec_rows: DataFrame = df_copy[sec_mask].copy()
+    sec_mask: Series = df["Interaction_support"] == "SEC"
 
-    filtered_df: DataFrame = concat([ip_rows, sec_rows], axis=0)
-    return filtered_df
+    # Masks are combined before indexing so rows are only copied once
+    filtered_df: DataFrame = concat([df[ip_mask & ip_type_mask],
+                                     df[sec_mask]], axis=0)
 
+    return add_edge_attributes(filtered_df)
 
-def filter_by_dfs(df: DataFrame,
-                  nodes: List[str],
-                  n: int) -> DataFrame:
+
+def add_edge_attributes(df: DataFrame) -> DataFrame:
     """
-    Performs depth first search on bait-prey dataframe
+    Adds the edge_style and edge_color columns used to draw each bait-prey edge
     """
-    indices = []
-    visited = set()
-
-    def dfs(node, depth):
-        visited.add(node)
-        if depth <= n:
-            neighbors = df[df['Bait'] == node].index
-            for neighbor_idx in neighbors:
-                indices.append(neighbor_idx)
-                neighbor = df.loc[neighbor_idx, 'Prey']
-                if neighbor not in visited:
-                    dfs(neighbor, depth + 1)
-
-    for node in nodes:
-        dfs(node, 0)
-
-    filtered_df = df.loc[indices]
-    return filtered_df
+    # Codes are indices into EDGE_DASH_PATTERNS and EDGE_PALETTE, and double
+    # as categorical codes of the interaction type and support for filtering
+    # in the browser (filter.js); missing values get the last code
+    edge_style_map: Dict[str, int] = {
+        InteractionTypeValue.direct.value: 0,
+        InteractionTypeValue.mediated.value: 1,
+        InteractionTypeValue.shielded.value: 2,
+        InteractionTypeValue.undetermined.value: 3,
+    }
+    interaction_types: Series = df["IP_interaction_type"].astype(object)
+    interaction_support: Series = df["Interaction_support"].astype(object)
+
+    df = df.copy(deep=False)
+    df["edge_style"] = interaction_types.map(edge_style_map).fillna(len(edge_style_map)).astype(uint8)
+    df["edge_color"] = interaction_support.map({
+        "IP": EDGE_PALETTE.index(EdgeColors.IP.value),
+        "SEC": EDGE_PALETTE.index(EdgeColors.SEC.value),
+        "both": EDGE_PALETTE.index(EdgeColors.Both.value),
+    }).fillna(EDGE_PALETTE.index(GRAY)).astype(uint8)
 
+    return df
 
-def subset_by_protein(df: DataFrame) -> DataFrame:
+
+def filter_state(controls: Controls, buttons: Buttons) -> FilterState:
     """
-    Subset df to bait proteins list specified in protein_text_input
+    Canonical form of a session's controls read by the subset_by_* filters
+
+    Controls that give the same rows map to the same state: toggle order,
+    protein order, duplicate proteins and whitespace are ignored, and the
+    number of neighbors only counts when proteins are entered. When sources
+    and types are filtered in the browser, their toggles are ignored too.
     """
     protein_str: str = str(controls.protein_text_input.value).strip()
-    protein_list: List[str] = [p.strip() for p in protein_str.split(",")]
 
-    # If there's no proteins entered, we return all edges
-    if (len(protein_list) == 1) and (protein_list[0] == ""):
-        return df
+    if protein_str == "":
+        proteins: Union[Tuple[str, ...], None] = None
+        num_neighbors: int = 0
     else:
-        num_neighbors_string: str = str(controls.num_neighbors_selection.value)
-        num_neighbors: int = int(num_neighbors_string)
+        protein_set: Set[str] = {p.strip() for p in protein_str.split(",")}
+        proteins = tuple(sorted(protein_set))
+        num_neighbors = int(str(controls.num_neighbors_selection.value))
 
-        # Get all preys for our baits of interest
-        prey_df = df[df["Bait"].isin(protein_list)].copy()
-        preys = prey_df["Prey"].values
+    if controls.client_filtering_checkbox.active:
+        return ((), False, (), proteins, num_neighbors)
 
-        # Keep track row numbers for final edge list
-        rows_to_include: Set[int] = set()
-        rows_to_include.update(set(prey_df.index))
+    datasets = tuple(sorted(set(buttons.dataset_checkbox_button.active)))
+    ip_and_sec = InteractionSupport.IP_and_SEC.value in buttons.interaction_support_checkbox_button.active
+    interaction_types = tuple(sorted(set(buttons.interaction_type_checkbox_button.active)))
 
-        for _ in range(num_neighbors):
-            subset_df = df[df["Bait"].isin(preys) | df["Prey"].isin(preys)].copy()
-            rows_to_include.update(set(subset_df.index))
-            preys = subset_df["Prey"].values
+    return (datasets, ip_and_sec, interaction_types, proteins, num_neighbors)
 
-        return df.loc[list(rows_to_include)].copy()
 
+def filter_by_dfs(df: DataFrame,
+                  nodes: List[str],
+                  n: int,
+                  order: str = "dfs",
+                  max_nodes: Union[int, None] = None,
+                  adjacency: Union[Adjacency, None] = None) -> DataFrame:
+    """
+    Performs depth first (or breadth first) search on bait-prey dataframe
 
-def lifecycle_node_attributes(df: DataFrame) -> Dict[Hashable, Dict[str, str]]:
-    bait_col: str = "Bait_lifecycle_step"
-    prey_col: str = "prey_lifecycle_stage_main_by_most_common_bait_stage"
+    `adjacency` must have been built from `df`; it is built on the fly if
+    it isn't given. See `adjacency.traverse` for `order` and `max_nodes`.
+    """
+    if adjacency is None:
+        adjacency = build_adjacency(df)
 
-    # Colors for bait proteins
-    bait_lifecycle_df: DataFrame = df[["Bait", bait_col]].copy()
-    bait_lifecycle_df.dropna(inplace=True)
-    bait_lifecycle_df.drop_duplicates(keep="first", inplace=True)
-    bait_lifecycle_df.set_index("Bait", inplace=True)
+    rows: ndarray = traverse(adjacency, nodes, n, order=order,
+                             max_nodes=max_nodes)
+    filtered_df = df.iloc[rows]
+    return filtered_df
 
-    _bait_lifecycle_dict: Dict[str, Dict[str, str]] = bait_lifecycle_df.to_dict()
-    bait_lifecycle_dict: Dict[str, str] = _bait_lifecycle_dict[bait_col]
 
-    # Colors for prey proteins
-    prey_lifecycle_df = df[["Prey", prey_col]].copy()
-    prey_lifecycle_df.dropna(inplace=True)
-    prey_lifecycle_df.drop_duplicates(keep="first", inplace=True)
-    prey_lifecycle_df.set_index("Prey", inplace=True)
+def subset_by_protein(df: DataFrame,
+                      state: FilterState,
+                      adjacency: Union[Adjacency, None] = None) -> DataFrame:
+    """
+    Subset df to bait proteins list specified in protein_text_input, as
+    recorded in `state`
 
-    _prey_lifecycle_dict: Dict[str, Dict[str, str]] = prey_lifecycle_df.to_dict()
-    prey_lifecycle_dict: Dict[str, str] = _prey_lifecycle_dict[prey_col]
+    `adjacency` must have been built from `df`; it is built on the fly if
+    it isn't given.
+    """
+    _, _, _, proteins, num_neighbors = state
 
-    # The | operation merges two dictionaries by keys
-    protein_dict: Dict[str, str] = bait_lifecycle_dict | prey_lifecycle_dict
+    # If there's no proteins entered, we return all edges
+    if proteins is None:
+        return df
+    else:
+        protein_list: List[str] = list(proteins)
+
+        if adjacency is None:
+            adjacency = build_adjacency(df)
+
+        # Row positions of the baits of interest and their neighborhood
+        rows_to_include: ndarray = expand_neighborhood(adjacency,
+                                                       protein_list,
+                                                       num_neighbors)
+
+        return df.iloc[rows_to_include]
 
-    node_attributes: Dict[Hashable, Dict[str, str]] = {}
-    for protein, lifecycle_step in protein_dict.items():
-        if lifecycle_step in LifecycleColorsDict:
-            node_color = LifecycleColorsDict[lifecycle_step]
-        else:
-            node_color = LifecycleColors.undetermined.value
 
-        attributes: Dict[str, str] = {
-            "legend_label": "Lifecycle step: " + lifecycle_step,
-            "node_color": node_color
-        }
-        node_attributes[protein] = attributes
+class Annotation(NamedTuple):
+    """
+    Per-protein annotation codes for one "color node by" option
 
-    return node_attributes
+    Codes index into `colors` and `labels`; -1 means the protein has no
+    annotation in that column.
+    """
+    bait_col: str
+    prey_col: str
+    bait_codes: ndarray  # protein id --> category code from the bait column
+    prey_codes: ndarray  # protein id --> category code from the prey column
+    colors: ndarray  # category code --> hex color
+    labels: ndarray  # category code --> legend label
 
 
-def location_node_attributes(df: DataFrame) -> Dict[Hashable, Dict[str, str]]:
-    bait_col = "Bait_main_location_HPA"
-    prey_col = "Prey_main_location_HPA"
+class ProteinAnnotations(NamedTuple):
+    proteins: Index  # protein name --> protein id
+    annotations: Dict[str, Annotation]  # "color node by" option --> Annotation
 
-    # Get location annotations for baits
-    bait_location_df = df[["Bait", bait_col]].copy()
-    bait_location_df.dropna(inplace=True)
-    bait_location_df.drop_duplicates(keep="first", inplace=True)
-    bait_location_df.set_index("Bait", inplace=True)
 
-    bait_location_dict = bait_location_df.to_dict()
-    bait_location_dict = bait_location_dict[bait_col]
-    unique_bait_locations = set(bait_location_dict.values())
+class NodeColoring(NamedTuple):
+    """
+    Colors and legend labels of graph nodes, aligned with `nodes`
+    """
+    nodes: Index
+    colors: ndarray
+    labels: ndarray
+    annotated: ndarray  # Whether the node has an annotation to color it by
 
-    # Get location annotations for preys
-    prey_location_df: DataFrame = df[["Prey", prey_col]].copy()
-    prey_location_df.dropna(inplace=True)
-    prey_location_df.drop_duplicates(keep="first", inplace=True)
-    prey_location_df.set_index("Prey", inplace=True)
 
-    _prey_location_dict: Dict[str, Dict[str, str]] = prey_location_df.to_dict()
-    prey_location_dict: Dict[str, str] = _prey_location_dict[prey_col]
-    unique_prey_locations: Set[str] = set(prey_location_dict.values())
+def protein_codes(df: DataFrame,
+                  protein_col: str,
+                  value_col: str,
+                  proteins: Index,
+                  categories: Index) -> ndarray:
+    """
+    Category code of each protein in `value_col`, the last non-null one wins
+    """
+    values: Series = df[[protein_col, value_col]].dropna().astype(object)
+    last_values: Series = values.groupby(protein_col, sort=False)[value_col].last()
 
-    # The | operator merges dictionaries based on keys
-    combined_location_dict: Dict[str, str] = bait_location_dict | prey_location_dict
+    codes: ndarray = full(len(proteins), -1)
+    codes[proteins.get_indexer(last_values.index)] = categories.get_indexer(last_values.values)
+    return codes
 
-    unique_locations: List[str] = list(unique_bait_locations |
-                                       unique_prey_locations)
 
+def palette(categories: Index, colormap: str) -> ndarray:
+    """
+    Evenly spaced hex colors from a matplotlib colormap, one per category
+    """
     # integer --> color in RGBA
-    color_map: cm.Colormap = cm.get_cmap("tab10", len(unique_locations))
+    color_map: Colormap = colormaps[colormap].resampled(max(len(categories), 1))
 
-    # location --> color
-    color_dict: Dict[str, str] = {location: color_map(i)
-                                  for i, location in enumerate(unique_locations)}
+    # Note: RGBA tuple -> rgba_to_hex(*RGBA) -> rgba_to_hex(R, G, B, A) -> hex
+    return asarray([rgba_to_hex(*color_map(i)) for i in range(len(categories))],
+                   dtype=object)
 
-    # TODO: Make a legend for the disease coloring
 
-    # node --> {"node_attribute": color}
-    node_attributes: Dict[Hashable, Dict[str, str]] = {
-        key: {
-            "node_color": rgba_to_hex(*color_dict[value]),
-            "legend_label": f"Location: {value}"
-        }
-        for key, value in combined_location_dict.items()
+def build_protein_annotations(df: DataFrame, proteins: Index) -> ProteinAnnotations:
+    """
+    Codes the lifecycle, HPA location and DisGeNET disease of every protein
+    """
+    columns: Dict[str, Tuple[str, str, str]] = {
+        "lifecycle stage": ("Bait_lifecycle_step",
+                            "prey_lifecycle_stage_main_by_most_common_bait_stage",
+                            "Lifecycle step"),
+        "location": ("Bait_main_location_HPA",
+                     "Prey_main_location_HPA",
+                     "Location"),
+        "disease": ("Bait_Disgenet_disease_.1",
+                    "Prey_Disgenet_disease_.1",
+                    "Disease"),
     }
 
-    return node_attributes
+    annotations: Dict[str, Annotation] = {}
+    for selection, (bait_col, prey_col, legend) in columns.items():
+        values: Series = concat([df[bait_col].astype(object),
+                                 df[prey_col].astype(object)]).dropna()
+        categories: Index = Index(sorted(values.unique()))
+
+        # Lifecycle steps have fixed colors, other annotations use tab10
+        if selection == "lifecycle stage":
+            undetermined: str = LifecycleColors.undetermined.value
+            colors: ndarray = asarray([LifecycleColorsDict.get(step, undetermined)
+                                       for step in categories], dtype=object)
+        else:
+            colors = palette(categories, "tab10")
 
+        labels: ndarray = asarray([f"{legend}: {value}" for value in categories],
+                                  dtype=object)
 
-def disease_node_attribute(df: DataFrame) -> Dict[Hashable, Dict[str, str]]:
-    bait_col = "Bait_Disgenet_disease_.1"
-    prey_col = "Prey_Disgenet_disease_.1"
+        annotations[selection] = Annotation(
+            bait_col=bait_col,
+            prey_col=prey_col,
+            bait_codes=protein_codes(df, "Bait", bait_col, proteins, categories),
+            prey_codes=protein_codes(df, "Prey", prey_col, proteins, categories),
+            colors=colors,
+            labels=labels,
+        )
 
-    # Get disease annotations for baits
-    bait_disease_df = df[["Bait", bait_col]].copy()
-    bait_disease_df.dropna(inplace=True)
-    bait_disease_df.drop_duplicates(keep="first", inplace=True)
-    bait_disease_df.set_index("Bait", inplace=True)
+    return ProteinAnnotations(proteins=proteins, annotations=annotations)
 
-    _bait_disease_dict: Dict[str, Dict[str, str]] = bait_disease_df.to_dict()
-    bait_disease_dict: Dict[str, str] = _bait_disease_dict[bait_col]
-    unique_bait_diseases: Set[str] = set(bait_disease_dict.values())
 
-    # Get disease annotations for preys
-    prey_disease_df = df[["Prey", prey_col]].copy()
-    prey_disease_df.dropna(inplace=True)
-    prey_disease_df.drop_duplicates(keep="first", inplace=True)
-    prey_disease_df.set_index("Prey", inplace=True)
+def appears_in(df: DataFrame,
+               protein_col: str,
+               value_col: str,
+               proteins: Index) -> ndarray:
+    """
+    Mask over protein ids of proteins in `protein_col` with a `value_col` value
+    """
+    present: ndarray = zeros(len(proteins), dtype=bool)
+    has_value: ndarray = df[value_col].notna().values
+    column: Series = df[protein_col]
+
+    # Categorical columns only need their categories looked up
+    if isinstance(column.dtype, CategoricalDtype):
+        category_ids: ndarray = proteins.get_indexer(column.cat.categories.astype(object))
+        codes: ndarray = column.cat.codes.values[has_value]
+        ids: ndarray = category_ids[codes[codes >= 0]]
+    else:
+        ids = proteins.get_indexer(column[has_value].astype(object))
 
-    _prey_disease_dict: Dict[str, Dict[str, str]] = prey_disease_df.to_dict()
-    prey_disease_dict: Dict[str, str] = _prey_disease_dict[prey_col]
-    unique_prey_diseases: Set[str] = set(prey_disease_dict.values())
+    present[ids[ids >= 0]] = True
+    return present
 
-    unique_diseases: List[str] = list(unique_bait_diseases |
-                                      unique_prey_diseases)
 
-    # The | merges two dictionaries by keys
-    combined_disease_dict: Dict[str, str] = bait_disease_dict | prey_disease_dict
+def determine_node_coloring(df: DataFrame,
+                            nodes: List[Hashable],
+                            annotations: ProteinAnnotations,
+                            coloring_selection: str,
+                            node_ids: Union[ndarray, None] = None) -> NodeColoring:
+    """
+    Looks up the color and legend label of every node for "color node by"
 
-    # integer --> color in RGBA
-    color_map: cm.Colormap = cm.get_cmap("tab10", len(unique_diseases))
+    As before, a protein that is a prey in `df` takes its prey annotation and
+    otherwise its bait annotation. Nodes without annotation are gray.
+    `coloring_selection` is the value of `node_coloring_selection`.
+    `node_ids` are the ids of `nodes` in `annotations.proteins`, looked up
+    by name if not given.
+    """
+    node_index: Index = Index(nodes)
+    num_nodes: int = len(nodes)
 
-    # disease --> color
-    color_dict: Dict[str, str] = {disease: color_map(i)
-                                  for i, disease in enumerate(unique_diseases)}
+    if coloring_selection == "none":
+        return NodeColoring(
+            nodes=node_index,
+            colors=full(num_nodes, LifecycleColors.undetermined.value, dtype=object),
+            labels=full(num_nodes, "N/A", dtype=object),
+            annotated=ones(num_nodes, dtype=bool),
+        )
+    elif coloring_selection not in annotations.annotations:
+        message = "supported values: lifecycle stage, location, disease, none"
+        raise Exception(message)
 
-    # TODO: Make a legend for the disease coloring
+    annotation: Annotation = annotations.annotations[coloring_selection]
+    proteins: Index = annotations.proteins
+    if node_ids is None:
+        node_ids = proteins.get_indexer([str(node) for node in nodes])
+    known: ndarray = node_ids >= 0
+    node_ids = where(known, node_ids, 0)
 
-    # node --> {"node_color": disease color}
-    # Note: RGBA tuple -> rgba_to_hex(*RGBA) -> rgba_to_hex(R, G, B, A) -> hex
-    node_attributes: Dict[Hashable, Dict[str, str]] = {
-        key: {
-            "node_color": rgba_to_hex(*color_dict[value]),
-            "legend_label": f"Disease: {value}"
-        }
-        for key, value in combined_disease_dict.items()
-    }
+    # Prey annotations take precedence over bait annotations
+    is_prey: ndarray = appears_in(df, "Prey", annotation.prey_col, proteins)[node_ids]
+    is_bait: ndarray = appears_in(df, "Bait", annotation.bait_col, proteins)[node_ids]
+    codes: ndarray = where(is_prey, annotation.prey_codes[node_ids],
+                           where(is_bait, annotation.bait_codes[node_ids], -1))
+    annotated: ndarray = known & (codes >= 0)
 
-    return node_attributes
+    colors: ndarray = full(num_nodes, GRAY, dtype=object)
+    labels: ndarray = full(num_nodes, "N/A", dtype=object)
+    colors[annotated] = annotation.colors[codes[annotated]]
+    labels[annotated] = annotation.labels[codes[annotated]]
 
+    return NodeColoring(nodes=node_index, colors=colors, labels=labels,
+                        annotated=annotated)
 
-def determine_node_coloring(df: DataFrame) -> Dict[Hashable, Dict[str, str]]:
-    coloring_selection: str = controls.node_coloring_selection.value
 
-    if coloring_selection == "none":
-        baits = set(df["Bait"].unique())
-        preys = set(df["Prey"].unique())
-        proteins = baits | preys
-
-        no_attributes: Dict[Hashable, Dict[str, str]] = {
-            protein: {"node_color": LifecycleColors.undetermined.value,
-                      "legend_label": "N/A"}
-            for protein in proteins
-        }
-        return no_attributes
-    elif coloring_selection == "lifecycle stage":
-        lifecycle_attributes = lifecycle_node_attributes(df)
-        return lifecycle_attributes
-    elif coloring_selection == "location":
-        location_attributes = location_node_attributes(df)
-        return location_attributes
-    elif coloring_selection == "disease":
-        disease_attributes = disease_node_attribute(df)
-        return disease_attributes
-    else:
-        message = "supported values: lifecycle stage, location, disease, none"
-        raise Exception(message)
+def coloring_dict(node_coloring: NodeColoring) -> Dict[Hashable, Dict[str, str]]:
+    """
+    node --> {"node_color": color, "legend_label": label} for annotated nodes
+    """
+    mask: ndarray = node_coloring.annotated
+    return {
+        node: {"node_color": color, "legend_label": label}
+        for node, color, label in zip(node_coloring.nodes[mask],
+                                      node_coloring.colors[mask],
+                                      node_coloring.labels[mask])
+    }
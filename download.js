@@ -1,5 +1,4 @@
-const filename = "SupplementalTable_2_subset.csv";
-const blob = new Blob([source], { type: "text/csv;charset=utf-8;" });
+const blob = new Blob([source], { type: `${mime_type};charset=utf-8;` });
 
 //addresses IE
 if (navigator.msSaveBlob) {
@@ -0,0 +1,74 @@
+from numpy import asarray, bincount, column_stack, empty, ndarray, uint8, unique
+from pandas import DataFrame, Index
+
+from compact import CompactGraph
+
+from typing import Dict, Tuple
+
+# Type aliases for readability
+Edges = Tuple[ndarray, ndarray]  # (E, 2) source and target coordinates
+
+
+def edge_coordinates(graph: CompactGraph,
+                     layout: Dict[str, ndarray]) -> Tuple[ndarray, ndarray]:
+    """
+    Returns (E, 2) arrays of source and target coordinates of every edge
+    """
+    if len(graph.sources) == 0:
+        return empty((0, 2)), empty((0, 2))
+
+    # Cached layouts may list the nodes in a different order than the graph
+    positions = asarray(list(layout.values()), dtype=float).reshape(-1, 2)  # ndarray
+    node_xy = positions[Index(list(layout.keys())).get_indexer(graph.nodes)]  # ndarray
+    return node_xy[graph.sources], node_xy[graph.targets]
+
+
+def get_edges(df: DataFrame,
+              graph: CompactGraph,
+              layout: Dict[str, ndarray],
+              alpha: float) -> Tuple[Edges, Edges, ndarray, ndarray, ndarray]:
+    """
+    Computes edge geometry with a parallel PPI edge for every CORUM edge
+
+    `graph` must have been built from the rows of `df`. Returns the edges,
+    the PPI edges, the color and style code of every edge (see
+    add_edge_attributes), and which edges have a PPI edge.
+    """
+    num_edges = len(graph.sources)  # int
+    if num_edges == 0:
+        no_edges = (empty((0, 2)), empty((0, 2)))  # Edges
+        return (no_edges, no_edges, empty(0, dtype=uint8), empty(0, dtype=uint8),
+                empty(0, dtype=bool))
+
+    # An edge takes the codes of its CORUM row if it has one, else its first row
+    row_edges = graph.row_edges  # ndarray
+    edges, first_rows = unique(row_edges, return_index=True)
+    first_rows = first_rows[edges >= 0]  # ndarray
+    corum_rows = (df["in_CORUM_2022"].fillna(False).astype(bool).to_numpy()
+                  & (row_edges >= 0)).nonzero()[0]  # ndarray
+
+    corum_counts = bincount(row_edges[corum_rows], minlength=num_edges)  # ndarray
+    if (corum_counts > 1).any():
+        message = "Each edge should correspond to at most 1 entry"
+        raise Exception(message)
+    is_corum = corum_counts > 0  # ndarray
+
+    row_colors = df["edge_color"].to_numpy()  # ndarray
+    row_styles = df["edge_style"].to_numpy()  # ndarray
+    colors = row_colors[first_rows]  # ndarray
+    styles = row_styles[first_rows]  # ndarray
+    colors[row_edges[corum_rows]] = row_colors[corum_rows]
+    styles[row_edges[corum_rows]] = row_styles[corum_rows]
+
+    # Translate CORUM edges by alpha * (slope_y, -slope_x) in one pass
+    source_xy, target_xy = edge_coordinates(graph, layout)
+    slope = target_xy - source_xy  # ndarray
+    offset = alpha * column_stack([slope[:, 1], -slope[:, 0]])  # ndarray
+    offset[~is_corum] = 0.0
+
+    edge_source = source_xy + offset  # ndarray
+    edge_target = target_xy + offset  # ndarray
+    ppi_source = source_xy[is_corum] - offset[is_corum]  # ndarray
+    ppi_target = target_xy[is_corum] - offset[is_corum]  # ndarray
+
+    return (edge_source, edge_target), (ppi_source, ppi_target), colors, styles, is_corum
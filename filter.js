@@ -0,0 +1,65 @@
+// subset_by_node_type and subset_by_edge_type of data.py, run in the browser
+// when sources and types are filtered there. The edge source then holds
+// every edge of the network, with its Interaction_support code in `color`
+// (IP, SEC, both, missing), its IP_interaction_type code in `dash` (direct,
+// mediated, shielded, undetermined, missing) and the node indices of its
+// ends in `source` and `target`. `source` is the data source being
+// filtered: the edges, the PPI edges (which carry their edge's codes) or
+// the nodes, which are shown while any of their edges is.
+if (edges.data.source === undefined) {
+  return null;  // Filtered on the server, show everything
+}
+
+const IP = 0, SEC = 1, BOTH = 2;
+const UNDETERMINED = 3;
+
+const ip = datasets.active.includes(0);
+const sec = datasets.active.includes(1);
+const ip_and_sec = interaction_support.active.includes(0);
+const types = interaction_types.active;
+
+function keep_support(support) {
+  if (ip && !sec) {
+    return support == IP || support == BOTH;
+  } else if (sec && !ip) {
+    return support == SEC || support == BOTH;
+  } else if (ip && sec) {
+    return support == IP || support == SEC || support == BOTH;
+  } else if (ip_and_sec) {
+    return support == BOTH;
+  }
+  return true;
+}
+
+function keep_type(support, type) {
+  // SEC edges have no interaction type, and edges without support are dropped
+  if (support == SEC) {
+    return true;
+  } else if (support != IP && support != BOTH) {
+    return false;
+  }
+  // Undetermined and missing types are always kept
+  return types.length == 0 || type >= UNDETERMINED || types.includes(type);
+}
+
+function edge_mask(data) {
+  return Array.from(data.color, (support, i) =>
+    keep_support(support) && keep_type(support, data.dash[i]));
+}
+
+if (source !== nodes) {
+  return edge_mask(source.data);
+}
+
+const num_nodes = source.get_length();
+const shown = new Array(num_nodes).fill(false);
+const mask = edge_mask(edges.data);
+for (let i = 0; i < mask.length; i++) {
+  if (mask[i]) {
+    shown[edges.data.source[i]] = true;
+    shown[edges.data.target[i]] = true;
+  }
+}
+// Right after an update the nodes can be newer than the edges; the filter
+// runs again once the edges arrive
+return shown.slice(0, num_nodes);
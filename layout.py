@@ -0,0 +1,366 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from os.path import dirname, exists, join
+from sys import getsizeof
+from threading import Lock
+from time import perf_counter
+
+import networkx as nx
+from numpy import asarray, column_stack, cos, float32, hypot, load, median, ndarray, ones, pi
+from numpy import savez_compressed, sin, zeros
+from numpy.random import default_rng
+from pandas import DataFrame, Index
+from scipy.sparse import coo_matrix, spmatrix
+
+from cache import LRUCache
+from compact import CompactGraph, graph_fingerprint, sparse_matrix, table_graph, to_networkx
+from multilevel import multilevel_layout, refinement
+
+from typing import Callable, Dict, Hashable, Iterator, Tuple, Union
+
+Layout = Dict[Hashable, ndarray]
+
+# Layouts are shared by every session in the process
+LAYOUT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+# spring_layout runs 50 iterations from a random start; a warm start from
+# the previous positions only needs to settle the nodes that changed
+WARM_START_ITERATIONS: int = 15
+
+# Below this fraction of surviving nodes a warm start isn't worth it
+WARM_START_MIN_OVERLAP: float = 0.5
+
+# Force-directed layout engines: nx.spring_layout, and multilevel_layout,
+# which is much faster on large graphs
+LAYOUT_ENGINES = ("spring", "multilevel")
+
+# Iterations per coarsening level of the multilevel engine
+MULTILEVEL_ITERATIONS: int = 50
+
+# Progressive layouts are placed by the multilevel engine within
+# PROGRESSIVE_INITIAL_SECONDS, then refined in the background until they
+# settle or run out of iterations or seconds
+PROGRESSIVE_INITIAL_SECONDS: float = 0.3
+PROGRESSIVE_MAX_ITERATIONS: int = 500
+PROGRESSIVE_MAX_SECONDS: float = 60.0
+REFINE_WORKERS: int = 2
+
+# Coordinates of every protein in the full interactome, see `python layout.py`
+GLOBAL_LAYOUT_FILEPATH = join(dirname(__file__), "SupplementalTable_2_layout.npz")
+
+_global_layout: Union[Tuple[Index, ndarray], None] = None
+_global_layout_lock = Lock()
+
+
+def layout_nbytes(layout: Layout) -> int:
+    """
+    Approximate memory held by a layout: node keys plus coordinate arrays
+    """
+    return sum(getsizeof(node) + getsizeof(coordinates)
+               for node, coordinates in layout.items())
+
+
+layout_cache = LRUCache(max_bytes=LAYOUT_CACHE_MAX_BYTES, sizeof=layout_nbytes)
+
+# Progressive layouts are refined here, outside the build workers
+refine_executor = ThreadPoolExecutor(max_workers=REFINE_WORKERS, thread_name_prefix="refine")
+
+
+def layout_key(graph: CompactGraph,
+               weight: Union[str, None],
+               engine: str) -> Tuple[str, Union[str, None], str]:
+    return (graph_fingerprint(graph), weight, engine)
+
+
+def cached_layout(graph: CompactGraph,
+                  weight: Union[str, None] = "weight",
+                  engine: str = "multilevel") -> Union[Layout, None]:
+    cached = layout_cache.get(layout_key(graph, weight, engine))  # Union[Layout, None]
+    return None if cached is None else dict(cached)
+
+
+def surviving_layout(graph: CompactGraph, previous: Union[Layout, None]) -> Union[Layout, None]:
+    """
+    Previous coordinates of the nodes of `graph`, if enough of them survive
+    for a warm start
+    """
+    if previous is None:
+        return None
+
+    surviving = {node: previous[node]
+                 for node in graph.nodes if node in previous}  # Layout
+    num_nodes = len(graph.nodes)  # int
+    if num_nodes > 0 and len(surviving) >= WARM_START_MIN_OVERLAP * num_nodes:
+        return surviving
+    return None
+
+
+def edge_length(matrix: spmatrix, positions: ndarray, placed: ndarray) -> float:
+    """
+    Median length of the edges between placed nodes, or 1 if there are none
+    """
+    edges = coo_matrix(matrix)  # coo_matrix
+    both_placed = placed[edges.row] & placed[edges.col]  # ndarray
+    if not both_placed.any():
+        return 1.0
+
+    delta = positions[edges.row[both_placed]] - positions[edges.col[both_placed]]  # ndarray
+    return max(float(median(hypot(delta[:, 0], delta[:, 1]))), 1e-9)
+
+
+def multilevel_spring_layout(graph: CompactGraph,
+                             pos: Union[Layout, None] = None,
+                             iterations: int = MULTILEVEL_ITERATIONS,
+                             weight: Union[str, None] = "weight",
+                             seed: Union[int, None] = None,
+                             max_seconds: Union[float, None] = None) -> Layout:
+    """
+    multilevel_layout with the arguments and output of nx.spring_layout:
+    coordinates are centered and scaled to [-1, 1]
+
+    Nodes in `pos` start from there, scaled so their edges are about as
+    long as the natural edge length, and the others from the mean of their
+    neighbors in `pos`, or at random.
+    """
+    # Filters that match no rows leave nothing to lay out or rescale
+    if len(graph.nodes) == 0:
+        return {}
+
+    nodes = graph.nodes.tolist()  # List[Hashable]
+    matrix = sparse_matrix(graph, weight)  # csr_array
+
+    initial = None  # Union[ndarray, None]
+    if pos is not None:
+        placed = asarray([node in pos for node in nodes])  # ndarray
+        initial = zeros((len(nodes), 2))
+        initial[placed] = [pos[node] for node, is_placed in zip(nodes, placed) if is_placed]
+        initial /= edge_length(matrix, initial, placed)
+
+        rng = default_rng(seed)
+        symmetric = (matrix + matrix.T).tocsr()  # csr_array
+        neighbor_sums = symmetric @ (initial * placed[:, None])  # ndarray
+        neighbor_counts = symmetric @ placed.astype(float)  # ndarray
+        low, high = initial[placed].min(axis=0), initial[placed].max(axis=0)
+        for i in (~placed).nonzero()[0]:
+            if neighbor_counts[i] > 0:
+                initial[i] = neighbor_sums[i] / neighbor_counts[i]
+            else:
+                initial[i] = low + rng.random(2) * (high - low)
+
+    coordinates = multilevel_layout(matrix, iterations=iterations, max_seconds=max_seconds,
+                                    initial=initial, seed=seed)  # ndarray
+    return dict(zip(nodes, nx.rescale_layout(coordinates, scale=1)))
+
+
+def spring_layout(graph: CompactGraph,
+                  previous: Union[Layout, None] = None,
+                  weight: Union[str, None] = "weight",
+                  engine: str = "spring") -> Layout:
+    """
+    Force-directed layout by one of LAYOUT_ENGINES, with a cache keyed by
+    graph fingerprint
+
+    On a cache miss, nodes that also appear in `previous` start from their
+    previous coordinates and the layout runs fewer iterations, so small
+    filter changes are faster and keep the picture stable.
+    """
+    if engine not in LAYOUT_ENGINES:
+        message = f"Supported layout engines: {', '.join(LAYOUT_ENGINES)}"
+        raise Exception(message)
+
+    layout = cached_layout(graph, weight, engine)  # Union[Layout, None]
+    if layout is not None:
+        return layout
+
+    surviving = surviving_layout(graph, previous)  # Union[Layout, None]
+    if engine == "multilevel":
+        layout = multilevel_spring_layout(graph,
+                                          pos=surviving,
+                                          iterations=MULTILEVEL_ITERATIONS if surviving is None
+                                          else WARM_START_ITERATIONS,
+                                          weight=weight)
+    elif surviving is not None:
+        layout = nx.spring_layout(to_networkx(graph),
+                                  pos=surviving,
+                                  iterations=WARM_START_ITERATIONS,
+                                  weight=weight)
+    else:
+        layout = nx.spring_layout(to_networkx(graph), weight=weight)
+
+    layout_cache.put(layout_key(graph, weight, engine), layout)
+    return dict(layout)
+
+
+def progressive_layout(graph: CompactGraph,
+                       previous: Union[Layout, None] = None,
+                       weight: Union[str, None] = "weight") -> Layout:
+    """
+    Quick placement for `refine_layout` to improve: the multilevel engine
+    stopped after PROGRESSIVE_INITIAL_SECONDS, which leaves the finest
+    levels roughly placed. Not cached; a finished multilevel layout of the
+    graph is returned instead if there is one.
+    """
+    if len(graph.nodes) == 0:
+        return {}
+
+    layout = cached_layout(graph, weight, "multilevel")  # Union[Layout, None]
+    if layout is not None:
+        return layout
+
+    return multilevel_spring_layout(graph,
+                                    pos=surviving_layout(graph, previous),
+                                    weight=weight,
+                                    max_seconds=PROGRESSIVE_INITIAL_SECONDS)
+
+
+def refine_layout(graph: CompactGraph,
+                  layout: Layout,
+                  cancelled: Callable[[], bool] = lambda: False,
+                  weight: Union[str, None] = "weight",
+                  iterations: int = PROGRESSIVE_MAX_ITERATIONS,
+                  max_seconds: float = PROGRESSIVE_MAX_SECONDS) -> Iterator[ndarray]:
+    """
+    Refines `layout` with the forces of the multilevel engine, yielding
+    (N, 2) coordinates in the node order of `layout` after every iteration
+
+    Coordinates stay in the frame of `layout`, so the picture doesn't jump.
+    Stops once the layout settles, the budget runs out or `cancelled`
+    returns True. Unless cancelled, the result is cached as the graph's
+    multilevel layout.
+    """
+    nodes = list(layout.keys())  # List[Hashable]
+    order = graph.nodes.get_indexer(nodes)  # ndarray
+    matrix = sparse_matrix(graph, weight)[order][:, order]  # csr_array
+    positions = asarray(list(layout.values()), dtype=float).reshape(-1, 2)  # ndarray
+    center = positions.mean(axis=0) if len(nodes) > 0 else zeros(2)  # ndarray
+    scale = edge_length(matrix, positions, ones(len(nodes), dtype=bool))  # float
+
+    for refined in refinement(matrix, (positions - center) / scale, iterations, max_seconds):
+        if cancelled():
+            return
+        positions = refined * scale + center
+        yield positions
+
+    layout_cache.put(layout_key(graph, weight, "multilevel"), dict(zip(nodes, positions)))
+
+
+def compute_global_layout(df: DataFrame,
+                          iterations: int = 50,
+                          seed: Union[int, None] = None,
+                          engine: str = "spring") -> Tuple[Index, ndarray]:
+    """
+    Lays out the full bait-prey network, returning proteins and coordinates
+    """
+    graph = table_graph(df)  # CompactGraph
+    if engine == "multilevel":
+        layout = multilevel_spring_layout(graph, iterations=iterations, seed=seed)  # Layout
+    else:
+        layout = nx.spring_layout(to_networkx(graph).to_undirected(), iterations=iterations, seed=seed)
+
+    proteins = Index([str(node) for node in layout.keys()])  # Index
+    coordinates = asarray(list(layout.values()), dtype=float32)  # ndarray
+    return proteins, coordinates
+
+
+def save_global_layout(proteins: Index,
+                       coordinates: ndarray,
+                       filepath: str = GLOBAL_LAYOUT_FILEPATH) -> None:
+    with open(filepath, "wb") as f:
+        savez_compressed(f,
+                         proteins=proteins.to_numpy(dtype=str),
+                         coordinates=coordinates.astype(float32))
+
+
+def load_global_layout(filepath: str = GLOBAL_LAYOUT_FILEPATH) -> Union[Tuple[Index, ndarray], None]:
+    """
+    Returns the precomputed global layout, loaded once, or None if missing
+    """
+    global _global_layout
+
+    if _global_layout is None and exists(filepath):
+        with _global_layout_lock:
+            if _global_layout is None:
+                with load(filepath) as f:
+                    _global_layout = (Index(f["proteins"].astype(object)),
+                                      f["coordinates"])
+
+    return _global_layout
+
+
+def global_layout(graph: CompactGraph) -> Union[Layout, None]:
+    """
+    Looks up every node of `graph` in the precomputed global layout
+
+    Returns None if the global layout file hasn't been generated. Nodes that
+    aren't in the file, which is then older than the interactome, are laid
+    out around the nodes that are, which keep their coordinates.
+    """
+    loaded = load_global_layout()
+    if loaded is None:
+        return None
+
+    proteins, coordinates = loaded
+    nodes = graph.nodes.tolist()  # List[Hashable]
+    idx = proteins.get_indexer([str(node) for node in nodes])  # ndarray
+    found = idx >= 0  # ndarray
+
+    node_coordinates = zeros((len(nodes), 2))  # ndarray
+    node_coordinates[found] = coordinates[idx[found]]
+    if found.all():
+        return dict(zip(nodes, node_coordinates))
+
+    print(f"{len(nodes) - found.sum()} proteins are missing from the global layout, "
+          "run `python layout.py` to update it")
+    if not found.any():
+        return nx.spring_layout(to_networkx(graph))
+
+    # Missing nodes are placed an edge length from the mean of their placed
+    # neighbors, ring by ring outwards from the nodes in the file; nodes not
+    # connected to any of those go anywhere within their bounds
+    matrix = sparse_matrix(graph)  # csr_array
+    length = edge_length(matrix, node_coordinates, found)  # float
+    symmetric = (matrix + matrix.T).tocsr()  # csr_array
+    rng = default_rng(0)
+    placed = found.copy()  # ndarray
+    while not placed.all():
+        neighbor_sums = symmetric @ (node_coordinates * placed[:, None])  # ndarray
+        neighbor_counts = symmetric @ placed.astype(float)  # ndarray
+        ring = ~placed & (neighbor_counts > 0)  # ndarray
+        if not ring.any():
+            break
+
+        angles = rng.random(ring.sum()) * 2 * pi  # ndarray
+        node_coordinates[ring] = (neighbor_sums[ring] / neighbor_counts[ring, None]
+                                  + length * column_stack([cos(angles), sin(angles)]))
+        placed |= ring
+
+    low, high = node_coordinates[found].min(axis=0), node_coordinates[found].max(axis=0)
+    node_coordinates[~placed] = low + rng.random(((~placed).sum(), 2)) * (high - low)
+    return dict(zip(nodes, node_coordinates))
+
+
+if __name__ == "__main__":
+    from store import INTERACTOME_FILEPATH, load_interactome
+
+    parser = ArgumentParser(description="Precompute the global interactome layout")
+    parser.add_argument("--input", default=INTERACTOME_FILEPATH,
+                        help="bait-prey table (default: %(default)s)")
+    parser.add_argument("--output", default=GLOBAL_LAYOUT_FILEPATH,
+                        help="layout file (default: %(default)s)")
+    parser.add_argument("--iterations", type=int, default=50,
+                        help="layout iterations, per coarsening level for the "
+                             "multilevel engine (default: %(default)s)")
+    parser.add_argument("--engine", choices=LAYOUT_ENGINES, default="spring",
+                        help="layout engine (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = perf_counter()  # float
+    proteins, coordinates = compute_global_layout(load_interactome(args.input),
+                                                  iterations=args.iterations,
+                                                  seed=args.seed,
+                                                  engine=args.engine)
+    save_global_layout(proteins, coordinates, args.output)
+    print(f"Saved {len(proteins)} protein coordinates to {args.output} "
+          f"in {perf_counter() - start:.1f}s")
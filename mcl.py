@@ -0,0 +1,192 @@
+from concurrent.futures import ThreadPoolExecutor
+from numpy import abs as absolute
+from numpy import arange, bincount, concatenate, cumsum, diff, flatnonzero
+from numpy import lexsort, ndarray, ones, repeat, searchsorted, zeros
+from scipy.sparse import csc_matrix, hstack, spmatrix
+
+from typing import List, Tuple, Union
+
+# Entries below this fraction of their column are dropped after every
+# iteration, as in markov_clustering.run_mcl
+MCL_PRUNING_THRESHOLD: float = 0.001
+
+# At most this many entries are kept per column after pruning, so columns of
+# hub proteins can't fill up with entries just above the threshold
+MCL_MAX_COLUMN_ENTRIES: int = 200
+
+# Iterations before giving up on convergence
+MCL_MAX_ITERATIONS: int = 100
+
+# Memory for the matrix and the expanded columns in flight; graphs that need
+# more raise an Exception instead of exhausting memory
+MCL_MAX_BYTES: int = 1024 * 1024 * 1024
+
+# Column blocks are expanded on these threads; SciPy's sparse products
+# release the GIL
+MCL_WORKERS: int = 4
+
+# A stored entry is a float64 value and an int32 row index
+ENTRY_NBYTES: int = 12
+
+mcl_executor = ThreadPoolExecutor(max_workers=MCL_WORKERS, thread_name_prefix="mcl")
+
+
+def entry_columns(matrix: csc_matrix) -> ndarray:
+    """
+    Column of every stored entry of a CSC matrix
+    """
+    return repeat(arange(matrix.shape[1]), diff(matrix.indptr))
+
+
+def normalize_columns(matrix: csc_matrix) -> csc_matrix:
+    """
+    Divides every column by its sum; empty columns stay empty
+    """
+    # Summed in stored order, like sklearn's normalize in markov_clustering,
+    # so ties between entries break the same way
+    sums = matrix.T @ ones(matrix.shape[0])  # ndarray
+    return csc_matrix((matrix.data / repeat(sums, diff(matrix.indptr)),
+                       matrix.indices, matrix.indptr),
+                      shape=matrix.shape)
+
+
+def prune_columns(matrix: csc_matrix,
+                  threshold: float = MCL_PRUNING_THRESHOLD,
+                  max_entries: Union[int, None] = MCL_MAX_COLUMN_ENTRIES) -> csc_matrix:
+    """
+    Drops entries below `threshold`, and all but the `max_entries` largest
+    of every column; the largest entry of a column is always kept
+    """
+    columns = entry_columns(matrix)  # ndarray
+
+    # Rank of every entry within its column, largest first
+    order = lexsort((-matrix.data, columns))  # ndarray
+    ranks = zeros(matrix.nnz, dtype=int)  # ndarray
+    ranks[order] = arange(matrix.nnz) - repeat(matrix.indptr[:-1], diff(matrix.indptr))
+
+    keep = (matrix.data >= threshold) | (ranks == 0)  # ndarray
+    if max_entries is not None:
+        keep &= ranks < max_entries
+
+    counts = bincount(columns[keep], minlength=matrix.shape[1])  # ndarray
+    return csc_matrix((matrix.data[keep], matrix.indices[keep],
+                       concatenate([[0], cumsum(counts)])),
+                      shape=matrix.shape)
+
+
+def expansion_bounds(matrix: csc_matrix) -> ndarray:
+    """
+    Upper bound on the number of entries of every column of matrix @ matrix
+    """
+    # Column j of the product sums the columns named by the rows of column j
+    counts = diff(matrix.indptr)  # ndarray
+    return bincount(entry_columns(matrix),
+                    weights=counts[matrix.indices],
+                    minlength=matrix.shape[1]).astype(int)
+
+
+def column_blocks(bounds: ndarray, max_entries: int) -> List[Tuple[int, int]]:
+    """
+    Splits the columns into consecutive [start, end) blocks whose expansions
+    hold at most `max_entries` entries each
+    """
+    ends = cumsum(bounds)  # ndarray
+    blocks: List[Tuple[int, int]] = []
+    start = 0  # int
+    while start < bounds.shape[0]:
+        before = ends[start - 1] if start > 0 else 0  # int
+        end = max(int(searchsorted(ends, before + max_entries, side="right")), start + 1)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def expand_block(matrix: csc_matrix,
+                 start: int,
+                 end: int,
+                 inflation: float,
+                 threshold: float,
+                 max_entries: Union[int, None]) -> csc_matrix:
+    """
+    One MCL iteration for columns [start, end): expansion, inflation and
+    pruning, which only depend on the column itself
+    """
+    block = csc_matrix(matrix @ matrix[:, start:end])  # csc_matrix
+    block = normalize_columns(block.power(inflation))
+    return prune_columns(block, threshold, max_entries)
+
+
+def converged(matrix: csc_matrix, last: csc_matrix,
+              rtol: float = 1e-5, atol: float = 1e-8) -> bool:
+    """
+    np.allclose for sparse matrices
+    """
+    difference = absolute(matrix - last) - rtol * absolute(last)  # csc_matrix
+    return difference.max() <= atol
+
+
+def run_mcl(matrix: spmatrix,
+            inflation: float = 2.0,
+            loop_value: float = 1.0,
+            iterations: int = MCL_MAX_ITERATIONS,
+            threshold: float = MCL_PRUNING_THRESHOLD,
+            max_entries: Union[int, None] = MCL_MAX_COLUMN_ENTRIES,
+            max_bytes: int = MCL_MAX_BYTES) -> csc_matrix:
+    """
+    Markov clustering with expansion 2 on a sparse adjacency matrix
+
+    Follows markov_clustering.run_mcl: self-loops are set to `loop_value`,
+    columns are normalized, and each iteration expands, inflates and prunes
+    until the matrix stops changing. Columns are processed in blocks on
+    `mcl_executor`, sized so the matrix and the expanded blocks in flight
+    fit in `max_bytes`, and pruned before the next block is expanded.
+    """
+    # A graph without nodes has no columns to expand into blocks
+    if matrix.shape[0] == 0:
+        return csc_matrix(matrix.shape, dtype=float)
+
+    matrix = csc_matrix(matrix, dtype=float).tolil()
+    matrix.setdiag(loop_value)
+    matrix = normalize_columns(csc_matrix(matrix))
+
+    for i in range(iterations):
+        # This iteration's matrix and the last one stay in memory
+        block_bytes = (max_bytes - 2 * matrix.nnz * ENTRY_NBYTES) // MCL_WORKERS  # int
+        bounds = expansion_bounds(matrix)  # ndarray
+        if bounds.shape[0] > 0 and bounds.max() * ENTRY_NBYTES > block_bytes:
+            message = (f"Markov clustering needs more than {max_bytes // 2**20} MB "
+                       "for this graph, try fewer proteins or neighbors")
+            raise Exception(message)
+
+        # At least one block per worker, fewer entries if memory is short
+        block_entries = min(block_bytes // ENTRY_NBYTES,
+                            max(int(bounds.sum()) // MCL_WORKERS, 1))  # int
+        jobs = [mcl_executor.submit(expand_block, matrix, start, end,
+                                    inflation, threshold, max_entries)
+                for start, end in column_blocks(bounds, block_entries)]
+        last = matrix  # csc_matrix
+        matrix = csc_matrix(hstack([job.result() for job in jobs], format="csc"))
+
+        if converged(matrix, last):
+            break
+
+    return matrix
+
+
+def mcl_clusters(matrix: csc_matrix) -> List[Tuple[int, ...]]:
+    """
+    Clusters of node indices from a converged MCL matrix, like
+    markov_clustering.get_clusters
+
+    Every attractor (a node with a nonzero diagonal entry) forms a cluster
+    with the nodes in its row. Nodes attracted by several attractors appear
+    in several clusters.
+    """
+    matrix = csc_matrix(matrix)
+    matrix.eliminate_zeros()
+    rows = matrix.tocsr()
+    attractors = flatnonzero(matrix.diagonal())  # ndarray
+
+    clusters = {tuple(sorted(rows.indices[rows.indptr[a]:rows.indptr[a + 1]].tolist()))
+                for a in attractors}  # Set[Tuple[int, ...]]
+    return sorted(clusters)
@@ -0,0 +1,455 @@
+from time import perf_counter
+from numpy import arange, bincount, broadcast_arrays, ceil, clip, concatenate, cumsum, diff, flatnonzero
+from numpy import floor, full, hypot, inf, int64, lexsort, log2, maximum, minimum
+from numpy import ndarray, nonzero, ones, repeat, searchsorted, sqrt, unique, where, zeros
+from numpy.random import Generator, default_rng
+from scipy.sparse import csr_matrix, spmatrix, triu
+
+from typing import Iterator, List, NamedTuple, Tuple, Union
+
+# Force-directed layout for large graphs in the style of Fruchterman and
+# Reingold, as in nx.spring_layout, made fast in three ways:
+#
+# - Repulsion between all pairs of nodes is approximated Barnes-Hut style
+#   on a hierarchy of grids: nodes repel the mass of far away cells as a
+#   whole, and only nodes in neighboring cells of the finest grid exactly.
+# - The graph is coarsened by merging leaves into their neighbor and
+#   matching pairs of nodes, level after level. The coarsest graph is laid
+#   out first, and every finer level starts from the positions of the
+#   coarse nodes its nodes were merged into.
+# - Every level runs at most a fixed number of iterations, and the whole
+#   layout can be given a time budget.
+#
+# Coordinates are in units of the natural edge length. A coarse node of
+# mass m stands for m nodes, so it repels and is repelled m times as much.
+
+# Relative strength of repulsion, as in Hu's multilevel spring embedder
+REPULSION: float = 0.2
+
+# Pull of every node towards the center, so disconnected components don't
+# drift apart
+GRAVITY: float = 0.01
+
+# Coarsening stops at this many nodes, or when a level barely shrinks
+COARSEST_NODES: int = 50
+MIN_COARSENING_RATIO: float = 0.8
+
+# Rounds of matching per coarsening level
+MATCHING_ROUNDS: int = 3
+
+# Nodes per cell of the finest repulsion grid, on average
+GRID_NODES_PER_CELL: float = 2.0
+MAX_GRID_DEPTH: int = 10
+
+# Adaptive step length: grows after this many iterations that lowered the
+# energy, shrinks by this factor after one that didn't
+STEP_PROGRESS_ITERATIONS: int = 5
+STEP_DECAY: float = 0.9
+
+# A level is done once its step length falls below this
+MIN_STEP: float = 0.01
+
+# Far cells of every grid level: the children of the parent cell's 3 x 3
+# neighborhood (offsets -2 to 3 from twice the parent's coordinates)
+CHILD_OFFSETS = arange(-2, 4)  # ndarray
+
+
+class Level(NamedTuple):
+    """
+    One graph of the coarsening hierarchy
+    """
+    adjacency: csr_matrix  # Symmetric, weighted, no self-loops
+    masses: ndarray  # Nodes of the original graph each node stands for
+    parents: Union[ndarray, None]  # Node of the next coarser level, if any
+
+
+def symmetric_adjacency(matrix: spmatrix) -> csr_matrix:
+    """
+    Undirected weighted adjacency without self-loops; edges given in both
+    directions keep the larger weight
+    """
+    matrix = csr_matrix(matrix, dtype=float)
+    matrix = matrix.maximum(matrix.T).tocsr()
+    matrix.setdiag(0)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def best_neighbors(adjacency: csr_matrix,
+                   masses: ndarray,
+                   rows_allowed: ndarray,
+                   cols_allowed: ndarray,
+                   rng: Generator) -> ndarray:
+    """
+    For every node allowed as a row, the neighbor allowed as a column with
+    the heaviest edge relative to their masses, or -1
+
+    Light pairs first keeps the coarse masses even; noise breaks ties.
+    """
+    num_nodes = adjacency.shape[0]  # int
+    rows = repeat(arange(num_nodes), diff(adjacency.indptr))  # ndarray
+    cols = adjacency.indices  # ndarray
+    best = full(num_nodes, -1)  # ndarray
+
+    candidates = flatnonzero(rows_allowed[rows] & cols_allowed[cols])  # ndarray
+    if candidates.shape[0] == 0:
+        return best
+
+    score = adjacency.data[candidates] / (masses[rows[candidates]] * masses[cols[candidates]])
+    score *= 1 + 1e-6 * rng.random(candidates.shape[0])
+    by_row = candidates[lexsort((score, rows[candidates]))]  # ndarray
+    is_last = concatenate([rows[by_row][1:] != rows[by_row][:-1], [True]])  # ndarray
+    best[rows[by_row[is_last]]] = cols[by_row[is_last]]
+    return best
+
+
+def match_nodes(adjacency: csr_matrix,
+                masses: ndarray,
+                eligible: ndarray,
+                rng: Generator) -> ndarray:
+    """
+    Handshake matching: every eligible node proposes to its best eligible
+    neighbor, and nodes that propose to each other are matched. Returns the
+    partner of every node, or -1.
+    """
+    partners = full(adjacency.shape[0], -1)  # ndarray
+
+    for _ in range(MATCHING_ROUNDS):
+        free = eligible & (partners < 0)  # ndarray
+        proposals = best_neighbors(adjacency, masses, free, free, rng)  # ndarray
+        proposers = flatnonzero(proposals >= 0)  # ndarray
+        if proposers.shape[0] == 0:
+            break
+
+        mutual = proposers[proposals[proposals[proposers]] == proposers]  # ndarray
+        partners[mutual] = proposals[mutual]
+
+    return partners
+
+
+def coarsen(adjacency: csr_matrix,
+            masses: ndarray,
+            rng: Generator) -> Tuple[ndarray, int]:
+    """
+    Coarse node of every node, and the number of coarse nodes
+
+    Leaves merge into their neighbor, so hubs with many leaves collapse at
+    once. The other nodes are matched in pairs, and nodes left unmatched
+    join their best neighbor unless another node joins them.
+    """
+    num_nodes = adjacency.shape[0]  # int
+    degrees = diff(adjacency.indptr)  # ndarray
+    representatives = arange(num_nodes)  # ndarray
+
+    # Of two leaves joined to each other, the one with the higher index
+    # joins the other
+    leaves = flatnonzero(degrees == 1)  # ndarray
+    neighbors = adjacency.indices[adjacency.indptr[leaves]]  # ndarray
+    joins = (degrees[neighbors] > 1) | (neighbors < leaves)  # ndarray
+    representatives[leaves[joins]] = neighbors[joins]
+
+    eligible = representatives == arange(num_nodes)  # ndarray
+    eligible[degrees == 0] = False
+    partners = match_nodes(adjacency, masses, eligible, rng)  # ndarray
+    matched = flatnonzero(partners >= 0)  # ndarray
+    representatives[matched] = minimum(matched, partners[matched])
+
+    targets = best_neighbors(adjacency, masses, eligible & (partners < 0), eligible, rng)  # ndarray
+    joiners = flatnonzero(targets >= 0)  # ndarray
+    joined = zeros(num_nodes, dtype=bool)  # ndarray
+    joined[targets[joiners]] = True
+    joiners = joiners[~joined[joiners]]
+    representatives[joiners] = representatives[targets[joiners]]
+
+    # Leaves follow their neighbor if it was matched or joined another node
+    representatives = representatives[representatives]
+    _, labels = unique(representatives, return_inverse=True)
+    return labels, int(labels.max()) + 1 if num_nodes > 0 else 0
+
+
+def coarsen_graph(adjacency: csr_matrix, masses: ndarray,
+                  labels: ndarray, num_coarse: int) -> Tuple[csr_matrix, ndarray]:
+    """
+    Adjacency and masses of the coarse graph: edge weights between coarse
+    nodes add up, and so do masses
+    """
+    assignment = csr_matrix((ones(labels.shape[0]), (arange(labels.shape[0]), labels)),
+                            shape=(labels.shape[0], num_coarse))
+    coarse = (assignment.T @ adjacency @ assignment).tocsr()  # csr_matrix
+    coarse.setdiag(0)
+    coarse.eliminate_zeros()
+    return coarse, bincount(labels, weights=masses, minlength=num_coarse)
+
+
+def build_levels(adjacency: csr_matrix, rng: Generator) -> List[Level]:
+    """
+    Coarsening hierarchy, finest level first
+    """
+    masses = ones(adjacency.shape[0])  # ndarray
+    levels: List[Level] = []
+
+    while True:
+        num_nodes = adjacency.shape[0]  # int
+        if num_nodes <= COARSEST_NODES:
+            break
+
+        labels, num_coarse = coarsen(adjacency, masses, rng)
+        if num_coarse > MIN_COARSENING_RATIO * num_nodes:
+            break
+
+        levels.append(Level(adjacency, masses, labels))
+        adjacency, masses = coarsen_graph(adjacency, masses, labels, num_coarse)
+
+    levels.append(Level(adjacency, masses, None))
+    return levels
+
+
+def grid_depth(num_nodes: int) -> int:
+    """
+    Finest grid level, with 2^depth x 2^depth cells
+    """
+    depth = ceil(log2(max(num_nodes / GRID_NODES_PER_CELL, 1)) / 2)  # float
+    return int(clip(depth, 1, MAX_GRID_DEPTH))
+
+
+def grid_cells(unit: ndarray, size: int) -> Tuple[ndarray, ndarray]:
+    """
+    Cell coordinates of points in [0, 1) x [0, 1) on a size x size grid
+    """
+    cells = clip(floor(unit * size).astype(int64), 0, size - 1)  # ndarray
+    return cells[:, 0], cells[:, 1]
+
+
+def cell_offsets(cells: ndarray, num_cells: int) -> Tuple[ndarray, ndarray]:
+    """
+    Nodes sorted by cell, and CSR offsets of every cell's nodes in that order
+    """
+    order = cells.argsort(kind="stable")  # ndarray
+    return order, searchsorted(cells[order], arange(num_cells + 1))
+
+
+def gather_pairs(starts: ndarray, ends: ndarray) -> Tuple[ndarray, ndarray]:
+    """
+    (i, j) for every i and every j in [starts[i], ends[i])
+    """
+    lengths = maximum(ends - starts, 0)  # ndarray
+    owners = repeat(arange(starts.shape[0]), lengths)  # ndarray
+    offsets = cumsum(lengths) - lengths  # ndarray
+    return owners, arange(lengths.sum()) + repeat(starts - offsets, lengths)
+
+
+def repulsion(positions: ndarray, masses: ndarray) -> ndarray:
+    """
+    Sum over other nodes j of masses[j] * (x_i - x_j) / |x_i - x_j|^2
+
+    Nodes in the same or a neighboring cell of the finest grid are summed
+    exactly. On coarser grids, each node takes the cells that are children
+    of its parent cell's neighbors but not its own cell's neighbors, at
+    their center of mass, so every other node is counted exactly once.
+    """
+    num_nodes = positions.shape[0]  # int
+    force = zeros((num_nodes, 2))  # ndarray
+    if num_nodes < 2:
+        return force
+
+    low = positions.min(axis=0)  # ndarray
+    span = max(float((positions.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)  # float
+    unit = (positions - low) / span  # ndarray
+    depth = grid_depth(num_nodes)  # int
+
+    for level in range(2, depth + 1):
+        size = 2 ** level  # int
+        cell_x, cell_y = grid_cells(unit, size)
+        flat = cell_x * size + cell_y  # ndarray
+        order, offsets = cell_offsets(flat, size * size)
+        cell_mass = bincount(flat, weights=masses, minlength=size * size)  # ndarray
+        center_x = bincount(flat, weights=masses * positions[:, 0], minlength=size * size)
+        center_y = bincount(flat, weights=masses * positions[:, 1], minlength=size * size)
+        center_x[cell_mass > 0] /= cell_mass[cell_mass > 0]
+        center_y[cell_mass > 0] /= cell_mass[cell_mass > 0]
+
+        # (C, 36) far cell candidates of every occupied cell, minus the
+        # cells next to it
+        occupied = flatnonzero(cell_mass > 0)  # ndarray
+        own_x, own_y = occupied // size, occupied % size
+        far_x = 2 * (own_x // 2)[:, None, None] + CHILD_OFFSETS[None, :, None]  # ndarray
+        far_y = 2 * (own_y // 2)[:, None, None] + CHILD_OFFSETS[None, None, :]  # ndarray
+        far_x, far_y = broadcast_arrays(far_x, far_y)
+        far_x = far_x.reshape(occupied.shape[0], -1)
+        far_y = far_y.reshape(occupied.shape[0], -1)
+        valid = (far_x >= 0) & (far_x < size) & (far_y >= 0) & (far_y < size)  # ndarray
+        valid &= (abs(far_x - own_x[:, None]) > 1) | (abs(far_y - own_y[:, None]) > 1)
+        far = where(valid, far_x * size + far_y, 0)  # ndarray
+        valid &= cell_mass[far] > 0
+
+        # Every node of a cell against every far cell of it
+        near_cells = occupied[nonzero(valid)[0]]  # ndarray
+        far_cells = far[valid]  # ndarray
+        owners, slots = gather_pairs(offsets[near_cells], offsets[near_cells + 1])
+        nodes, cells = order[slots], far_cells[owners]
+
+        delta_x = positions[nodes, 0] - center_x[cells]  # ndarray
+        delta_y = positions[nodes, 1] - center_y[cells]  # ndarray
+        scale = cell_mass[cells] / maximum(delta_x ** 2 + delta_y ** 2, 1e-9)  # ndarray
+        force[:, 0] += bincount(nodes, weights=delta_x * scale, minlength=num_nodes)
+        force[:, 1] += bincount(nodes, weights=delta_y * scale, minlength=num_nodes)
+
+    # Exact repulsion between nodes of neighboring cells of the finest grid
+    size = 2 ** depth  # int
+    cell_x, cell_y = grid_cells(unit, size)
+    order, offsets = cell_offsets(cell_x * size + cell_y, size * size)
+
+    sources: List[ndarray] = []
+    targets: List[ndarray] = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            other_x, other_y = cell_x + dx, cell_y + dy
+            valid = (other_x >= 0) & (other_x < size) & (other_y >= 0) & (other_y < size)
+            nodes = flatnonzero(valid)  # ndarray
+            cells = other_x[nodes] * size + other_y[nodes]  # ndarray
+            owners, slots = gather_pairs(offsets[cells], offsets[cells + 1])
+            sources.append(nodes[owners])
+            targets.append(order[slots])
+
+    source = concatenate(sources)  # ndarray
+    target = concatenate(targets)  # ndarray
+    distinct = source != target  # ndarray
+    source, target = source[distinct], target[distinct]
+
+    delta = positions[source] - positions[target]  # ndarray
+    scale = masses[target] / maximum((delta ** 2).sum(axis=1), 1e-9)  # ndarray
+    force[:, 0] += bincount(source, weights=delta[:, 0] * scale, minlength=num_nodes)
+    force[:, 1] += bincount(source, weights=delta[:, 1] * scale, minlength=num_nodes)
+    return force
+
+
+def forces(positions: ndarray, level: Level, edges: Tuple[ndarray, ndarray, ndarray]) -> ndarray:
+    """
+    Displacement of every node: repulsion, spring attraction along edges
+    (weight * distance^2) and gravity, per unit of mass
+    """
+    masses = level.masses  # ndarray
+    num_nodes = positions.shape[0]  # int
+    force = REPULSION * masses[:, None] * repulsion(positions, masses)  # ndarray
+
+    sources, targets, weights = edges
+    delta = positions[sources] - positions[targets]  # ndarray
+    pull = delta * (weights * hypot(delta[:, 0], delta[:, 1]))[:, None]  # ndarray
+    for axis in range(2):
+        force[:, axis] -= bincount(sources, weights=pull[:, axis], minlength=num_nodes)
+        force[:, axis] += bincount(targets, weights=pull[:, axis], minlength=num_nodes)
+
+    center = positions - (masses[:, None] * positions).sum(axis=0) / masses.sum()  # ndarray
+    distance = maximum(hypot(center[:, 0], center[:, 1]), 1e-9)  # ndarray
+    force -= GRAVITY * masses[:, None] * center / distance[:, None]
+
+    return force / masses[:, None]
+
+
+def refine_steps(positions: ndarray,
+                 level: Level,
+                 step: float,
+                 iterations: int,
+                 deadline: float) -> Iterator[ndarray]:
+    """
+    Moves every node by `step` along its force, with Hu's adaptive step
+    length, until the step is small, `iterations` ran or the deadline
+    passed; yields the positions after every iteration
+    """
+    upper = triu(level.adjacency).tocoo()  # coo_matrix
+    edges = (upper.row, upper.col, upper.data)  # Tuple[ndarray, ndarray, ndarray]
+    energy = inf  # float
+    progress = 0  # int
+
+    for _ in range(iterations):
+        if step < MIN_STEP or perf_counter() > deadline:
+            break
+
+        force = forces(positions, level, edges)  # ndarray
+        norms = maximum(hypot(force[:, 0], force[:, 1]), 1e-12)  # ndarray
+        positions = positions + step * force / norms[:, None]
+
+        last_energy, energy = energy, float((norms ** 2).sum())
+        if energy < last_energy:
+            progress += 1
+            if progress >= STEP_PROGRESS_ITERATIONS:
+                progress = 0
+                step /= STEP_DECAY
+        else:
+            progress = 0
+            step *= STEP_DECAY
+
+        yield positions
+
+
+def refine(positions: ndarray,
+           level: Level,
+           step: float,
+           iterations: int,
+           deadline: float) -> ndarray:
+    """
+    Final positions of `refine_steps`
+    """
+    for positions in refine_steps(positions, level, step, iterations, deadline):
+        pass
+    return positions
+
+
+def refinement(matrix: spmatrix,
+               initial: ndarray,
+               iterations: int,
+               max_seconds: Union[float, None] = None) -> Iterator[ndarray]:
+    """
+    Refines `initial` positions on the graph itself, without coarsening,
+    yielding the positions after every iteration until they settle or the
+    budget runs out
+    """
+    deadline = inf if max_seconds is None else perf_counter() + max_seconds  # float
+    adjacency = symmetric_adjacency(matrix)  # csr_matrix
+    level = Level(adjacency, ones(adjacency.shape[0]), None)  # Level
+    return refine_steps(initial.astype(float), level, 1.0, iterations, deadline)
+
+
+def multilevel_layout(matrix: spmatrix,
+                      iterations: int = 100,
+                      max_seconds: Union[float, None] = None,
+                      initial: Union[ndarray, None] = None,
+                      seed: Union[int, None] = None) -> ndarray:
+    """
+    (N, 2) coordinates for the graph with adjacency `matrix`, in units of
+    the natural edge length
+
+    Every level of the coarsening hierarchy runs at most `iterations`
+    iterations. Once `max_seconds` have passed, the remaining levels only
+    place nodes around their coarse node. With `initial` positions, the
+    hierarchy is skipped and only the graph itself is refined, starting with
+    a short step so the picture stays put.
+    """
+    deadline = inf if max_seconds is None else perf_counter() + max_seconds  # float
+    rng = default_rng(seed)
+    adjacency = symmetric_adjacency(matrix)  # csr_matrix
+    num_nodes = adjacency.shape[0]  # int
+    if num_nodes == 0:
+        return zeros((0, 2))
+
+    if initial is not None:
+        level = Level(adjacency, ones(num_nodes), None)  # Level
+        return refine(initial.astype(float), level, 1.0, iterations, deadline)
+
+    levels = build_levels(adjacency, rng)  # List[Level]
+    coarsest = levels[-1]  # Level
+    radius = sqrt(coarsest.masses.sum())  # float
+    positions = (rng.random((coarsest.adjacency.shape[0], 2)) - 0.5) * radius  # ndarray
+    positions = refine(positions, coarsest, radius / 5, iterations, deadline)
+
+    for level in reversed(levels[:-1]):
+        # Nodes start around the coarse node they were merged into, as far
+        # out as the coarse node's mass would spread them
+        parent_masses = bincount(level.parents, weights=level.masses)  # ndarray
+        spread = sqrt(parent_masses[level.parents])  # ndarray
+        jitter = (rng.random((level.parents.shape[0], 2)) - 0.5) * spread[:, None]  # ndarray
+        positions = positions[level.parents] + jitter
+        step = float(sqrt(parent_masses.mean()))  # float
+        positions = refine(positions, level, step, iterations, deadline)
+
+    return positions
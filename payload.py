@@ -0,0 +1,57 @@
+from bokeh.core.json_encoder import PayloadEncoder
+from bokeh.core.serialization import Serializer
+from bokeh.models import CustomJSTransform
+from numpy import asarray, float32, min_scalar_type, ndarray
+from pandas import factorize
+
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+# Columns sent to the browser are NumPy arrays where possible, which Bokeh
+# sends as binary buffers instead of JSON lists. Coordinates are float32,
+# and colors and dash patterns are small integer codes looked up in the
+# browser by `lookup_transform`.
+
+
+def category_codes(values: Sequence[Hashable]) -> Tuple[ndarray, List[Hashable]]:
+    """
+    Codes of `values` in the smallest unsigned dtype, and the distinct
+    values they index, in order of appearance
+    """
+    codes, categories = factorize(asarray(values, dtype=object))
+    dtype = min_scalar_type(max(len(categories) - 1, 0))  # dtype
+    return codes.astype(dtype), list(categories)
+
+
+def lookup_transform(values: List[Any]) -> CustomJSTransform:
+    """
+    Client-side transform from a column of codes to values[code]
+    """
+    return CustomJSTransform(args=dict(values=values),
+                             v_func="return Array.from(xs, (code) => values[code])")
+
+
+def layout_positions(layout: Dict[Hashable, ndarray]) -> ndarray:
+    """
+    (N, 2) float32 coordinates of a layout, in the layout's node order
+    """
+    return asarray(list(layout.values()), dtype=float32).reshape(-1, 2)
+
+
+def segment_data(source_xy: ndarray, target_xy: ndarray) -> Dict[str, ndarray]:
+    """
+    Columns of a segment glyph, one segment per edge
+    """
+    return dict(x0=source_xy[:, 0].astype(float32),
+                y0=source_xy[:, 1].astype(float32),
+                x1=target_xy[:, 0].astype(float32),
+                y1=target_xy[:, 1].astype(float32))
+
+
+def payload_nbytes(data: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Bytes of JSON and of binary buffers Bokeh sends for a data source
+    """
+    serialized = Serializer(deferred=True).serialize(data)
+    buffers = serialized.buffers or []  # List[Buffer]
+    content = PayloadEncoder(buffers=buffers, separators=(",", ":")).encode(serialized.content)
+    return len(content.encode()), sum(len(buffer.to_bytes()) for buffer in buffers)
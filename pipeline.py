@@ -0,0 +1,126 @@
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Tuple, Union
+
+
+class Stage(NamedTuple):
+    """
+    One step of the update pipeline
+
+    `compute` is called with the current values of `inputs` as positional
+    arguments. An input is either the name of a control or of another stage.
+    """
+    name: str
+    compute: Callable[..., Any]
+    inputs: List[str]
+
+
+class Cancelled(Exception):
+    """
+    Raised by Pipeline.get when the refresh it belongs to was superseded
+    """
+
+
+class Pipeline:
+    """
+    Memoized DAG of update stages
+
+    Control values are read once per `refresh`. A stage is recomputed only
+    when one of its controls changed or an upstream stage produced a new
+    value, so stages downstream of unchanged controls are reused as is.
+    """
+
+    def __init__(self,
+                 controls: Dict[str, Callable[[], Hashable]],
+                 stages: List[Stage]) -> None:
+        self.controls = controls  # control name --> function reading it
+        self.stages = {stage.name: stage for stage in stages}  # Dict[str, Stage]
+        self.control_values: Dict[str, Hashable] = {}
+        self.computed: List[str] = []  # Stages recomputed since refresh
+        self.cancelled: Callable[[], bool] = lambda: False
+
+        # stage name --> (input signature, value, version)
+        self._memo: Dict[str, Tuple[Tuple, Any, int]] = {}
+
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.controls and name not in self.stages:
+                    message = f"Stage {stage.name} has unknown input {name}"
+                    raise Exception(message)
+
+    def snapshot(self) -> Dict[str, Hashable]:
+        return {name: read() for name, read in self.controls.items()}
+
+    def refresh(self,
+                control_values: Union[Dict[str, Hashable], None] = None,
+                cancelled: Union[Callable[[], bool], None] = None) -> None:
+        """
+        Snapshots every control so a single update sees consistent values
+
+        Values taken earlier with `snapshot` can be passed instead, so the
+        controls are read on the document's thread and the stages computed
+        on a worker. Once `cancelled` returns True, computing another stage
+        raises Cancelled; stages finished before that stay memoized.
+        """
+        if control_values is None:
+            control_values = self.snapshot()
+
+        self.control_values = control_values
+        self.cancelled = cancelled if cancelled is not None else lambda: False
+        self.computed = []
+
+    def control(self, name: str) -> Hashable:
+        return self.control_values[name]
+
+    def version(self, name: str) -> int:
+        """
+        Number of times stage `name` has been computed, 0 if never
+        """
+        self.get(name)
+        return self._memo[name][2]
+
+    def last_value(self, name: str) -> Any:
+        """
+        Most recent value of stage `name` without recomputing it, or None
+        """
+        memo = self._memo.get(name)
+        return None if memo is None else memo[1]
+
+    def replace(self, name: str, version: int, value: Any) -> bool:
+        """
+        Replaces the value of stage `name` if it is still at `version`, as its
+        next version, so the stages using it are recomputed on the next
+        refresh. Returns whether it was replaced.
+        """
+        memo = self._memo.get(name)
+        if memo is None or memo[2] != version:
+            return False
+
+        self._memo[name] = (memo[0], value, version + 1)
+        return True
+
+    def get(self, name: str) -> Any:
+        stage = self.stages[name]  # Stage
+
+        # Controls contribute their value, stages the version of their value
+        signature = []  # List[Hashable]
+        arguments = []  # List[Any]
+        for input_name in stage.inputs:
+            if input_name in self.controls:
+                signature.append(self.control_values[input_name])
+                arguments.append(self.control_values[input_name])
+            else:
+                arguments.append(self.get(input_name))
+                signature.append(self._memo[input_name][2])
+
+        memo = self._memo.get(name)
+        if memo is not None and memo[0] == tuple(signature):
+            return memo[1]
+
+        if self.cancelled():
+            message = f"Stage {name} skipped, the update was superseded"
+            raise Cancelled(message)
+
+        value = stage.compute(*arguments)
+        version = 1 if memo is None else memo[2] + 1  # int
+        self._memo[name] = (tuple(signature), value, version)
+        self.computed.append(name)
+        return value
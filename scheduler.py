@@ -0,0 +1,195 @@
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from time import perf_counter
+
+from typing import Any, Callable, Deque, Dict, Hashable, List, Union
+
+# Interactome builds run on worker threads so the Bokeh event loop stays
+# responsive. Threads rather than processes, since the stages share the
+# interactome, adjacency index and caches held by this process.
+MAX_CONCURRENT_JOBS: int = 4
+
+# Builds with an estimated cost (filtered edges) of at least HEAVY_JOB_COST
+# are heavy; at most MAX_HEAVY_JOBS of them run at once so a few large
+# graphs can't occupy every worker
+HEAVY_JOB_COST: int = 20_000
+MAX_HEAVY_JOBS: int = 2
+
+
+class Job:
+    """
+    One queued or running computation and the sessions waiting for it
+    """
+
+    def __init__(self, key: Hashable, cost: int,
+                 compute: Callable[[Callable[[], bool]], Any]) -> None:
+        self.key = key  # Hashable
+        self.cost = cost  # int
+        self.compute = compute  # Called with a function telling if it was cancelled
+        self.waiters: List[Future] = []
+        self.cancelled = False  # Set once every waiter has withdrawn
+        self.submitted = perf_counter()  # float
+        self.started: Union[float, None] = None
+
+
+class Scheduler:
+    """
+    Process-wide FIFO queue of builds with a fixed number of workers
+
+    Jobs are identified by a key, normally the normalized control state.
+    Submitting a key that is already queued or running joins that job
+    instead of starting a new one, and its result is fanned out to every
+    waiter. Heavy jobs may be overtaken by light ones while MAX_HEAVY_JOBS
+    heavy jobs are running, otherwise jobs start in submission order.
+    """
+
+    def __init__(self,
+                 max_jobs: int = MAX_CONCURRENT_JOBS,
+                 max_heavy_jobs: int = MAX_HEAVY_JOBS,
+                 heavy_cost: int = HEAVY_JOB_COST) -> None:
+        self.max_jobs = max_jobs  # int
+        self.max_heavy_jobs = max_heavy_jobs  # int
+        self.heavy_cost = heavy_cost  # int
+
+        self._queue: Deque[Job] = deque()
+        self._jobs: Dict[Hashable, Job] = {}  # Queued or running, by key
+        self._running: List[Job] = []
+        self._condition = Condition()
+
+        # Metrics, see `metrics`
+        self.submitted = 0  # int
+        self.coalesced = 0  # int
+        self.started = 0  # int
+        self.completed = 0  # int
+        self.failed = 0  # int
+        self.cancelled = 0  # int
+        self.total_wait = 0.0  # float
+        self.max_wait = 0.0  # float
+        self.last_wait = 0.0  # float
+
+        for i in range(max_jobs):
+            Thread(target=self._work, name=f"update-{i}", daemon=True).start()
+
+    def is_heavy(self, job: Job) -> bool:
+        return job.cost >= self.heavy_cost
+
+    def submit(self,
+               key: Hashable,
+               cost: int,
+               compute: Callable[[Callable[[], bool]], Any]) -> Future:
+        """
+        Queues `compute`, or joins the queued or running job with `key`
+
+        The returned future resolves with the job's result. `compute` is
+        called with a function that returns True once every waiter has
+        withdrawn, so it can stop early.
+        """
+        waiter = Future()  # Future
+
+        with self._condition:
+            self.submitted += 1
+            job = self._jobs.get(key)  # Union[Job, None]
+            if job is None or job.cancelled:
+                job = Job(key, cost, compute)
+                self._jobs[key] = job
+                self._queue.append(job)
+                self._condition.notify()
+            else:
+                self.coalesced += 1
+            job.waiters.append(waiter)
+
+        return waiter
+
+    def withdraw(self, waiter: Future) -> None:
+        """
+        Stops waiting on a job; the job is cancelled if nobody else waits
+        """
+        with self._condition:
+            for job in list(self._queue) + self._running:
+                if waiter in job.waiters:
+                    job.waiters.remove(waiter)
+                    if len(job.waiters) == 0:
+                        job.cancelled = True
+                        self.cancelled += 1
+                        if job in self._queue:
+                            self._queue.remove(job)
+                            self._jobs.pop(job.key, None)
+                    break
+
+        waiter.cancel()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._condition:
+            return {
+                "queue_depth": len(self._queue),
+                "running": len(self._running),
+                "running_heavy": sum(self.is_heavy(job) for job in self._running),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "mean_wait": self.total_wait / self.started if self.started > 0 else 0.0,
+                "max_wait": self.max_wait,
+                "last_wait": self.last_wait,
+            }
+
+    def _next_job(self) -> Union[Job, None]:
+        """
+        First queued job that fits the heavy job limit, or None
+        """
+        num_heavy = sum(self.is_heavy(job) for job in self._running)  # int
+        for job in self._queue:
+            if not self.is_heavy(job) or num_heavy < self.max_heavy_jobs:
+                return job
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+
+                self._queue.remove(job)
+                self._running.append(job)
+                job.started = perf_counter()
+                self.started += 1
+                wait = job.started - job.submitted  # float
+                self.last_wait = wait
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            error: Union[BaseException, None] = None
+            try:
+                result = job.compute(lambda: job.cancelled)
+            except BaseException as e:
+                error = e
+
+            with self._condition:
+                self._running.remove(job)
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                # Cancelled jobs were counted when their last waiter withdrew
+                if not job.cancelled:
+                    if error is None:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                waiters = list(job.waiters)  # List[Future]
+
+                # A heavy job finishing may unblock a queued heavy job
+                self._condition.notify_all()
+
+            for waiter in waiters:
+                if waiter.set_running_or_notify_cancel():
+                    if error is None:
+                        waiter.set_result(result)
+                    else:
+                        waiter.set_exception(error)
+
+
+# Shared by every session served by the process
+scheduler = Scheduler()
@@ -0,0 +1,47 @@
+"""
+Serves the interactive tool like `bokeh serve app.py`, plus the graph
+statistics of every open session as JSON at /statistics.json
+"""
+from argparse import ArgumentParser
+from os.path import dirname, join
+
+from bokeh.command.util import build_single_handler_application
+from bokeh.server.server import Server
+from tornado.web import RequestHandler
+
+from statistics import published_statistics
+
+
+class StatisticsHandler(RequestHandler):
+    """
+    GET /statistics.json returns {session id: statistics} for every session
+    showing statistics, and /statistics.json?session=<id> one session's
+    """
+
+    def get(self) -> None:
+        payload = published_statistics(self.get_argument("session", None))
+        if payload is None:
+            self.send_error(404)
+            return
+
+        self.set_header("Content-Type", "application/json")
+        self.write(payload)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=5006,
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument("--allow-websocket-origin", action="append", default=None,
+                        help="same as for `bokeh serve`, may be given several times")
+    args = parser.parse_args()
+
+    app = build_single_handler_application(join(dirname(__file__), "app.py"))
+    server = Server({"/app": app},
+                    port=args.port,
+                    allow_websocket_origin=args.allow_websocket_origin,
+                    extra_patterns=[("/statistics.json", StatisticsHandler)])
+    server.start()
+    print(f"Serving http://localhost:{args.port}/app "
+          f"and http://localhost:{args.port}/statistics.json")
+    server.io_loop.start()
@@ -1,12 +1,18 @@
-from pandas import DataFrame, read_excel
+from json import dumps
+from numpy import arange, asarray, bincount, flatnonzero, full, lexsort, nan, ndarray, partition
+from pandas import DataFrame, Index, concat, factorize
+from scipy.sparse import csr_matrix
+from scipy.stats import hypergeom
 from data import InteractionTypeValue, Dataset
-from controls import use_normalized_betweenness
-from networkx import betweenness_centrality, Graph
+from networkx import betweenness_centrality
 from pdb import set_trace
 
-from typing import List, Tuple, Union
+from threading import Lock
+from typing import Dict, List, NamedTuple, Sequence, Tuple, Union
 
-from buttons import dataset_checkbox_button
+from clustering import cluster_memberships
+from compact import CompactGraph
+from store import get_betweenness
 
 Clusters = List[Tuple[str]]
 
@@ -21,181 +27,329 @@ def get_number_of_nodes(df: DataFrame) -> int:
     return num_nodes
 
 
-def get_number_of_interactions(df: DataFrame) -> int:
-    # Total number of interactions = number of bait-prey entries in df
-    return df.shape[0]
+class InteractionCounts(NamedTuple):
+    interactions: int
+    direct: int
+    rna_mediated: int
+    rna_shielded: int
+    shared: int  # Found by both IP-MS and SEC-MS
+    ip: int
+    sec: int
 
 
-def get_number_of_direct_interactions(df: DataFrame) -> int:
-    direct = InteractionTypeValue.direct.value  # str
-    direct_df = df[df["IP_interaction_type"] == direct]  # DataFrame
-    direct_interactions = direct_df.shape[0]  # int
-    return direct_interactions
-
-
-def get_number_of_mediated_interactions(df: DataFrame) -> int:
-    mediated = InteractionTypeValue.mediated.value  # str
-    mediated_df = df[df["IP_interaction_type"] == mediated]  # DataFrame
-    mediated_interactions = mediated_df.shape[0]  # int
-    return mediated_interactions
-
+def count_interactions(df: DataFrame) -> InteractionCounts:
+    """
+    Counts interactions by IP interaction type and support in one groupby
+    """
+    counts = df.groupby(["IP_interaction_type", "Interaction_support"],
+                        observed=True, dropna=False).size()  # Series
+    by_type = counts.groupby(level=0, observed=True, dropna=False).sum()  # Series
+    by_support = counts.groupby(level=1, observed=True, dropna=False).sum()  # Series
+
+    return InteractionCounts(
+        interactions=df.shape[0],
+        direct=int(by_type.get(InteractionTypeValue.direct.value, 0)),
+        rna_mediated=int(by_type.get(InteractionTypeValue.mediated.value, 0)),
+        rna_shielded=int(by_type.get(InteractionTypeValue.shielded.value, 0)),
+        shared=int(by_support.get("both", 0)),
+        ip=int(by_support.get("IP", 0)),
+        sec=int(by_support.get("SEC", 0)),
+    )
 
-def get_number_of_shielded_interactions(df: DataFrame) -> int:
-    shielded = InteractionTypeValue.shielded.value  # str
-    shielded_df = df[df["IP_interaction_type"] == shielded]  # DataFrame
-    shielded_interactions = shielded_df.shape[0]  # int
-    return shielded_interactions
 
+def get_top_betweenness_proteins(df: DataFrame,
+                                 graph: CompactGraph,
+                                 num_proteins: int,
+                                 normalized: bool = False) -> List[Tuple[str, float]]:
+    # Pre-calculated betweenness centrality values, shared by all sessions
+    bw_df = get_betweenness(normalized=normalized)
+
+    # Betweenness centrality of the proteins that are nodes in the graph
+    node_mask = bw_df["protein"].isin(graph.nodes)  # Series
+    proteins = bw_df["protein"].values[node_mask.values]  # ndarray
+    bw_values = bw_df["bw_centrality"].values[node_mask.values]  # ndarray
+
+    num_top = min(num_proteins, bw_values.shape[0])  # int
+    if num_top == 0:
+        return []
+
+    # Partition out the top `num_proteins` (plus ties) and only sort those
+    threshold = -partition(-bw_values, num_top - 1)[num_top - 1]  # float
+    top_idx = flatnonzero(bw_values >= threshold)  # ndarray
+
+    # Ties go to the later protein in the table, as in a reversed stable sort
+    top_idx = top_idx[lexsort((-top_idx, -bw_values[top_idx]))][:num_top]
+    sorted_bw_subset: List[Tuple[str, float]] = [
+        (proteins[i], float(bw_values[i])) for i in top_idx
+    ]
+    return sorted_bw_subset
 
-def get_number_of_shared_interactions(df: DataFrame) -> int:
-    col = "Interaction_support"  # str
-    subset_df = df[df[col] == "both"].copy()  # DataFrame
-    return subset_df.shape[0]
 
+def get_num_corum_complexes(df: DataFrame) -> int:
+    unique_complexes = df["CORUM_complex_2022"].dropna().unique()  # ndarray
+    return len(unique_complexes)
 
-def get_number_of_sec_interactions(df: DataFrame) -> int:
-    col = "Interaction_support"  # str
-    subset_df = df[df[col] == "SEC"].copy()  # DataFrame
-    return subset_df.shape[0]
 
+class ComplexEnrichment(NamedTuple):
+    """
+    CORUM complexes of the interactions touching each cluster
 
-def get_number_of_ip_interactions(df: DataFrame) -> int:
-    col = "Interaction_support"  # str
-    subset_df = df[df[col] == "IP"].copy()  # DataFrame
-    return subset_df.shape[0]
+    An interaction touches a cluster if its bait or prey is a member.
+    Matrices are clusters x complexes, with complexes numbered by their
+    position in `complexes`.
+    """
+    complexes: Index
+    counts: csr_matrix  # Interactions of the cluster annotated with the complex
+    p_values: csr_matrix  # Hypergeometric enrichment p-value of every count
+    most_common: ndarray  # Most common complex of each cluster, -1 if none
+    median_betweenness: ndarray  # Of the proteins of the cluster's interactions
 
 
-def get_top_betweenness_proteins(df: DataFrame,
-                                 graph: Graph,
-                                 num_proteins: int) -> List[Tuple[str, float]]:
-    # Load the pre-calculated betweenness centrality values
-    norm_bw_filepath = "SupplementalTable_8.xlsx"  # str
+def cluster_interactions(df: DataFrame, clusters: Clusters) -> DataFrame:
+    """
+    One (row, cluster) pair per interaction touching a cluster, rows being
+    positions in `df`
+    """
+    memberships = cluster_memberships(clusters)  # DataFrame
+    rows = arange(df.shape[0])  # ndarray
+    pairs = [DataFrame({"row": rows, "node": df[col].to_numpy(dtype=object)}).merge(memberships, on="node")
+             for col in ["Bait", "Prey"]]  # List[DataFrame]
+    return concat(pairs)[["row", "cluster"]].drop_duplicates(ignore_index=True)
 
-    if use_normalized_betweenness.active:
-        bw_df = read_excel(norm_bw_filepath, sheet_name=1, index_col=0)  # DataFrame
-    else:
-        bw_df = read_excel(norm_bw_filepath, sheet_name=0, index_col=0)  # DataFrame
 
-    bw_df.reset_index(inplace=True)  # None
-    bw_df.columns = ["protein", "bw_centrality", "is_bait"]  # List[str]
+def cluster_complex_enrichment(df: DataFrame, clusters: Clusters) -> ComplexEnrichment:
+    """
+    Counts complexes per cluster, tests them for enrichment and takes the
+    median normalized betweenness of every cluster, all in one pass
 
-    # Create dictionary of nodes in graph with their betweenness centrality value
-    _bw_dict = bw_df.set_index("protein")["bw_centrality"].to_dict()
-    bw_dict = {key: value for key, value in _bw_dict.items() if key in graph.nodes()}
+    The p-value of a count is the chance of drawing at least that many
+    interactions with the complex when drawing the cluster's annotated
+    interactions from all annotated interactions of `df`.
+    """
+    num_clusters = len(clusters)  # int
+    pairs = cluster_interactions(df, clusters)  # DataFrame
+    codes, complexes = factorize(df["CORUM_complex_2022"])  # ndarray, Index
+
+    # Contingency table of the annotated interactions
+    annotated = pairs[codes[pairs["row"].to_numpy()] >= 0]  # DataFrame
+    annotated = annotated.assign(complex=codes[annotated["row"].to_numpy()])
+    table = annotated.groupby(["cluster", "complex"]).agg(count=("row", "size"),
+                                                          first_row=("row", "min"))
+    table = table.reset_index()  # DataFrame
+    cluster_ids = table["cluster"].to_numpy()  # ndarray
+    complex_ids = table["complex"].to_numpy()  # ndarray
+    counts = table["count"].to_numpy()  # ndarray
+    shape = (num_clusters, len(complexes))  # Tuple[int, int]
+
+    # Hypergeometric upper tail, P(X >= count), for every pair at once
+    complex_totals = bincount(codes[codes >= 0], minlength=len(complexes))  # ndarray
+    cluster_totals = bincount(cluster_ids, weights=counts, minlength=num_clusters)  # ndarray
+    p_values = hypergeom.sf(counts - 1,
+                            int((codes >= 0).sum()),
+                            complex_totals[complex_ids],
+                            cluster_totals[cluster_ids])  # ndarray
+
+    # Most common complex per cluster; ties go to the complex seen first in
+    # the table, as with value_counts
+    ranked = table.sort_values(["cluster", "count", "first_row"],
+                               ascending=[True, False, True])  # DataFrame
+    ranked = ranked.drop_duplicates("cluster")
+    most_common = full(num_clusters, -1)  # ndarray
+    most_common[ranked["cluster"].to_numpy()] = ranked["complex"].to_numpy()
+
+    # Median betweenness of the baits and preys of each cluster's interactions
+    norm_bw_df = get_betweenness(normalized=True)  # DataFrame
+    proteins = concat([DataFrame({"cluster": pairs["cluster"].to_numpy(),
+                                  "protein": df[col].to_numpy(dtype=object)[pairs["row"].to_numpy()]})
+                       for col in ["Bait", "Prey"]]).drop_duplicates()  # DataFrame
+    protein_bw = proteins.merge(norm_bw_df[["protein", "bw_centrality"]], on="protein")
+    medians = protein_bw.groupby("cluster")["bw_centrality"].median()  # Series
+    median_betweenness = full(num_clusters, nan)  # ndarray
+    median_betweenness[medians.index.to_numpy()] = medians.to_numpy()
+
+    return ComplexEnrichment(
+        complexes=complexes,
+        counts=csr_matrix((counts, (cluster_ids, complex_ids)), shape=shape),
+        p_values=csr_matrix((p_values, (cluster_ids, complex_ids)), shape=shape),
+        most_common=most_common,
+        median_betweenness=median_betweenness,
+    )
+
+
+def get_cluster_complexes(df: DataFrame,
+                          clusters: Clusters,
+                          num_complexes: int) -> List[Tuple[str, float, float]]:
+    """
+    Most common CORUM complex of each cluster, ranked by the median
+    normalized betweenness centrality of the cluster's proteins, with the
+    complex's enrichment p-value in that cluster
 
-    # Sort by value and return top `num_proteins`
-    sorted_bw_asc: List[Tuple[str, float]] = sorted(bw_dict.items(), key=lambda x: x[1])
-    sorted_bw_desc: List[Tuple[str, float]] = list(reversed(sorted_bw_asc))
-    sorted_bw_subset = sorted_bw_desc[:num_proteins]
-    return sorted_bw_subset
+    A complex that is the most common one of several clusters is listed
+    once, with the values of the last of them.
+    """
+    enrichment = cluster_complex_enrichment(df, clusters)  # ComplexEnrichment
+    with_complex = flatnonzero(enrichment.most_common >= 0)  # ndarray
+    best = enrichment.most_common[with_complex]  # ndarray
 
+    complex_bw = dict(zip(enrichment.complexes[best],
+                          zip(enrichment.median_betweenness[with_complex].tolist(),
+                              asarray(enrichment.p_values[with_complex, best]).ravel().tolist())))
 
-def get_num_corum_complexes(df: DataFrame) -> int:
-    unique_complexes = df["CORUM_complex_2022"].dropna().unique()  # ndarray
-    return len(unique_complexes)
+    # Sort complexes by betweenness centrality
+    sorted_complex_bw = sorted(complex_bw.items(),
+                               key=lambda x: x[1][0],
+                               reverse=True)
+    return [(name, bw, p_value)
+            for name, (bw, p_value) in sorted_complex_bw[:num_complexes]]
 
 
-def get_graph_statistics(df: DataFrame,
-                         graph: Graph,
-                         num_proteins: int,
-                         num_complexes: int,
-                         clusters: Union[Clusters, None]) -> str:
+class GraphStatistics(NamedTuple):
     """
-    Calculates and formats summary statistics for the interactome graph
+    Summary statistics of a filtered interactome, see `compute_graph_statistics`
     """
-    active_datasets = dataset_checkbox_button.active
+    num_nodes: int
+    interactions: InteractionCounts
+    top_proteins: List[Tuple[str, float]]  # (protein, betweenness centrality)
+    num_complexes: Union[int, None]  # Only computed for clustered graphs
+    top_complexes: Union[List[Tuple[str, float, float]], None]  # (complex, median betweenness, p-value)
+
+
+def compute_graph_statistics(df: DataFrame,
+                             graph: CompactGraph,
+                             num_proteins: int,
+                             num_complexes: int,
+                             clusters: Union[Clusters, None],
+                             normalized: bool = False) -> GraphStatistics:
+    """
+    Computes the summary statistics of the interactome graph
 
-    # Get all of the statistics we care about
-    num_nodes = get_number_of_nodes(df)  # int
-    num_interactions = get_number_of_interactions(df)  # int
+    `normalized` is the state of the normalized betweenness checkbox.
+    """
+    top_proteins = get_top_betweenness_proteins(df=df, graph=graph,
+                                                num_proteins=num_proteins,
+                                                normalized=normalized)
 
-    direct = get_number_of_direct_interactions(df)  # int
-    rna_mediated = get_number_of_mediated_interactions(df)  # int
-    rna_shielded = get_number_of_shielded_interactions(df)  # int
+    if clusters is None:
+        total_complexes = None  # Union[int, None]
+        top_complexes = None  # Union[List[Tuple[str, float, float]], None]
+    else:
+        total_complexes = get_num_corum_complexes(df)
+        top_complexes = get_cluster_complexes(df, clusters, num_complexes)
+
+    return GraphStatistics(num_nodes=get_number_of_nodes(df),
+                           interactions=count_interactions(df),
+                           top_proteins=top_proteins,
+                           num_complexes=total_complexes,
+                           top_complexes=top_complexes)
 
-    shared_interactions = get_number_of_shared_interactions(df)  # int
-    sec_interactions = get_number_of_sec_interactions(df)  # int
-    ip_interactions = get_number_of_ip_interactions(df)  # int
 
-    bw_proteins = get_top_betweenness_proteins(df=df, graph=graph, num_proteins=5)
+def format_graph_statistics(stats: GraphStatistics, datasets: Sequence[int]) -> str:
+    """
+    Formats statistics for the statistics panel
 
-    top_proteins = [protein for protein, _ in bw_proteins]  # List[str]
+    SEC interactions are only listed when the SEC dataset is selected in
+    `datasets`, the active dataset toggles.
+    """
+    counts = stats.interactions  # InteractionCounts
 
     # Format all the statistics into single string to print
-    num_nodes_stats = f"Number of Nodes: {num_nodes}"
-    num_interactions_stats = f"Number of Interactions: {num_interactions}"
+    num_nodes_stats = f"Number of Nodes: {stats.num_nodes}"
+    num_interactions_stats = f"Number of Interactions: {counts.interactions}"
     node_stats = "\n".join([num_nodes_stats, num_interactions_stats])
 
-    direct_stats = f"Direct: {direct}"  # str
-    mediated_stats = f"RNA Mediated: {rna_mediated}"  # str
-    shielded_stats = f"RNA Shieleded: {rna_shielded}"  # str
+    direct_stats = f"Direct: {counts.direct}"  # str
+    mediated_stats = f"RNA Mediated: {counts.rna_mediated}"  # str
+    shielded_stats = f"RNA Shieleded: {counts.rna_shielded}"  # str
     interaction_type_stats = "\n".join([direct_stats,
                                         mediated_stats,
                                         shielded_stats])  # str
 
     # TODO: Ask Lena about shortening this by doing SEC Interactions: N/A
     # Create each string separately to avoid extra indentations
-    if Dataset.SEC.value in active_datasets:
-        shared = f"Shared Interactions: {shared_interactions}"
-        ip = f"IP Interactions: {ip_interactions}"
-        sec = f"SEC Interactions: {sec_interactions}"
+    if Dataset.SEC.value in datasets:
+        shared = f"Shared Interactions: {counts.shared}"
+        ip = f"IP Interactions: {counts.ip}"
+        sec = f"SEC Interactions: {counts.sec}"
         interaction_origin_stats = "\n".join([shared, ip, sec])
     else:
-        shared = f"Shared Interactions: {shared_interactions}"
-        ip = f"IP Interactions: {ip_interactions}"
+        shared = f"Shared Interactions: {counts.shared}"
+        ip = f"IP Interactions: {counts.ip}"
         interaction_origin_stats = "\n".join([shared, ip])
 
     preamble = "Top Five Betweeness Proteins:"
-    protein_list = "\n".join(top_proteins[:5])
+    protein_list = "\n".join(protein for protein, _ in stats.top_proteins[:5])
     top_five_proteins = f"{preamble}\n{protein_list}"
 
-    if clusters is None:
-        stats_list = [node_stats, interaction_type_stats, interaction_origin_stats, top_five_proteins]  # List[str]
-        stats_string = "\n\n".join(stats_list)  # str
-    else:
-        num_complexes = get_num_corum_complexes(df)  # int
-
-        norm_bw_filepath = "SupplementalTable_8.xlsx"  # str
-        norm_bw_df = read_excel(norm_bw_filepath, sheet_name=1, index_col=0)  # DataFrame
-        norm_bw_df.reset_index(inplace=True)  # None
-        norm_bw_df.columns = ["protein", "bw_centrality", "is_bait"]  # List[str]
-
-        # Populate dict with most common CORUM complex per cluster and median
-        # betweenness centrality of proteins in cluster
-        complex_bw = {}  # Dict[str, float]
-        for cluster in clusters:
-            bait_mask = df["Bait"].isin(cluster)  # Series
-            prey_mask = df["Prey"].isin(cluster)  # Series
-            df_subset = df[bait_mask | prey_mask].copy()  # DataFrame
-
-            # Find the most common CORUM complex in the cluster
-            corum_complexes = df_subset["CORUM_complex_2022"]  # Series
-            corum_complexes_no_nan = corum_complexes.dropna()
-            complex_counts = corum_complexes_no_nan.value_counts()  # Series
-
-            # Only add items to complex_bw if there's >= 1 complex
-            if complex_counts.shape[0] != 0:
-                most_common_complex = complex_counts.idxmax()  # str
-
-                # Find the median betweenness centrality of proteins in cluster
-                proteins = df_subset[["Bait", "Prey"]].values.ravel()
-                protein_mask = norm_bw_df["protein"].isin(proteins)  # Series
-                median_bw = norm_bw_df[protein_mask]["bw_centrality"].median()
-                complex_bw[most_common_complex] = median_bw
-
-        # Sort complexes by betweenness centrality
-        sorted_complex_bw = sorted(complex_bw.items(),
-                                   key=lambda x: x[1],
-                                   reverse=True)  # List[Tuple[str, str]]
-        top_complexes = [name for name, _ in sorted_complex_bw]  # List[str]
-        num_complexes_stats = f"Number of Complexes: {num_complexes}"
+    stats_list = [node_stats, interaction_type_stats,
+                  interaction_origin_stats, top_five_proteins]  # List[str]
+
+    if stats.top_complexes is not None:
+        num_complexes_stats = f"Number of Complexes: {stats.num_complexes}"
         preamble = "Top Five Betweenness Complexes:"
-        complex_list = "\n".join(top_complexes[:5])
+        complex_list = "\n".join(name for name, _, _ in stats.top_complexes[:5])
         top_five_complexes = "\n".join([preamble, complex_list])
+        stats_list += [num_complexes_stats, top_five_complexes]
+
+    return "\n\n".join(stats_list)
+
+
+def statistics_json(stats: GraphStatistics) -> str:
+    """
+    Serializes statistics for the statistics download and endpoint
+    """
+    record = stats._asdict()  # Dict[str, Any]
+    record["interactions"] = stats.interactions._asdict()
+    record["top_proteins"] = [{"protein": protein, "betweenness": bw}
+                              for protein, bw in stats.top_proteins]
+    if stats.top_complexes is not None:
+        record["top_complexes"] = [{"complex": name, "median_betweenness": bw,
+                                    "p_value": p_value}
+                                   for name, bw, p_value in stats.top_complexes]
+    return dumps(record, indent=2)
+
+
+def get_graph_statistics(df: DataFrame,
+                         graph: CompactGraph,
+                         num_proteins: int,
+                         num_complexes: int,
+                         clusters: Union[Clusters, None],
+                         datasets: Sequence[int] = (),
+                         normalized: bool = False) -> str:
+    """
+    Calculates and formats summary statistics for the interactome graph
+
+    `datasets` and `normalized` are the dataset toggles and the normalized
+    betweenness checkbox, unset by default.
+    """
+    stats = compute_graph_statistics(df, graph, num_proteins, num_complexes,
+                                     clusters, normalized)  # GraphStatistics
+    return format_graph_statistics(stats, datasets)
+
+
+# Session id --> JSON statistics the session is showing, served by serve.py
+_published: Dict[str, str] = {}
+_published_lock = Lock()
 
-        stats_list = [node_stats, interaction_type_stats,
-                      interaction_origin_stats, top_five_proteins,
-                      num_complexes_stats, top_five_complexes]
-        stats_string = "\n\n".join(stats_list)
 
-    return stats_string
+def publish_statistics(session_id: str, payload: Union[str, None]) -> None:
+    """
+    Sets the statistics served for a session; None removes the session
+    """
+    with _published_lock:
+        if payload is None:
+            _published.pop(session_id, None)
+        else:
+            _published[session_id] = payload
+
+
+def published_statistics(session_id: Union[str, None] = None) -> Union[str, None]:
+    """
+    JSON statistics of one session, or an object of every session's by id
+
+    Returns None if `session_id` isn't showing any statistics.
+    """
+    with _published_lock:
+        if session_id is not None:
+            return _published.get(session_id)
+        return "{" + ", ".join(f"{dumps(key)}: {payload}"
+                               for key, payload in _published.items()) + "}"
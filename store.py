@@ -0,0 +1,173 @@
+from os import stat
+from os.path import dirname, join
+from threading import Lock
+from numpy import array, array_equal, load, savez
+from pandas import DataFrame, read_csv, read_excel
+
+from adjacency import Adjacency, build_adjacency
+from data import ProteinAnnotations, build_protein_annotations, remap_df
+
+from typing import Dict, List, Union
+
+# `bokeh serve app.py` re-executes app.py for every browser session, but
+# imported modules are cached per process, so state kept here is shared by
+# all sessions served by the same process
+INTERACTOME_FILEPATH = join(dirname(__file__), "SupplementalTable_2.csv")
+BETWEENNESS_FILEPATH = join(dirname(__file__), "SupplementalTable_8.xlsx")
+BETWEENNESS_CACHE_FILEPATH = join(dirname(__file__), "SupplementalTable_8.npz")
+
+# Low-cardinality columns are stored as categoricals to keep the table compact
+CATEGORICAL_COLUMNS: List[str] = [
+    "Bait",
+    "Prey",
+    "Interaction_support",
+    "IP_interaction_type",
+    "Bait_lifecycle_step",
+    "prey_lifecycle_stage_main_by_most_common_bait_stage",
+    "Bait_main_location_HPA",
+    "Prey_main_location_HPA",
+    "Bait_Disgenet_disease_.1",
+    "Prey_Disgenet_disease_.1",
+]
+
+_interactome: Union[DataFrame, None] = None
+_adjacency: Union[Adjacency, None] = None
+_annotations: Union[ProteinAnnotations, None] = None
+_interactome_lock = Lock()
+
+# Normalized flag --> betweenness centrality table
+_betweenness: Dict[bool, DataFrame] = {}
+_betweenness_lock = Lock()
+
+
+def load_interactome(filepath: str = INTERACTOME_FILEPATH) -> DataFrame:
+    """
+    Reads Supplemental Table 2 from disk with lifecycle steps already remapped
+    """
+    df = remap_df(read_csv(filepath))  # DataFrame
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def get_interactome() -> DataFrame:
+    """
+    Returns a read-only view of Supplemental Table 2, loaded once per process
+    """
+    global _interactome
+
+    # Double-checked locking so concurrent sessions only parse the CSV once
+    if _interactome is None:
+        with _interactome_lock:
+            if _interactome is None:
+                _interactome = load_interactome()
+
+    # A shallow copy shares the underlying column data with every session,
+    # while column assignments on the view don't leak into the shared table
+    return _interactome.copy(deep=False)
+
+
+def get_adjacency() -> Adjacency:
+    """
+    Returns the protein adjacency index of the shared interactome table
+    """
+    global _adjacency
+
+    if _adjacency is None:
+        df = get_interactome()  # DataFrame
+        with _interactome_lock:
+            if _adjacency is None:
+                _adjacency = build_adjacency(df)
+
+    return _adjacency
+
+
+def get_annotations() -> ProteinAnnotations:
+    """
+    Returns the per-protein lifecycle, location and disease annotation codes
+    """
+    global _annotations
+
+    if _annotations is None:
+        df = get_interactome()  # DataFrame
+        adjacency = get_adjacency()  # Adjacency
+        with _interactome_lock:
+            if _annotations is None:
+                _annotations = build_protein_annotations(df, adjacency.proteins)
+
+    return _annotations
+
+
+def read_betweenness_workbook(filepath: str) -> Dict[bool, DataFrame]:
+    """
+    Parses both betweenness centrality sheets of Supplemental Table 8
+    """
+    tables: Dict[bool, DataFrame] = {}
+
+    # Sheet 0 is unnormalized and sheet 1 is normalized betweenness
+    for normalized, sheet in [(False, 0), (True, 1)]:
+        bw_df = read_excel(filepath, sheet_name=sheet, index_col=0)
+        bw_df.reset_index(inplace=True)
+        bw_df.columns = ["protein", "bw_centrality", "is_bait"]
+        bw_df["protein"] = bw_df["protein"].astype(str)
+        tables[normalized] = bw_df
+
+    return tables
+
+
+def load_betweenness(filepath: str = BETWEENNESS_FILEPATH,
+                     cache_filepath: str = BETWEENNESS_CACHE_FILEPATH) -> Dict[bool, DataFrame]:
+    """
+    Loads the betweenness tables from the binary cache, or from the workbook
+    if the cache is missing or older than the workbook
+    """
+    # The cache is only valid for the workbook with this mtime and size
+    source_stat = stat(filepath)
+    source_key = array([source_stat.st_mtime_ns, source_stat.st_size])
+
+    try:
+        with load(cache_filepath) as cache:
+            if array_equal(cache["source"], source_key):
+                return {
+                    normalized: DataFrame({
+                        "protein": cache[f"protein_{int(normalized)}"].astype(object),
+                        "bw_centrality": cache[f"bw_centrality_{int(normalized)}"],
+                        "is_bait": cache[f"is_bait_{int(normalized)}"],
+                    })
+                    for normalized in [False, True]
+                }
+    except (OSError, KeyError, ValueError):
+        pass
+
+    tables = read_betweenness_workbook(filepath)
+
+    arrays = {"source": source_key}
+    for normalized, bw_df in tables.items():
+        # Fixed-width dtypes so the cache loads without pickle
+        arrays[f"protein_{int(normalized)}"] = bw_df["protein"].to_numpy(dtype=str)
+        arrays[f"bw_centrality_{int(normalized)}"] = bw_df["bw_centrality"].to_numpy(dtype=float)
+        arrays[f"is_bait_{int(normalized)}"] = bw_df["is_bait"].to_numpy(dtype=bool)
+
+    # A read-only checkout still works, it just parses the workbook each time
+    try:
+        with open(cache_filepath, "wb") as f:
+            savez(f, **arrays)
+    except OSError:
+        pass
+
+    return tables
+
+
+def get_betweenness(normalized: bool) -> DataFrame:
+    """
+    Returns the shared (protein, bw_centrality, is_bait) betweenness table
+    """
+    if len(_betweenness) == 0:
+        with _betweenness_lock:
+            if len(_betweenness) == 0:
+                _betweenness.update(load_betweenness())
+
+    return _betweenness[normalized]